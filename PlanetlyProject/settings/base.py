@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'carbon_usage.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,7 +46,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'carbon_usage.middleware.StaticFilesMiddleware',
+    'carbon_usage.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'PlanetlyProject.urls'
@@ -79,6 +81,12 @@ DATABASES = {
     }
 }
 
+# Aliases of read replicas of the default database, see carbon_usage.routers
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['carbon_usage.routers.PrimaryReplicaRouter']
+# Seconds the reads of a user stay on the primary database after they wrote something
+REPLICA_STICKY_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -128,12 +136,82 @@ DEFAULT_MAX_LENGTH = 256
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'carbon_usage.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.OrderingFilter'
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'carbon_usage.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'carbon_usage.pagination.KeysetOrLimitOffsetPagination',
     'PAGE_SIZE': 20
 }
+
+# Usage bulk ingestion limits
+USAGE_BULK_MAX_ROWS = 10000
+USAGE_BULK_BATCH_SIZE = 1000
+# Usages changed or deleted per transaction by the bulk updates and deletes by filter
+USAGE_BULK_EDIT_BATCH_SIZE = 5000
+
+# Usage export
+USAGE_EXPORT_CHUNK_SIZE = 2000
+
+# Recomputation of the stored usage emissions after a factor change, queued as a background job
+USAGE_EMISSIONS_RECOMPUTE_ASYNC = True
+USAGE_EMISSIONS_RECOMPUTE_BATCH_SIZE = 5000
+
+# Most buckets a usage histogram returns before it is downsampled to a coarser interval
+USAGE_HISTOGRAM_MAX_BUCKETS = 1000
+
+# Rows read at a time by the NumPy emissions calculator
+USAGE_CALCULATOR_CHUNK_SIZE = 100000
+
+# Cold storage of old usages in column files, see carbon_usage.archive
+USAGE_ARCHIVE_ROOT = BASE_DIR / 'usage-archive'
+USAGE_ARCHIVE_COMPRESS = True
+USAGE_ARCHIVE_AFTER_MONTHS = 24
+
+# Background jobs run by the run_jobs workers, see carbon_usage.jobs
+JOB_RESULTS_ROOT = BASE_DIR / 'job-results'
+JOB_WORKER_PROCESSES = 2
+JOB_POLL_INTERVAL = 2
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 60
+# Workers bump the updated_at of their running job this often, in seconds
+JOB_HEARTBEAT_INTERVAL = 30
+# Running jobs without a heartbeat for longer are taken for abandoned by a dead worker and queued again
+JOB_TIMEOUT = 300
+JOB_RETENTION_DAYS = 7
+
+# OpenAPI schema documents built by build_openapi_schema, see carbon_usage.schema
+OPENAPI_SCHEMA_ROOT = BASE_DIR / 'openapi-schema'
+# Version of the deployed code, a digest of the sources is used without it
+APP_VERSION = None
+
+# The documentation pages load the prebuilt schema instead of generating it
+SWAGGER_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+
+# JWT authentication without a user query, see carbon_usage.authentication
+AUTH_DENYLIST_CHECK_INTERVAL = 1
+AUTH_USER_STATE_CACHE_SIZE = 10000
+AUTH_USER_STATE_CACHE_TTL = 30
+
+# Bearer token the scrapers of /metrics/ send, the endpoint is disabled without it
+METRICS_TOKEN = None
+# Fraction of the requests whose latency, queries and response size are observed
+REQUEST_METRICS_SAMPLE_RATE = 0.05
+
+# Cache aliases, they must point to a backend shared by every process, see carbon_usage.checks
+USAGE_TYPES_CACHE = 'default'
+CONDITIONAL_GET_CACHE = 'default'
+REPLICA_PIN_CACHE = 'default'
+AUTH_DENYLIST_CACHE = 'default'
+USAGE_TYPES_VERSION_CHECK_INTERVAL = 1
@@ -8,14 +8,60 @@ DEBUG = os.environ['DEBUG_MODE'] in ['True', True]
 
 ALLOWED_HOSTS = os.environ['ALLOWED_HOSTS'].split(' ')
 
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds, or checked out of a pool of at most
+# DATABASE_POOL_MAX_SIZE connections per process when it is set
+DATABASE_POOL_MAX_SIZE = int(os.environ.get('DATABASE_POOL_MAX_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'carbon_usage.backends.postgresql',
         'NAME': os.environ['DATABASE_DEFAULT_NAME'],
         'USER': os.environ['DATABASE_DEFAULT_USER'],
         'PASSWORD': os.environ['DATABASE_DEFAULT_PASSWORD'],
         'HOST': os.environ['DATABASE_DEFAULT_HOST'],
         'PORT': os.environ['DATABASE_DEFAULT_PORT'],
+        'CONN_MAX_AGE': 0 if DATABASE_POOL_MAX_SIZE else int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DATABASE_CONN_HEALTH_CHECKS', 'True') in ['True', True],
+        'POOL': {
+            'MAX_SIZE': DATABASE_POOL_MAX_SIZE,
+            'TIMEOUT': float(os.environ.get('DATABASE_POOL_TIMEOUT', 5)),
+            'MAX_AGE': int(os.environ.get('DATABASE_POOL_MAX_AGE', 1800)),
+        },
+    }
+}
+
+# Space separated read replica hosts, the other connection parameters default to the primary ones
+for index, host in enumerate(os.environ.get('DATABASE_REPLICA_HOSTS', '').split()):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DATABASE_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.environ.get('DATABASE_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('DATABASE_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': host,
+        'PORT': os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', REPLICA_STICKY_SECONDS))
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', REQUEST_METRICS_SAMPLE_RATE))
+
+USAGE_ARCHIVE_ROOT = os.environ.get('USAGE_ARCHIVE_ROOT', USAGE_ARCHIVE_ROOT)
+
+JOB_RESULTS_ROOT = os.environ.get('JOB_RESULTS_ROOT', JOB_RESULTS_ROOT)
+JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES', JOB_WORKER_PROCESSES))
+
+OPENAPI_SCHEMA_ROOT = os.environ.get('OPENAPI_SCHEMA_ROOT', OPENAPI_SCHEMA_ROOT)
+APP_VERSION = os.environ.get('APP_VERSION', APP_VERSION)
+
+# The web and worker processes share the usage types version, the token denylist and the
+# conditional GET and replica pin state through it, see carbon_usage.checks
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_DEFAULT_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': os.environ['CACHE_DEFAULT_LOCATION'],
     }
 }
 
@@ -17,5 +17,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # Stands in for a read replica, tests enable it through DATABASE_REPLICAS
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+    },
 }
+
+# Recompute emissions inside the test transaction instead of queueing a background job
+USAGE_EMISSIONS_RECOMPUTE_ASYNC = False
+
+# Tests and local runs use a single process, the local memory cache is shared by everything in it
+SILENCED_SYSTEM_CHECKS = ['carbon_usage.W001']
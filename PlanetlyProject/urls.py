@@ -15,32 +15,29 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include, re_path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
+    TokenViewBase,
 )
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Documentation",
-      default_version='v1',
-      description="Planetly documentation",
-      terms_of_service="https://www.google.com/policies/terms/",
-      license=openapi.License(name="BSD License"),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
+from carbon_usage.authentication import (
+    DenylistTokenRefreshSerializer,
+    TokenRevokeSerializer,
+    UserStateTokenObtainPairSerializer,
 )
+from carbon_usage.views import schema_document, schema_ui
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('carbon_usage.urls')),
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    re_path(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('api/token/', TokenObtainPairView.as_view(serializer_class=UserStateTokenObtainPairSerializer),
+         name='token_obtain_pair'),
+    path('api/token/refresh/', TokenRefreshView.as_view(serializer_class=DenylistTokenRefreshSerializer),
+         name='token_refresh'),
+    path('api/token/revoke/', TokenViewBase.as_view(serializer_class=TokenRevokeSerializer), name='token_revoke'),
+    # The schema is built once per code version, see carbon_usage.schema
+    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_document, name='schema-json'),
+    re_path(r'^swagger/$', schema_ui, {'ui': 'swagger'}, name='schema-swagger-ui'),
+    re_path(r'^redoc/$', schema_ui, {'ui': 'redoc'}, name='schema-redoc'),
 ]
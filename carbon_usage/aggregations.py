@@ -0,0 +1,163 @@
+from datetime import datetime, time, timedelta, timezone
+
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from carbon_usage.models import DailyUsageRollup
+
+TIME_BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+GROUP_BY_CHOICES = ('user', 'usage_type', *TIME_BUCKETS)
+
+# UsageFilter fields the daily rollup table can answer, any other filter needs the raw usages
+ROLLUP_FILTERS = ('user', 'usage_type', 'min_usage_at', 'max_usage_at')
+
+
+def emissions_expression():
+    """
+    Returns the expression of the CO2 emissions of a single Usage row, stored along with it.
+    """
+    return F('emissions')
+
+
+def day_start(day):
+    """
+    Returns the aware UTC datetime at which the given day starts.
+    """
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def aggregate_emissions(queryset, group_by=None):
+    """
+    Computes count, amount and emission totals of the given Usage queryset inside the database,
+    optionally grouped by user, usage type or a time bucket of usage_at.
+    """
+    queryset = queryset.order_by().annotate(row_emissions=emissions_expression())
+    aggregates = {
+        'count': Count('id'),
+        'amount': Sum('amount'),
+        'emissions': Sum('row_emissions'),
+        'min_emissions': Min('row_emissions'),
+        'max_emissions': Max('row_emissions'),
+    }
+
+    if group_by is None:
+        return [queryset.aggregate(**aggregates)]
+
+    if group_by in TIME_BUCKETS:
+        queryset = queryset.annotate(**{group_by: TIME_BUCKETS[group_by]('usage_at')})
+
+    return list(queryset.values(group_by).annotate(**aggregates).order_by(group_by))
+
+
+def aggregate_rollup_emissions(rollups, group_by=None):
+    """
+    Computes the same totals as aggregate_emissions from rows of the daily rollup table.
+    """
+    aggregates = {
+        'count': Sum('count'),
+        'amount': Sum('amount'),
+        'emissions': Sum('emissions'),
+        'min_emissions': Min('min_emissions'),
+        'max_emissions': Max('max_emissions'),
+    }
+
+    if group_by is None:
+        totals = rollups.aggregate(**aggregates)
+        return [{**totals, 'count': totals['count'] or 0}]
+
+    # The day column already is the day bucket
+    if group_by in TIME_BUCKETS and group_by != 'day':
+        rollups = rollups.annotate(**{group_by: TIME_BUCKETS[group_by]('day')})
+
+    rows = list(rollups.values(group_by).annotate(**aggregates).order_by(group_by))
+    if group_by in TIME_BUCKETS:
+        for row in rows:
+            row[group_by] = day_start(row[group_by])
+    return rows
+
+
+def merge_emissions(results, group_by=None):
+    """
+    Merges several lists of aggregated totals into one, combining the rows of the same group.
+    """
+    merged = {}
+    for row in (row for rows in results for row in rows):
+        key = row[group_by] if group_by else None
+        if key not in merged:
+            merged[key] = dict(row)
+            continue
+
+        current = merged[key]
+        current['count'] += row['count']
+        for field, combine in (
+            ('amount', lambda a, b: a + b),
+            ('emissions', lambda a, b: a + b),
+            ('min_emissions', min),
+            ('max_emissions', max),
+        ):
+            if row[field] is not None:
+                current[field] = row[field] if current[field] is None else combine(current[field], row[field])
+
+    return [merged[key] for key in sorted(merged, key=lambda key: (key is None, key))]
+
+
+def aggregate_filtered_emissions(queryset, filters, group_by=None):
+    """
+    Aggregates the emissions of a Usage queryset filtered by the given UsageFilter cleaned data,
+    adding those of the archived usages when the usage_at range reaches archived months.
+    """
+    # The archive module imports the calculator, which imports this one
+    from carbon_usage.archive import aggregate_archived_emissions
+
+    return merge_emissions(
+        [aggregate_table_emissions(queryset, filters, group_by), *aggregate_archived_emissions(filters, group_by)],
+        group_by
+    )
+
+
+def aggregate_table_emissions(queryset, filters, group_by=None):
+    """
+    Aggregates the emissions of the filtered usages still in the usage table.
+
+    Whole UTC days inside the usage_at range are read from the daily rollup table and only the
+    partial days at the edges of the range from the raw usages. Filters the rollup table cannot
+    answer fall back to aggregating the raw usages.
+    """
+    if any(value is not None for name, value in filters.items() if name not in ROLLUP_FILTERS):
+        return aggregate_emissions(queryset, group_by=group_by)
+
+    start, end = filters.get('min_usage_at'), filters.get('max_usage_at')
+    # First day fully inside the range and the start of the first day past it, the range is inclusive
+    first_day = None
+    if start is not None:
+        start = start.astimezone(timezone.utc)
+        first_day = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+    end_day = None
+    if end is not None:
+        end_day = (end.astimezone(timezone.utc) + timedelta(microseconds=1)).date()
+
+    if first_day is not None and end_day is not None and first_day >= end_day:
+        return aggregate_emissions(queryset, group_by=group_by)
+
+    rollups = DailyUsageRollup.objects.all()
+    for name in ('user', 'usage_type'):
+        if filters.get(name) is not None:
+            rollups = rollups.filter(**{name: filters[name]})
+
+    results = []
+    if first_day is not None:
+        rollups = rollups.filter(day__gte=first_day)
+        if start < day_start(first_day):
+            results.append(aggregate_emissions(queryset.filter(usage_at__lt=day_start(first_day)), group_by))
+    if end_day is not None:
+        rollups = rollups.filter(day__lt=end_day)
+        if end >= day_start(end_day):
+            results.append(aggregate_emissions(queryset.filter(usage_at__gte=day_start(end_day)), group_by))
+    results.append(aggregate_rollup_emissions(rollups, group_by))
+
+    return merge_emissions(results, group_by)
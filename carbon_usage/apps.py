@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CarbonUsageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'carbon_usage'
+
+    def ready(self):
+        from carbon_usage import checks, signals  # noqa: F401
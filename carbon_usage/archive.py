@@ -0,0 +1,372 @@
+"""
+Cold storage of old usages in column-oriented files on local disk.
+
+The usages of every user and UTC month of usage_at are moved to one archive under
+``USAGE_ARCHIVE_ROOT``, for example ``month=2021-03/user=42/usages-<uuid>.npz``, holding one
+NumPy array per column. Archives are compressed unless ``USAGE_ARCHIVE_COMPRESS`` is off, they
+are then directories of ``.npy`` files that are memory-mapped when read.
+
+A UsageArchive row catalogs every archive. A usage is either in the usage table or in the
+cataloged archive of its month, so readers combine both. Archives are written under a new name
+and only swapped in the catalog by the transaction deleting the archived rows, a failure at any
+point leaves at most an orphan file.
+
+Archives are never rewritten by factor corrections: the emissions of archived usages are computed
+from their amount with the factor periods in effect when they are read or restored.
+"""
+import shutil
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import TruncMonth
+
+from carbon_usage.cache import usage_types_cache
+from carbon_usage.calculator import EPOCH, SECONDS_PER_DAY, group_keys, reduce_chunk
+from carbon_usage.conditional import mark_deleted
+from carbon_usage.exports import format_datetime
+from carbon_usage.models import Usage, UsageArchive
+from carbon_usage.partitions import add_months, month_start
+from carbon_usage.rollups import refresh_rollups
+
+# Archived columns and their types, datetimes are microseconds since the Unix epoch
+COLUMNS = {
+    'id': np.int64,
+    'usage_type': np.int64,
+    'usage_at': np.int64,
+    'amount': np.float64,
+    'emissions': np.float64,
+    'created_at': np.int64,
+}
+# Usage fields read into the columns, in the same order
+FIELDS = ('id', 'usage_type_id', 'usage_at', 'amount', 'emissions', 'created_at')
+DATETIME_COLUMNS = ('usage_at', 'created_at')
+MICROSECONDS = 10 ** 6
+
+# The UsageFilter bounds answered from the archived columns
+RANGE_FILTERS = {
+    'min_amount': ('amount', np.greater_equal),
+    'max_amount': ('amount', np.less_equal),
+    'min_usage_at': ('usage_at', np.greater_equal),
+    'max_usage_at': ('usage_at', np.less_equal),
+    'min_emissions': ('emissions', np.greater_equal),
+    'max_emissions': ('emissions', np.less_equal),
+}
+
+# Archived usages are summed per usage type over UTC slots of this length, in which the wall clock
+# hour of every timezone is constant since their offsets are multiples of a quarter of an hour
+SLOT_MICROSECONDS = 15 * 60 * MICROSECONDS
+
+DELETE_CHUNK_SIZE = 500
+
+
+def archive_root():
+    return Path(settings.USAGE_ARCHIVE_ROOT)
+
+
+def to_microseconds(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_microseconds(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def write_columns(user_id, month, columns):
+    """
+    Writes the columns of a new archive and returns its path relative to the archive root.
+    """
+    path = Path(f'month={month:%Y-%m}', f'user={user_id}', f'usages-{uuid.uuid4().hex}')
+    target = archive_root() / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if settings.USAGE_ARCHIVE_COMPRESS:
+        path = path.with_suffix('.npz')
+        np.savez_compressed(archive_root() / path, **columns)
+    else:
+        target.mkdir()
+        for name, values in columns.items():
+            np.save(target / f'{name}.npy', values)
+    return str(path)
+
+
+def read_columns(path, names=tuple(COLUMNS)):
+    """
+    Reads the given columns of an archive, memory-mapping those of uncompressed archives.
+    """
+    source = archive_root() / path
+    if source.is_dir():
+        return {name: np.load(source / f'{name}.npy', mmap_mode='r') for name in names}
+    # Members of an npz file are only decompressed when accessed
+    with np.load(source) as archive:
+        return {name: archive[name] for name in names}
+
+
+def remove_columns(path):
+    source = archive_root() / path
+    if source.is_dir():
+        shutil.rmtree(source, ignore_errors=True)
+    else:
+        source.unlink(missing_ok=True)
+
+
+def current_emissions(columns):
+    """
+    Returns the emissions of archived columns under the current factor periods of their usage
+    types, as UsageTypesCache.factor_at resolves them. Usages of unknown usage types keep their
+    archived emissions.
+    """
+    emissions = np.array(columns['emissions'], dtype=np.float64)
+    usage_types = usage_types_cache.all()
+    periods = usage_types_cache.factor_periods()
+    for usage_type_id in np.unique(columns['usage_type']).tolist():
+        if usage_type_id not in usage_types:
+            continue
+        mask = columns['usage_type'] == usage_type_id
+        starts, factors = periods.get(usage_type_id) or ([], [usage_types[usage_type_id].factor])
+        index = np.searchsorted([to_microseconds(start) for start in starts], columns['usage_at'][mask], side='right')
+        emissions[mask] = columns['amount'][mask] * np.asarray(factors)[np.maximum(index - 1, 0)]
+    return emissions
+
+
+def usage_columns(usages):
+    """
+    Returns the archived columns of the given Usage rows, read by id order.
+    """
+    rows = list(usages.order_by('id').values_list(*FIELDS))
+    columns = {}
+    for index, (name, dtype) in enumerate(COLUMNS.items()):
+        values = [row[index] for row in rows]
+        if name in DATETIME_COLUMNS:
+            values = [to_microseconds(value) for value in values]
+        columns[name] = np.array(values, dtype=dtype)
+    return columns
+
+
+def _delete_usages(usage_ids):
+    for start in range(0, len(usage_ids), DELETE_CHUNK_SIZE):
+        Usage.objects.filter(pk__in=usage_ids[start:start + DELETE_CHUNK_SIZE]).delete()
+
+
+def archived_amounts(keys):
+    """
+    Returns the amount of the archived usages of the given (user id, usage type id, UTC usage_at)
+    natural keys, by natural key, only reading the archives of their users and months.
+    """
+    months = {(user_id, month_start(usage_at).date()) for user_id, _, usage_at in keys}
+    if not months:
+        return {}
+    archives = UsageArchive.objects.filter(
+        user__in={user_id for user_id, _ in months}, month__in={month for _, month in months}
+    )
+    amounts = {}
+    for archive in archives.iterator():
+        if (archive.user_id, archive.month) not in months:
+            continue
+        columns = read_columns(archive.path, ('usage_type', 'usage_at', 'amount'))
+        for usage_type_id, usage_at, amount in zip(*(values.tolist() for values in columns.values())):
+            key = (archive.user_id, usage_type_id, from_microseconds(usage_at))
+            if key in keys:
+                amounts[key] = amount
+    return amounts
+
+
+def archived_usage(user_id, usage_type_id, usage_at):
+    """
+    Returns the archived usage of the given natural key as an unsaved Usage instance with its
+    current emissions, or None.
+    """
+    archive = UsageArchive.objects.filter(user_id=user_id, month=month_start(usage_at).date()).first()
+    if archive is None:
+        return None
+    columns = read_columns(archive.path)
+    matches = np.flatnonzero(
+        (columns['usage_type'] == usage_type_id) & (columns['usage_at'] == to_microseconds(usage_at))
+    )
+    if not len(matches):
+        return None
+    index = matches[0]
+    return Usage(
+        id=int(columns['id'][index]), user_id=user_id, usage_type_id=usage_type_id, usage_at=usage_at,
+        amount=float(columns['amount'][index]), emissions=float(current_emissions(columns)[index]),
+        created_at=from_microseconds(columns['created_at'][index]),
+    )
+
+
+def archive_month(user_id, month):
+    """
+    Moves the usages of a user over the UTC month starting at ``month`` to its archive, adding them
+    to the usages archived before. Returns the number of usages moved.
+    """
+    with transaction.atomic():
+        usages = Usage.objects.filter(user_id=user_id, usage_at__gte=month, usage_at__lt=add_months(month, 1))
+        columns = usage_columns(usages.select_for_update())
+        if not len(columns['id']):
+            return 0
+
+        previous = UsageArchive.objects.select_for_update().filter(user_id=user_id, month=month.date()).first()
+        archived = columns
+        if previous is not None:
+            existing = read_columns(previous.path)
+            archived = {name: np.concatenate([existing[name], columns[name]]) for name in COLUMNS}
+        path = write_columns(user_id, month, archived)
+        if previous is not None:
+            transaction.on_commit(lambda: remove_columns(previous.path))
+
+        UsageArchive.objects.update_or_create(
+            user_id=user_id, month=month.date(), defaults={'path': path, 'count': len(archived['id'])}
+        )
+        _delete_usages(columns['id'].tolist())
+        days = np.floor_divide(columns['usage_at'], MICROSECONDS * SECONDS_PER_DAY)
+        refresh_rollups(
+            (user_id, usage_type_id, (EPOCH + timedelta(days=day)).date())
+            for usage_type_id, day in set(zip(columns['usage_type'].tolist(), days.tolist()))
+        )
+    return len(columns['id'])
+
+
+def archive_usages(before):
+    """
+    Moves every usage of the UTC months before the month of ``before`` to the archives and returns
+    the number of usages moved.
+    """
+    before = month_start(before)
+    groups = (
+        Usage.objects.filter(usage_at__lt=before)
+        .annotate(month=TruncMonth('usage_at', tzinfo=EPOCH.tzinfo))
+        .values_list('user_id', 'month').distinct().order_by('month', 'user_id')
+    )
+    moved = sum(archive_month(user_id, month_start(month)) for user_id, month in list(groups))
+    if moved:
+        mark_deleted(Usage)
+    return moved
+
+
+def _archives(start=None, end=None, users=None):
+    """
+    Returns the catalog rows of the archives overlapping the inclusive ``[start, end]`` usage_at range.
+    """
+    archives = UsageArchive.objects.order_by('month', 'user_id')
+    if start is not None:
+        archives = archives.filter(month__gte=month_start(start).date())
+    if end is not None:
+        archives = archives.filter(month__lte=month_start(end).date())
+    if users is not None:
+        archives = archives.filter(user__in=users)
+    return archives
+
+
+def restore_usages(start=None, end=None, users=None):
+    """
+    Moves the archived usages of the months overlapping the inclusive ``[start, end]`` range back to
+    the usage table, optionally only those of some users.
+
+    An archived usage whose natural key was stored again in the usage table meanwhile is dropped,
+    the stored usage is the latest one. Returns the number of usages restored and dropped.
+    """
+    restored = dropped = 0
+    for archive in list(_archives(start, end, users)):
+        columns = read_columns(archive.path)
+        columns['emissions'] = current_emissions(columns)
+        usages = [
+            Usage(
+                id=usage_id, user_id=archive.user_id, usage_type_id=usage_type_id,
+                usage_at=from_microseconds(usage_at), amount=amount, emissions=emissions,
+            )
+            for usage_id, usage_type_id, usage_at, amount, emissions in zip(
+                *(columns[name].tolist() for name in ('id', 'usage_type', 'usage_at', 'amount', 'emissions'))
+            )
+        ]
+        created_ats = dict(zip(columns['id'].tolist(), columns['created_at'].tolist()))
+        with transaction.atomic():
+            month = month_start(archive.month)
+            stored = set(Usage.objects.filter(
+                user=archive.user_id, usage_at__gte=month, usage_at__lt=add_months(month, 1)
+            ).values_list('usage_type_id', 'usage_at'))
+            restorable = [usage for usage in usages if (usage.usage_type_id, usage.usage_at) not in stored]
+            Usage.objects.bulk_create(restorable, batch_size=settings.USAGE_BULK_BATCH_SIZE)
+            # bulk_create sets created_at to now, bulk_update writes the archived values back as they are
+            for usage in restorable:
+                usage.created_at = from_microseconds(created_ats[usage.pk])
+            Usage.objects.bulk_update(restorable, ['created_at'], batch_size=settings.USAGE_BULK_BATCH_SIZE)
+            refresh_rollups(
+                (archive.user_id, usage.usage_type_id, usage.usage_at.date()) for usage in restorable
+            )
+            archive.delete()
+            transaction.on_commit(lambda path=archive.path: remove_columns(path))
+        restored += len(restorable)
+        dropped += len(usages) - len(restorable)
+    return restored, dropped
+
+
+def archived_chunks(filters):
+    """
+    Yields ``(user id, columns)`` of the archived usages matching the given UsageFilter cleaned data,
+    only reading the archives of the months the usage_at range reaches, with their current emissions.
+    """
+    user = filters.get('user')
+    archives = _archives(filters.get('min_usage_at'), filters.get('max_usage_at'), users=[user] if user else None)
+    usage_type = filters.get('usage_type')
+    bounds = {
+        name: to_microseconds(value) if name.endswith('usage_at') else value
+        for name, value in filters.items() if name in RANGE_FILTERS and value is not None
+    }
+
+    for archive in archives.iterator():
+        columns = read_columns(archive.path)
+        columns['emissions'] = current_emissions(columns)
+        mask = np.ones(len(columns['id']), dtype=bool)
+        if usage_type is not None:
+            mask &= columns['usage_type'] == usage_type.pk
+        for name, bound in bounds.items():
+            column, compare = RANGE_FILTERS[name]
+            mask &= compare(columns[column], bound)
+        if mask.any():
+            yield archive.user_id, {name: np.asarray(values[mask]) for name, values in columns.items()}
+
+
+def aggregate_archived_emissions(filters, group_by=None):
+    """
+    Computes the totals of aggregations.aggregate_emissions over the archived usages matching the
+    given UsageFilter cleaned data, one result list per archive.
+    """
+    for user_id, columns in archived_chunks(filters):
+        chunk = np.column_stack([
+            np.full(len(columns['id']), user_id, dtype=np.float64),
+            columns['usage_type'].astype(np.float64),
+            columns['amount'],
+            np.floor_divide(columns['usage_at'], MICROSECONDS).astype(np.float64),
+        ])
+        keys = group_keys(chunk, group_by) if group_by is not None else np.zeros(len(chunk), dtype=np.int64)
+        yield reduce_chunk(keys, columns['amount'], columns['emissions'], group_by)
+
+
+def archived_export_rows(filters):
+    """
+    Yields the exported columns of the archived usages matching the given UsageFilter cleaned data,
+    by month, user and id.
+    """
+    for user_id, columns in archived_chunks(filters):
+        for usage_id, usage_type_id, usage_at, amount, emissions in zip(
+            *(columns[name].tolist() for name in ('id', 'usage_type', 'usage_at', 'amount', 'emissions'))
+        ):
+            yield usage_id, user_id, usage_type_id, format_datetime(from_microseconds(usage_at)), amount, emissions
+
+
+def archived_slots(filters):
+    """
+    Yields ``(usage type id, slot start, count, amount, emissions)`` of the archived usages matching
+    the given UsageFilter cleaned data, summed per usage type and SLOT_MICROSECONDS of usage_at.
+    """
+    for _, columns in archived_chunks(filters):
+        keys = np.column_stack([columns['usage_type'], np.floor_divide(columns['usage_at'], SLOT_MICROSECONDS)])
+        keys, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        amounts = np.bincount(inverse, weights=columns['amount'], minlength=len(keys))
+        emissions = np.bincount(inverse, weights=columns['emissions'], minlength=len(keys))
+        for (usage_type_id, slot), count, amount, emission in zip(
+            keys.tolist(), counts.tolist(), amounts.tolist(), emissions.tolist()
+        ):
+            yield usage_type_id, from_microseconds(slot * SLOT_MICROSECONDS), count, amount, emission
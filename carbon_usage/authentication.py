@@ -0,0 +1,234 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTTokenUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from carbon_usage.models import RevokedToken
+
+DENYLIST_VERSION_CACHE_KEY = 'carbon_usage:auth:denylist:version'
+
+IS_ACTIVE_CLAIM = 'is_active'
+
+
+class TokenDenylist:
+    """
+    An in-process copy of the unexpired RevokedToken rows.
+
+    Like UsageTypesCache, the copy is tagged with a version stamp stored in the ``AUTH_DENYLIST_CACHE``
+    Django cache. Revoking a token replaces the stamp once the transaction commits, so every process
+    sharing that cache backend reloads the rows at most ``AUTH_DENYLIST_CHECK_INTERVAL`` seconds later.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revoked = None
+        self._version = None
+        self._checked_at = 0
+
+    @property
+    def _cache(self):
+        return caches[settings.AUTH_DENYLIST_CACHE]
+
+    def _current_version(self):
+        version = self._cache.get(DENYLIST_VERSION_CACHE_KEY)
+        if version is None:
+            self._cache.add(DENYLIST_VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+            version = self._cache.get(DENYLIST_VERSION_CACHE_KEY)
+        return version
+
+    def revoked(self):
+        """
+        Returns the revoked jtis and, by user id, the time up to which every token of the user is revoked.
+        """
+        now = time.monotonic()
+        revoked = self._revoked
+        if revoked is not None and now - self._checked_at < settings.AUTH_DENYLIST_CHECK_INTERVAL:
+            return revoked
+
+        with self._lock:
+            version = self._current_version()
+            if self._revoked is None or version != self._version:
+                jtis, users = set(), {}
+                rows = RevokedToken.objects.using(DEFAULT_DB_ALIAS).filter(expires_at__gt=timezone.now())
+                for jti, user_id, created_at in rows.values_list('jti', 'user_id', 'created_at'):
+                    if jti is not None:
+                        jtis.add(jti)
+                    else:
+                        users[user_id] = max(created_at, users.get(user_id, created_at))
+                self._revoked = (jtis, users)
+                self._version = version
+            self._checked_at = now
+            return self._revoked
+
+    def is_revoked(self, token):
+        jtis, users = self.revoked()
+        if token.get(api_settings.JTI_CLAIM) in jtis:
+            return True
+        revoked_until = users.get(token.get(api_settings.USER_ID_CLAIM))
+        # iat is truncated to the second, a token issued during the second of the revocation is revoked too
+        return revoked_until is not None and 'iat' in token and datetime_from_epoch(token['iat']) <= revoked_until
+
+    def invalidate(self):
+        """
+        Drops the revocations cached by this process and replaces the shared version stamp.
+        """
+        with self._lock:
+            self._revoked = None
+            self._cache.set(DENYLIST_VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+
+token_denylist = TokenDenylist()
+
+
+class UserStateCache:
+    """
+    A size-bounded in-process cache of whether users are active, each entry kept for
+    ``AUTH_USER_STATE_CACHE_TTL`` seconds. It is only consulted for tokens without an is_active claim.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = OrderedDict()
+
+    def is_active(self, user_id):
+        """
+        Returns whether the user is active, or None when it does not exist.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is not None and now - state[1] < settings.AUTH_USER_STATE_CACHE_TTL:
+                self._states.move_to_end(user_id)
+                return state[0]
+
+        is_active = (
+            get_user_model().objects.using(DEFAULT_DB_ALIAS)
+            .filter(**{api_settings.USER_ID_FIELD: user_id})
+            .values_list('is_active', flat=True)
+            .first()
+        )
+        with self._lock:
+            self._states[user_id] = (is_active, now)
+            self._states.move_to_end(user_id)
+            while len(self._states) > settings.AUTH_USER_STATE_CACHE_SIZE:
+                self._states.popitem(last=False)
+        return is_active
+
+    def discard(self, user_id):
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+
+user_states = UserStateCache()
+
+
+def revoke_token(token):
+    """
+    Revokes one validated token until it expires.
+    """
+    RevokedToken.objects.update_or_create(
+        jti=token[api_settings.JTI_CLAIM],
+        defaults={'user_id': token.get(api_settings.USER_ID_CLAIM), 'expires_at': datetime_from_epoch(token['exp'])},
+    )
+    transaction.on_commit(token_denylist.invalidate)
+
+
+def revoke_user(user_id):
+    """
+    Revokes every token issued to a user so far. The row expires with the longest lived of them.
+    """
+    RevokedToken.objects.create(user_id=user_id, expires_at=timezone.now() + api_settings.REFRESH_TOKEN_LIFETIME)
+    user_states.discard(user_id)
+    transaction.on_commit(token_denylist.invalidate)
+
+
+class UserStateRefreshToken(RefreshToken):
+    """
+    A refresh token carrying the is_active state of its user, which is copied to its access tokens.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[IS_ACTIVE_CLAIM] = user.is_active
+        return token
+
+
+class UserStateTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return UserStateRefreshToken.for_user(user)
+
+
+def is_revoked_in_database(token):
+    """
+    Tells whether a token is revoked from the RevokedToken rows of the primary database, without
+    the in-process denylist a revocation in another process may not have reached yet.
+    """
+    revoked = Q(jti=token.get(api_settings.JTI_CLAIM))
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    if user_id is not None and 'iat' in token:
+        revoked |= Q(jti__isnull=True, user_id=user_id, created_at__gte=datetime_from_epoch(token['iat']))
+    return RevokedToken.objects.using(DEFAULT_DB_ALIAS).filter(revoked, expires_at__gt=timezone.now()).exists()
+
+
+class DenylistTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        # Refreshes are rare and long lived, so they are checked against the database itself
+        if is_revoked_in_database(RefreshToken(attrs['refresh'])):
+            raise InvalidToken(_('Token has been revoked'))
+        return super().validate(attrs)
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField(write_only=True)
+
+    def validate(self, attrs):
+        revoke_token(RefreshToken(attrs['refresh']))
+        return {}
+
+
+class CachedJWTAuthentication(JWTTokenUserAuthentication):
+    """
+    Authenticates JWTs without loading their user from the database.
+
+    The user id and is_active claims are trusted as signed, tokens issued before the is_active claim
+    existed fall back to the local UserStateCache. Deactivating or deleting a user revokes its tokens
+    through the TokenDenylist, so a user can be shut out before its tokens expire.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+
+        if token_denylist.is_revoked(validated_token):
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+
+        is_active = validated_token.get(IS_ACTIVE_CLAIM)
+        if is_active is None:
+            is_active = user_states.is_active(user.pk)
+            if is_active is None:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return user
@@ -0,0 +1,101 @@
+import threading
+from functools import partial
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from carbon_usage.pool import CONNECTIONS_OPENED, ConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _is_usable(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except base.Database.Error:
+        return False
+    return True
+
+
+def _reset(connection):
+    if connection.closed:
+        raise base.Database.InterfaceError('connection already closed')
+    if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The PostgreSQL backend with two additions driven by extra DATABASES keys:
+
+    - ``CONN_HEALTH_CHECKS``: a persistent connection is checked with ``SELECT 1`` before the
+      first query of every request and replaced when it stopped working, like Django 4.1 does.
+    - ``POOL``: with a ``MAX_SIZE``, connections are checked out of a process wide pool instead
+      of being opened, and returned to it when Django closes them. ``TIMEOUT`` bounds the wait
+      for a free connection and ``MAX_AGE`` recycles old ones. ``CONN_MAX_AGE`` should be 0.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_enabled = self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+        self.health_check_done = False
+
+    @property
+    def pooled(self):
+        return bool((self.settings_dict.get('POOL') or {}).get('MAX_SIZE'))
+
+    def get_pool(self, conn_params):
+        if not self.pooled:
+            return None
+
+        options = self.settings_dict['POOL']
+        with _pools_lock:
+            if self.alias not in _pools:
+                _pools[self.alias] = ConnectionPool(
+                    self.alias,
+                    partial(super().get_new_connection, conn_params),
+                    max_size=options['MAX_SIZE'],
+                    timeout=options.get('TIMEOUT', 5),
+                    max_age=options.get('MAX_AGE'),
+                    is_usable=_is_usable if self.health_check_enabled else None,
+                    reset=_reset,
+                )
+            return _pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        if pool is None:
+            CONNECTIONS_OPENED.inc(alias=self.alias)
+            return super().get_new_connection(conn_params)
+
+        connection = pool.checkout()
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if not self.pooled or self.connection is None:
+            return super()._close()
+        _pools[self.alias].checkin(self.connection, discard=self.errors_occurred and not _is_usable(self.connection))
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Called when a request starts and ends, the next query checks the connection again
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and self.health_check_enabled
+            and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
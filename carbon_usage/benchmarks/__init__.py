@@ -0,0 +1,157 @@
+"""
+In-process benchmarks of the carbon_usage API.
+
+Scenarios are registered with the ``scenario`` decorator and run through the ``benchmark``
+management command. Every scenario runs inside a transaction that is rolled back afterwards,
+so the seeded data never reaches the configured database.
+"""
+import math
+import random
+import time
+from importlib import import_module
+from itertools import cycle
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from carbon_usage.authentication import UserStateRefreshToken
+from carbon_usage.models import Usage, UsageTypes
+from carbon_usage.tests import mommy_recipes as carbon_usage_recipes
+
+SCENARIOS = {}
+
+SCENARIO_MODULES = (
+    'carbon_usage.benchmarks.api',
+    'carbon_usage.benchmarks.calculator',
+    'carbon_usage.benchmarks.ingestion',
+    'carbon_usage.benchmarks.listing',
+)
+
+# Name suffixes of the measurements compared against a baseline
+LOWER_IS_BETTER = ('_seconds', '_ms')
+HIGHER_IS_BETTER = ('_per_second', 'speedup')
+
+
+class Rollback(Exception):
+    pass
+
+
+def scenario(name):
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+def load_scenarios():
+    for module in SCENARIO_MODULES:
+        import_module(module)
+    return SCENARIOS
+
+
+def timed(func, *args, **kwargs):
+    """
+    Calls ``func`` and returns its result together with the elapsed wall clock seconds.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of already sorted values.
+    """
+    if not values:
+        return None
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def benchmark_client(username='benchmark'):
+    """
+    Returns an APIClient authenticated with a JWT of a freshly created user.
+    """
+    user = User.objects.create_user(username=username, password=username)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {UserStateRefreshToken.for_user(user).access_token}')
+    return client, user
+
+
+def seed_usages(rows, users=10, usage_types=None, batch_size=5000):
+    """
+    Inserts ``rows`` usages spread over ``users`` new users and random usage types, one row per minute,
+    from the seed recipes. With ``usage_types``, usage types are added until there are that many.
+    """
+    owners = carbon_usage_recipes.seed_user.make(_quantity=users)
+    missing_types = (usage_types or 0) - UsageTypes.objects.count()
+    if missing_types > 0:
+        carbon_usage_recipes.seed_usage_types.make(_quantity=missing_types)
+    factors = dict(UsageTypes.objects.values_list('pk', 'factor'))
+    usage_type_ids = list(factors)
+    owner_cycle = cycle(owners)
+    for offset in range(0, rows, batch_size):
+        size = min(batch_size, rows - offset)
+        usages = carbon_usage_recipes.seed_usage.prepare(
+            _quantity=size,
+            user=owner_cycle,
+            usage_type_id=iter(random.choices(usage_type_ids, k=size)),
+        )
+        # bulk_create skips Usage.save, which computes the emissions
+        for usage in usages:
+            usage.emissions = usage.amount * factors[usage.usage_type_id]
+        Usage.objects.bulk_create(usages)
+    return owners
+
+
+def run_scenario(name, **options):
+    """
+    Runs the named scenario inside a rolled back transaction and returns its measurements.
+    """
+    func = load_scenarios()[name]
+    results = {}
+    test_settings = override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+    try:
+        with test_settings, transaction.atomic():
+            results = func(**options)
+            raise Rollback
+    except Rollback:
+        pass
+    return results
+
+
+def flatten(results, prefix=''):
+    """
+    Yields the ``(dotted path, value)`` pairs of the numbers of nested scenario results.
+    """
+    items = results.items() if isinstance(results, dict) else enumerate(results)
+    for key, value in items:
+        path = f'{prefix}.{key}' if prefix else str(key)
+        if isinstance(value, (dict, list)):
+            yield from flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare_results(baseline, results, threshold):
+    """
+    Returns ``(path, baseline value, value, slowdown)`` of the timings and rates of ``results`` that
+    are more than ``threshold`` (0.2 for 20%) slower than in ``baseline``.
+    """
+    previous = dict(flatten(baseline))
+    regressions = []
+    for path, value in flatten(results):
+        name, before = path.rsplit('.', 1)[-1], previous.get(path)
+        if not before or not value:
+            continue
+        if name.endswith(LOWER_IS_BETTER):
+            slowdown = value / before - 1
+        elif name.endswith(HIGHER_IS_BETTER):
+            slowdown = before / value - 1
+        else:
+            continue
+        if slowdown > threshold:
+            regressions.append((path, before, value, slowdown))
+    return regressions
@@ -0,0 +1,73 @@
+import random
+
+from django.urls import reverse
+
+from carbon_usage.benchmarks import benchmark_client, percentile, scenario, seed_usages, timed
+from carbon_usage.benchmarks.ingestion import usage_payloads
+from carbon_usage.models import Usage
+
+# Requests of every path sent before the measured ones, to warm up the caches
+WARMUP = 2
+
+
+def latencies(send, repeat):
+    """
+    Sends ``repeat`` requests built by ``send(index)`` after the warmup ones and returns their latency
+    percentiles.
+    """
+    seconds = []
+    for index in range(WARMUP + repeat):
+        response, elapsed = timed(send, index)
+        assert response.status_code < 400, (response.status_code, response.content[:200])
+        seconds.append(elapsed)
+    seconds = sorted(seconds[WARMUP:])
+    return {
+        'requests': repeat,
+        'mean_ms': round(sum(seconds) / repeat * 1000, 3),
+        **{f'p{int(fraction * 100)}_ms': round(percentile(seconds, fraction) * 1000, 3) for fraction in (0.5, 0.9, 0.99)},
+    }
+
+
+@scenario('api')
+def api(rows=10000, users=50, usage_types=20, repeat=20, bulk_rows=100, **options):
+    """
+    Measures the latency of the main API paths against ``rows`` usages of ``users`` users and
+    ``usage_types`` usage types: lists, filtered and ordered lists, details, creations, bulk
+    creations and token issuance.
+    """
+    client, user = benchmark_client()
+    owners = seed_usages(rows, users=users, usage_types=usage_types)
+    usage_ids = list(Usage.objects.values_list('pk', flat=True)[:1000])
+    list_url = reverse('carbon-usage:usage-list')
+    middle = Usage.objects.order_by('usage_at').values_list('usage_at', flat=True)[rows // 2]
+    sent = WARMUP + repeat
+    payloads = usage_payloads(user, sent * (bulk_rows + 1))
+    password = 'benchmark-password'
+    user.set_password(password)
+    user.save(update_fields=['password'])
+
+    paths = {
+        'list': lambda index: client.get(list_url),
+        'filtered_list': lambda index: client.get(
+            list_url, {'user': owners[index % len(owners)].pk, 'min_usage_at': middle.isoformat(), 'min_amount': 10}
+        ),
+        'ordered_list': lambda index: client.get(list_url, {'ordering': '-amount'}),
+        'detail': lambda index: client.get(reverse('carbon-usage:usage-detail', kwargs={'pk': random.choice(usage_ids)})),
+        'usage_types_list': lambda index: client.get(reverse('carbon-usage:usage_types-list')),
+        'create': lambda index: client.post(list_url, data=payloads[index], format='json'),
+        'bulk_create': lambda index: client.post(
+            reverse('carbon-usage:usage-bulk'),
+            data=payloads[sent + index * bulk_rows:sent + (index + 1) * bulk_rows],
+            format='json',
+        ),
+        'token': lambda index: client.post(
+            reverse('token_obtain_pair'), data={'username': user.username, 'password': password}, format='json'
+        ),
+    }
+    return {
+        'rows': rows,
+        'users': users,
+        'usage_types': usage_types,
+        'bulk_rows': bulk_rows,
+        'paths': {name: latencies(send, repeat) for name, send in paths.items()},
+    }
@@ -0,0 +1,33 @@
+from collections import defaultdict
+
+from carbon_usage.benchmarks import scenario, seed_usages, timed
+from carbon_usage.cache import usage_types_cache
+from carbon_usage.calculator import calculate_emissions
+from carbon_usage.models import Usage
+
+
+@scenario('what_if')
+def what_if(rows=200000, **options):
+    """
+    Compares monthly emission totals under an overridden factor computed by looping over the
+    usages in Python against the chunked NumPy calculator.
+    """
+    seed_usages(rows)
+    factors = {100: 1.2}
+
+    def python_loop():
+        totals = defaultdict(float)
+        for usage_type_id, usage_at, amount in Usage.objects.values_list('usage_type_id', 'usage_at', 'amount').iterator():
+            factor = factors.get(usage_type_id, usage_types_cache.factor_at(usage_type_id, usage_at))
+            totals[usage_at.year, usage_at.month] += amount * factor
+        return totals
+
+    python_totals, python_seconds = timed(python_loop)
+    numpy_totals, numpy_seconds = timed(calculate_emissions, Usage.objects.all(), group_by='month', factors=factors)
+    assert len(python_totals) == len(numpy_totals)
+    return {
+        'rows': rows,
+        'python_seconds': python_seconds,
+        'numpy_seconds': numpy_seconds,
+        'speedup': python_seconds / numpy_seconds,
+    }
@@ -0,0 +1,51 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from django.urls import reverse
+
+from carbon_usage.benchmarks import benchmark_client, scenario, timed
+from carbon_usage.models import UsageTypes
+
+
+def usage_payloads(user, rows, first=0):
+    """
+    Returns ``rows`` usage payloads of one per minute, starting ``first`` minutes after 2021.
+    """
+    usage_type_ids = list(UsageTypes.objects.values_list('pk', flat=True))
+    start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            'user': user.id,
+            'usage_type': random.choice(usage_type_ids),
+            'usage_at': (start + timedelta(minutes=first + index)).isoformat(),
+            'amount': round(random.uniform(0, 100), 3),
+        }
+        for index in range(rows)
+    ]
+
+
+@scenario('bulk_create')
+def bulk_create(rows=2000, **options):
+    """
+    Compares one POST per usage against the bulk endpoint for the same number of rows.
+    """
+    client, user = benchmark_client()
+    # Both paths get new usages, the same ones would be duplicates the second time
+    single_payloads, bulk_payloads = usage_payloads(user, rows), usage_payloads(user, rows, first=rows)
+
+    def create_one_by_one():
+        url = reverse('carbon-usage:usage-list')
+        for payload in single_payloads:
+            client.post(url, data=payload, format='json')
+
+    def create_in_bulk():
+        client.post(reverse('carbon-usage:usage-bulk'), data=bulk_payloads, format='json')
+
+    _, single_seconds = timed(create_one_by_one)
+    _, bulk_seconds = timed(create_in_bulk)
+    return {
+        'rows': rows,
+        'single': {'seconds': single_seconds, 'rows_per_second': rows / single_seconds},
+        'bulk': {'seconds': bulk_seconds, 'rows_per_second': rows / bulk_seconds},
+        'speedup': single_seconds / bulk_seconds,
+    }
@@ -0,0 +1,70 @@
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from carbon_usage.benchmarks import benchmark_client, scenario, seed_usages, timed
+from carbon_usage.exports import format_datetime
+from carbon_usage.models import Usage
+from carbon_usage.pagination import KeysetOrLimitOffsetPagination
+from carbon_usage.renderers import FastJSONRenderer
+from carbon_usage.serializers import UsageSerializer
+
+
+def keyset_cursor(ordering, row):
+    paginator = KeysetOrLimitOffsetPagination()
+    paginator.ordering = ordering
+    return paginator.encode_cursor(paginator.get_position(row))
+
+
+@scenario('pagination')
+def pagination(rows=20000, limit=100, repeat=5, **options):
+    """
+    Measures the latency of a /usage page at growing depths with limit/offset and keyset pagination.
+    """
+    client, _ = benchmark_client()
+    seed_usages(rows)
+    url = reverse('carbon-usage:usage-list')
+    ordered = Usage.objects.order_by('usage_at', 'id')
+
+    results = []
+    for depth in sorted({0, rows // 4, rows // 2, 3 * rows // 4, rows - limit}):
+        cursor = keyset_cursor(['usage_at', 'id'], ordered[depth - 1]) if depth else None
+        offset_url = f'{url}?ordering=usage_at&limit={limit}&offset={depth}'
+        keyset_url = f'{url}?ordering=usage_at&limit={limit}&' + (f'cursor={cursor}' if cursor else 'pagination=keyset')
+        results.append({
+            'depth': depth,
+            'offset_seconds': min(timed(client.get, offset_url)[1] for _ in range(repeat)),
+            'keyset_seconds': min(timed(client.get, keyset_url)[1] for _ in range(repeat)),
+        })
+    return {'rows': rows, 'limit': limit, 'pages': results}
+
+
+@scenario('list_rendering')
+def list_rendering(rows=1000, repeat=5, **options):
+    """
+    Compares fetching, serializing and rendering a /usage page through UsageSerializer and the
+    REST framework renderer against the .values() rows and the fast JSON renderer.
+    """
+    client, _ = benchmark_client()
+    seed_usages(rows)
+    queryset = Usage.objects.order_by('id')[:rows]
+    fields = UsageSerializer.Meta.fields
+
+    def serializer_path():
+        return JSONRenderer().render(UsageSerializer(list(queryset), many=True).data)
+
+    def values_path():
+        page = [{**row, 'usage_at': format_datetime(row['usage_at'])} for row in queryset.values(*fields)]
+        return FastJSONRenderer().render(page)
+
+    assert serializer_path() == values_path()
+    serializer_seconds = min(timed(serializer_path)[1] for _ in range(repeat))
+    values_seconds = min(timed(values_path)[1] for _ in range(repeat))
+    url = f"{reverse('carbon-usage:usage-list')}?limit={rows}"
+    request_seconds = min(timed(client.get, url)[1] for _ in range(repeat))
+    return {
+        'rows': rows,
+        'serializer_seconds': serializer_seconds,
+        'values_seconds': values_seconds,
+        'speedup': serializer_seconds / values_seconds,
+        'request_seconds': request_seconds,
+    }
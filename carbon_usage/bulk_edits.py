@@ -0,0 +1,170 @@
+"""
+Set-based corrections of the usages matched by UsageFilter parameters, for example those of a
+mis-calibrated meter: scaling their amounts, moving them to another usage type, or deleting them.
+
+Usages are changed with UPDATE and DELETE statements over primary key ranges of
+USAGE_BULK_EDIT_BATCH_SIZE rows, each in its own short transaction that also refreshes the daily
+rollups of the range, so the table is never locked as a whole. Stored emissions are changed along
+with the amounts and usage types. Archived usages are left unchanged, restore them first.
+"""
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Sum, When
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from carbon_usage.conditional import mark_deleted
+from carbon_usage.emissions import factor_periods
+from carbon_usage.models import Usage
+from carbon_usage.rollups import refresh_rollups
+
+CONFLICT_MESSAGE = 'Moving these usages would store two usages of the same user and usage type at the same usage_at.'
+
+
+class BulkEditConflict(APIException):
+    """
+    A usage type change that would break the natural key of the usages.
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_code = 'usage_conflict'
+
+    def __init__(self, conflicts, updated=0):
+        super().__init__(CONFLICT_MESSAGE)
+        self.detail = {'detail': self.detail, 'conflicts': conflicts, 'updated': updated}
+
+
+def usage_totals(queryset):
+    totals = queryset.order_by().aggregate(count=Count('id'), amount=Sum('amount'), emissions=Sum('emissions'))
+    return {'count': totals['count'], 'amount': totals['amount'] or 0.0, 'emissions': totals['emissions'] or 0.0}
+
+
+def period_condition(valid_from, valid_to):
+    condition = Q()
+    if valid_from is not None:
+        condition &= Q(usage_at__gte=valid_from)
+    if valid_to is not None:
+        condition &= Q(usage_at__lt=valid_to)
+    return condition
+
+
+def updated_emissions(scale, usage_type):
+    """
+    Returns the expression of the emissions of a usage after its amount is scaled by ``scale`` and,
+    when given, it is moved to ``usage_type``. Within an UPDATE, F('amount') is the previous amount.
+    """
+    if usage_type is None:
+        return F('emissions') * scale
+    periods = factor_periods(usage_type)
+    if len(periods) == 1:
+        return F('amount') * (scale * periods[0][2])
+    # The periods of a usage type cover every usage_at
+    return Case(*(
+        When(period_condition(valid_from, valid_to), then=F('amount') * (scale * factor))
+        for valid_from, valid_to, factor in periods
+    ), default=F('emissions') * scale)
+
+
+def reassignment_conflicts(queryset, usage_type_id):
+    """
+    Returns the number of the given usages whose natural key is taken once moved to a usage type,
+    by a usage already of that type or by another of the moved usages.
+    """
+    moved = queryset.exclude(usage_type=usage_type_id).order_by()
+    taken = Usage.objects.filter(user=OuterRef('user'), usage_type=usage_type_id, usage_at=OuterRef('usage_at'))
+    colliding = (
+        moved.values('user', 'usage_at').annotate(count=Count('id')).filter(count__gt=1).values_list('count', flat=True)
+    )
+    return moved.filter(Exists(taken)).count() + sum(count - 1 for count in colliding)
+
+
+def _ranges(queryset, batch_size):
+    """
+    Yields every range of ``batch_size`` usages of the queryset, locked, inside its own transaction,
+    as the range queryset and the rollup keys of its usages. Primary keys grow, so usages inserted
+    meanwhile never fall into a range.
+    """
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk').select_for_update()
+                .values_list('pk', 'user_id', 'usage_type_id', 'usage_at')[:batch_size]
+            )
+            if not rows:
+                return
+            yield queryset.filter(pk__gt=last_pk, pk__lte=rows[-1][0]), {
+                (user_id, usage_type_id, usage_at.astimezone(dt_timezone.utc).date())
+                for _, user_id, usage_type_id, usage_at in rows
+            }
+        last_pk = rows[-1][0]
+
+
+def bulk_update_usages(queryset, scale_amount=None, usage_type=None, dry_run=False, batch_size=None):
+    """
+    Multiplies the amount of the given usages by ``scale_amount`` and/or moves them to ``usage_type``,
+    recomputing their emissions and rollups.
+
+    Returns the number of changed usages, or that would be changed with ``dry_run``, the natural
+    key conflicts of a usage type change and the totals of the usages before and after. Raises
+    BulkEditConflict, changing nothing, when there are conflicts.
+    """
+    batch_size = batch_size or settings.USAGE_BULK_EDIT_BATCH_SIZE
+    scale = 1.0 if scale_amount is None else scale_amount
+    conflicts = reassignment_conflicts(queryset, usage_type.pk) if usage_type is not None else 0
+
+    before = usage_totals(queryset)
+    after = {'amount': before['amount'] * scale, 'emissions': before['emissions'] * scale}
+    if usage_type is not None:
+        after['emissions'] = sum(
+            (queryset.filter(period_condition(valid_from, valid_to)).aggregate(amount=Sum('amount'))['amount'] or 0.0)
+            * scale * factor
+            for valid_from, valid_to, factor in factor_periods(usage_type)
+        )
+    result = {
+        'count': before.pop('count'), 'conflicts': conflicts, 'before': before, 'after': after, 'dry_run': dry_run,
+    }
+    if dry_run:
+        return result
+    if conflicts:
+        raise BulkEditConflict(conflicts)
+
+    changes = {'amount': F('amount') * scale, 'emissions': updated_emissions(scale, usage_type)}
+    if usage_type is not None:
+        changes['usage_type'] = usage_type
+    updated = 0
+    try:
+        for usages, keys in _ranges(queryset, batch_size):
+            # UPDATE statements leave the auto_now field to the caller, it keeps the list ETags fresh
+            updated += usages.update(**changes, updated_at=timezone.now())
+            if usage_type is not None:
+                keys |= {(user_id, usage_type.pk, day) for user_id, _, day in keys}
+            refresh_rollups(keys)
+    except IntegrityError:
+        # A usage stored meanwhile took a natural key, the earlier ranges stay changed
+        raise BulkEditConflict(None, updated)
+    result['count'] = updated
+    return result
+
+
+def bulk_delete_usages(queryset, dry_run=False, batch_size=None):
+    """
+    Deletes the given usages along with their share of the rollups.
+
+    Returns the number of deleted usages, or that would be deleted with ``dry_run``, and their totals.
+    """
+    batch_size = batch_size or settings.USAGE_BULK_EDIT_BATCH_SIZE
+    result = {**usage_totals(queryset), 'dry_run': dry_run}
+    if dry_run:
+        return result
+
+    deleted = 0
+    for usages, keys in _ranges(queryset, batch_size):
+        deleted += usages.delete()[0]
+        refresh_rollups(keys)
+    if deleted:
+        mark_deleted(Usage)
+    result['count'] = deleted
+    return result
@@ -0,0 +1,124 @@
+import bisect
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.timezone import is_naive, make_aware
+
+from carbon_usage.models import UsageTypeFactor, UsageTypes
+
+VERSION_CACHE_KEY = 'carbon_usage:usage_types:version'
+
+MIN_DATETIME = datetime.min.replace(tzinfo=timezone.utc)
+
+
+class UsageTypesCache:
+    """
+    An in-process cache of every UsageTypes row.
+
+    The cached rows are tagged with a version stamp stored in the ``USAGE_TYPES_CACHE`` Django
+    cache. Invalidating the cache replaces the stamp, so every process sharing that cache backend
+    reloads the table at most ``USAGE_TYPES_VERSION_CHECK_INTERVAL`` seconds later. With the default
+    local memory backend the invalidation only reaches the current process.
+
+    The factor periods of UsageTypeFactor are loaded along with them the first time they are
+    needed, into sorted interval starts per usage type searched with bisect.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage_types = None
+        self._factor_periods = None
+        self._version = None
+        self._checked_at = 0
+
+    @property
+    def _cache(self):
+        return caches[settings.USAGE_TYPES_CACHE]
+
+    def _current_version(self):
+        version = self._cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            self._cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+            version = self._cache.get(VERSION_CACHE_KEY)
+        return version
+
+    def all(self):
+        """
+        Returns every UsageTypes instance by primary key. The instances are shared, do not modify them.
+        """
+        now = time.monotonic()
+        usage_types = self._usage_types
+        if usage_types is not None and now - self._checked_at < settings.USAGE_TYPES_VERSION_CHECK_INTERVAL:
+            return usage_types
+
+        with self._lock:
+            version = self._current_version()
+            if self._usage_types is None or version != self._version:
+                # Read from the primary, a lagging replica would keep stale rows cached until the next change
+                usage_types = UsageTypes.objects.using(DEFAULT_DB_ALIAS)
+                self._usage_types = {usage_type.pk: usage_type for usage_type in usage_types}
+                self._factor_periods = None
+                self._version = version
+            self._checked_at = now
+            return self._usage_types
+
+    def get(self, pk):
+        return self.all().get(pk)
+
+    def factors(self):
+        return {pk: usage_type.factor for pk, usage_type in self.all().items()}
+
+    def factor_periods(self):
+        """
+        Returns the ``(starts, factors)`` lists of the factor periods of every usage type by primary
+        key, sorted by start. An open start is stored as ``datetime.min``.
+        """
+        self.all()
+        periods = self._factor_periods
+        if periods is not None:
+            return periods
+
+        with self._lock:
+            if self._factor_periods is None:
+                periods = {}
+                rows = UsageTypeFactor.objects.using(DEFAULT_DB_ALIAS).values_list('usage_type_id', 'valid_from', 'factor')
+                for usage_type_id, valid_from, factor in sorted(rows, key=lambda row: (row[0], row[1] or MIN_DATETIME)):
+                    starts, factors = periods.setdefault(usage_type_id, ([], []))
+                    starts.append(valid_from or MIN_DATETIME)
+                    factors.append(factor)
+                self._factor_periods = periods
+            return self._factor_periods
+
+    def factor_at(self, pk, when):
+        """
+        Returns the factor of a usage type effective at the given datetime, its current factor when
+        it has no factor periods, or None for an unknown usage type.
+        """
+        usage_type = self.get(pk)
+        if usage_type is None:
+            return None
+
+        periods = self.factor_periods().get(pk)
+        if not periods:
+            return usage_type.factor
+        starts, factors = periods
+        if is_naive(when):
+            when = make_aware(when)
+        return factors[max(bisect.bisect_right(starts, when) - 1, 0)]
+
+    def invalidate(self):
+        """
+        Drops the cached rows of this process and replaces the shared version stamp.
+        """
+        with self._lock:
+            self._usage_types = None
+            self._factor_periods = None
+            self._cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+
+usage_types_cache = UsageTypesCache()
@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Func, IntegerField
+
+from carbon_usage.aggregations import merge_emissions
+from carbon_usage.models import UsageTypeFactor, UsageTypes
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+SECONDS_PER_DAY = 86400
+
+# Period keys pack a dense usage type index above a shifted epoch second, so one sorted array
+# holds the factor periods of every usage type
+TIME_BITS = 40
+TIME_OFFSET = 1 << (TIME_BITS - 1)
+TIME_MASK = (1 << TIME_BITS) - 1
+
+# Columns of the chunks read by usage_chunks, the SELECT lists model fields before annotations
+USER, USAGE_TYPE, AMOUNT, SECONDS = range(4)
+
+
+class EpochSeconds(Func):
+    """
+    Whole seconds since the Unix epoch of a datetime column.
+    """
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # The percent sign is escaped once for the template and once for the query parameters
+        template = "CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)"
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='FLOOR(EXTRACT(EPOCH FROM %(expressions)s))::bigint', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def _time_keys(seconds):
+    return np.clip(np.asarray(seconds, dtype=np.int64) + TIME_OFFSET, 0, TIME_MASK)
+
+
+class FactorTable:
+    """
+    The factor periods of every usage type as sorted NumPy arrays, optionally overriding the
+    factors of some usage types for every period.
+    """
+
+    def __init__(self, overrides=None):
+        current = dict(UsageTypes.objects.values_list('pk', 'factor'))
+        periods = {pk: [] for pk in current}
+        for usage_type_id, valid_from, factor in UsageTypeFactor.objects.values_list('usage_type_id', 'valid_from', 'factor'):
+            start = int((valid_from - EPOCH).total_seconds() // 1) if valid_from is not None else -TIME_OFFSET
+            periods[usage_type_id].append((start, factor))
+
+        self.type_ids = np.array(sorted(current), dtype=np.int64)
+        keys, factors = [], []
+        for index, usage_type_id in enumerate(self.type_ids.tolist()):
+            type_periods = sorted(periods[usage_type_id]) or [(-TIME_OFFSET, current[usage_type_id])]
+            # The first period always reaches back to the start of time
+            type_periods[0] = (-TIME_OFFSET, type_periods[0][1])
+            for start, factor in type_periods:
+                keys.append((index << TIME_BITS) | int(_time_keys(start)))
+                factors.append((overrides or {}).get(usage_type_id, factor))
+        self.keys = np.array(keys, dtype=np.int64)
+        self.factors = np.array(factors, dtype=np.float64)
+
+    def resolve(self, usage_type_ids, seconds):
+        """
+        Returns the factor effective at every (usage type id, epoch second) pair of the given arrays.
+        """
+        type_index = np.searchsorted(self.type_ids, usage_type_ids)
+        keys = (type_index.astype(np.int64) << TIME_BITS) | _time_keys(seconds)
+        return self.factors[np.searchsorted(self.keys, keys, side='right') - 1]
+
+
+def usage_chunks(queryset, chunk_size):
+    """
+    Yields ``(user id, usage type id, amount, usage_at epoch second)`` float64 arrays of at most
+    ``chunk_size`` rows of the given Usage queryset, read through a server side cursor when the
+    database supports it.
+    """
+    queryset = (
+        queryset.order_by()
+        .annotate(usage_at_seconds=EpochSeconds('usage_at'))
+        .values_list('user_id', 'usage_type_id', 'amount', 'usage_at_seconds')
+    )
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield np.array(rows, dtype=np.float64).reshape(-1, 4)
+
+
+def group_keys(chunk, group_by):
+    """
+    Returns the group key of every row of a chunk, as integers of the bucket unit for time buckets.
+    """
+    if group_by == 'user':
+        return chunk[:, USER].astype(np.int64)
+    if group_by == 'usage_type':
+        return chunk[:, USAGE_TYPE].astype(np.int64)
+
+    days = np.floor_divide(chunk[:, SECONDS], SECONDS_PER_DAY).astype(np.int64)
+    if group_by == 'day':
+        return days
+    if group_by == 'week':
+        # 1970-01-01 is a Thursday, weeks start on Monday
+        return days - (days + 3) % 7
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def group_value(key, group_by):
+    if group_by in ('day', 'week'):
+        return EPOCH + timedelta(days=key)
+    if group_by == 'month':
+        return datetime(1970 + key // 12, key % 12 + 1, 1, tzinfo=timezone.utc)
+    return key
+
+
+def reduce_chunk(keys, amounts, emissions, group_by):
+    """
+    Reduces one chunk to the totals of its groups with bincount sums and reduceat minimums and maximums.
+    """
+    groups, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(groups))
+    amount_totals = np.bincount(inverse, weights=amounts, minlength=len(groups))
+    emission_totals = np.bincount(inverse, weights=emissions, minlength=len(groups))
+
+    order = np.argsort(inverse, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sorted_emissions = emissions[order]
+    minimums = np.minimum.reduceat(sorted_emissions, starts)
+    maximums = np.maximum.reduceat(sorted_emissions, starts)
+
+    rows = []
+    for index, key in enumerate(groups.tolist()):
+        row = {
+            'count': int(counts[index]),
+            'amount': float(amount_totals[index]),
+            'emissions': float(emission_totals[index]),
+            'min_emissions': float(minimums[index]),
+            'max_emissions': float(maximums[index]),
+        }
+        if group_by is not None:
+            row = {group_by: group_value(key, group_by), **row}
+        rows.append(row)
+    return rows
+
+
+def calculate_emissions(queryset, group_by=None, factors=None, chunk_size=None):
+    """
+    Computes the same totals as aggregations.aggregate_emissions in NumPy, applying the factor of
+    every usage type effective at each usage_at unless ``factors`` overrides it by usage type id.
+
+    Usages are read ``chunk_size`` rows at a time and every chunk is reduced before the next one is
+    read, so memory only depends on the chunk size and the number of groups.
+    """
+    chunk_size = chunk_size or settings.USAGE_CALCULATOR_CHUNK_SIZE
+    table = FactorTable(overrides=factors)
+
+    results = []
+    for chunk in usage_chunks(queryset, chunk_size):
+        amounts = chunk[:, AMOUNT]
+        emissions = amounts * table.resolve(chunk[:, USAGE_TYPE].astype(np.int64), chunk[:, SECONDS])
+        keys = group_keys(chunk, group_by) if group_by is not None else np.zeros(len(chunk), dtype=np.int64)
+        results = merge_emissions([results, reduce_chunk(keys, amounts, emissions, group_by)], group_by)
+
+    if group_by is None and not results:
+        return [{'count': 0, 'amount': None, 'emissions': None, 'min_emissions': None, 'max_emissions': None}]
+    return results
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+# Cache aliases that coordinate the processes of a deployment, each process keeps its own copy of a
+# process local backend and never sees the invalidations of the others
+SHARED_CACHE_SETTINGS = ('USAGE_TYPES_CACHE', 'CONDITIONAL_GET_CACHE', 'REPLICA_PIN_CACHE', 'AUTH_DENYLIST_CACHE')
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """
+    Refuses process local cache backends for the shared cache aliases outside of DEBUG: the web
+    and worker processes would keep stale usage type factors, revoked tokens and validators.
+    """
+    messages = []
+    for name in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, name)
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend not in PROCESS_LOCAL_BACKENDS:
+            continue
+        message_class, level = (Warning, 'W') if settings.DEBUG else (Error, 'E')
+        messages.append(message_class(
+            f'{name} uses the "{alias}" cache with the process local {backend.rsplit(".", 1)[-1]} backend.',
+            hint='Set CACHE_DEFAULT_LOCATION to a cache server shared by every web and worker process.',
+            id=f'carbon_usage.{level}001',
+        ))
+    return messages
@@ -0,0 +1,101 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def _deleted_at_key(model):
+    return f'carbon_usage:{model._meta.label_lower}:deleted_at'
+
+
+def _set_deleted_at(model):
+    caches[settings.CONDITIONAL_GET_CACHE].set(_deleted_at_key(model), timezone.now(), timeout=None)
+
+
+def mark_deleted(model):
+    """
+    Records that rows of the given model were deleted, which the latest updated_at cannot tell.
+    """
+    _set_deleted_at(model)
+    # A list read before the deleting transaction commits still has the rows, so stamp it again afterwards
+    transaction.on_commit(lambda: _set_deleted_at(model))
+
+
+def last_deleted_at(model):
+    return caches[settings.CONDITIONAL_GET_CACHE].get(_deleted_at_key(model))
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag and Last-Modified validators to the list and retrieve actions of a model viewset.
+
+    The list validators come from one aggregate query over the filtered queryset, its row count
+    and latest updated_at, which also replaces the COUNT query of the pagination. Requests whose
+    If-None-Match or If-Modified-Since still match get a 304 without any serialization.
+
+    Keyset pages skip that aggregate, which would read every filtered row for a page that only
+    reads ``limit`` of them. Their ETag is a digest of the page and they have no Last-Modified.
+    """
+
+    def get_etag(self, *parts):
+        parts = (
+            self.request.get_full_path(),
+            self.request.user.pk,
+            self.request.accepted_media_type,
+            *parts,
+        )
+        return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+    def conditional_response(self, etag, last_modified, render):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(self.request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = render()
+
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if getattr(self.paginator, 'uses_keyset', None) and self.paginator.uses_keyset(request):
+            response = self.get_list_response(queryset)
+            return self.conditional_response(self.get_etag(response.data), None, lambda: response)
+
+        stats = queryset.order_by().aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+        last_modified = max(
+            (value for value in (stats['last_modified'], last_deleted_at(queryset.model)) if value),
+            default=None
+        )
+        etag = self.get_etag(stats['count'], last_modified)
+
+        def render():
+            if self.paginator is not None:
+                self.paginator.count_hint = stats['count']
+            return self.get_list_response(queryset)
+
+        return self.conditional_response(etag, last_modified, render)
+
+    def get_list_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self.get_etag(instance.updated_at)
+        return self.conditional_response(
+            etag, instance.updated_at, lambda: Response(self.get_serializer(instance).data)
+        )
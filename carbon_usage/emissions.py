@@ -0,0 +1,161 @@
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from carbon_usage.jobs import enqueue, handler
+from carbon_usage.models import Usage, UsageTypeFactor, UsageTypes
+from carbon_usage.rollups import refresh_rollups
+
+
+def covering(when):
+    """
+    Returns the condition matching the factor periods whose interval contains the given datetime.
+    """
+    return (
+        (Q(valid_from__isnull=True) | Q(valid_from__lte=when))
+        & (Q(valid_to__isnull=True) | Q(valid_to__gt=when))
+    )
+
+
+def overlapping(start=None, end=None):
+    """
+    Returns the condition matching the factor periods that overlap the ``[start, end)`` interval.
+    """
+    condition = Q()
+    if end is not None:
+        condition &= Q(valid_from__isnull=True) | Q(valid_from__lt=end)
+    if start is not None:
+        condition &= Q(valid_to__isnull=True) | Q(valid_to__gt=start)
+    return condition
+
+
+def _sync_current_factor(usage_type):
+    factor = usage_type.factors.filter(covering(timezone.now())).values_list('factor', flat=True).first()
+    if factor is not None and factor != usage_type.factor:
+        usage_type.factor = factor
+        usage_type.save(update_fields=['factor', 'updated_at'])
+
+
+@transaction.atomic
+def set_current_factor(usage_type):
+    """
+    Applies the factor of a usage type to the factor period effective now, creating an open period
+    when the usage type has none. A period open since the beginning of time keeps its factor for
+    the past and is closed now, the factor is effective from now on. Returns the changed period.
+    """
+    now = timezone.now()
+    periods = UsageTypeFactor.objects.select_for_update().filter(usage_type=usage_type)
+    period = periods.filter(covering(now)).first()
+    if period is None:
+        return UsageTypeFactor.objects.create(usage_type=usage_type, factor=usage_type.factor)
+    if period.valid_from is None:
+        return add_factor_period(usage_type, usage_type.factor, now)
+
+    period.factor = usage_type.factor
+    period.save(update_fields=['factor', 'updated_at'])
+    return period
+
+
+@transaction.atomic
+def add_factor_period(usage_type, factor, valid_from):
+    """
+    Makes ``factor`` effective from ``valid_from`` until the start of the next factor period,
+    splitting the period that contains ``valid_from``. The factor of a period starting at exactly
+    ``valid_from`` is replaced instead. Returns the changed period.
+    """
+    periods = UsageTypeFactor.objects.select_for_update().filter(usage_type=usage_type)
+    if not periods.exists():
+        UsageTypeFactor.objects.create(usage_type=usage_type, factor=usage_type.factor)
+
+    period = periods.filter(valid_from=valid_from).first()
+    if period is not None:
+        period.factor = factor
+        period.save(update_fields=['factor', 'updated_at'])
+    else:
+        containing = periods.get(covering(valid_from))
+        period = UsageTypeFactor.objects.create(
+            usage_type=usage_type, factor=factor, valid_from=valid_from, valid_to=containing.valid_to
+        )
+        containing.valid_to = valid_from
+        containing.save(update_fields=['valid_to', 'updated_at'])
+
+    _sync_current_factor(usage_type)
+    return period
+
+
+def factor_periods(usage_type, start=None, end=None):
+    """
+    Returns the ``(valid_from, valid_to, factor)`` periods of a usage type overlapping ``[start, end)``,
+    or a single open period of its factor when it has no factor periods.
+    """
+    if not usage_type.factors.exists():
+        return [(None, None, usage_type.factor)]
+    return list(usage_type.factors.filter(overlapping(start, end)).values_list('valid_from', 'valid_to', 'factor'))
+
+
+def recompute_emissions(usage_type_id, start=None, end=None, batch_size=None):
+    """
+    Recomputes the stored emissions of the usages of a usage type whose usage_at falls in
+    ``[start, end)``, or of all of them, along with their daily rollups.
+
+    Every factor period overlapping the range is applied with UPDATE statements over primary key
+    ranges of ``batch_size`` rows, each in its own short transaction that also refreshes the rollup
+    days of the range, so neither the usage table nor the rollups of the usage type are ever locked
+    as a whole. Returns the number of updated usages.
+    """
+    batch_size = batch_size or settings.USAGE_EMISSIONS_RECOMPUTE_BATCH_SIZE
+    usage_type = UsageTypes.objects.filter(pk=usage_type_id).first()
+    if usage_type is None:
+        return 0
+
+    updated = 0
+    for valid_from, valid_to, factor in factor_periods(usage_type, start, end):
+        usages = Usage.objects.filter(usage_type_id=usage_type_id)
+        for bound, lookup in ((valid_from, 'gte'), (start, 'gte'), (valid_to, 'lt'), (end, 'lt')):
+            if bound is not None:
+                usages = usages.filter(**{f'usage_at__{lookup}': bound})
+
+        last_pk = 0
+        while True:
+            rows = list(
+                usages.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'user_id', 'usage_at')[:batch_size]
+            )
+            if not rows:
+                break
+            with transaction.atomic():
+                updated += usages.filter(pk__gt=last_pk, pk__lte=rows[-1][0]).update(emissions=F('amount') * factor)
+                refresh_rollups({
+                    (user_id, usage_type_id, usage_at.astimezone(dt_timezone.utc).date()) for _, user_id, usage_at in rows
+                })
+            last_pk = rows[-1][0]
+    return updated
+
+
+@handler('recompute_emissions')
+def recompute_emissions_job(job):
+    parameters = job.parameters
+    start, end = (parse_datetime(parameters[name]) if parameters[name] else None for name in ('start', 'end'))
+    recompute_emissions(parameters['usage_type'], start, end)
+
+
+def schedule_emissions_recompute(usage_type_id, start=None, end=None):
+    """
+    Recomputes the stored emissions of a usage type in ``[start, end)`` after the current
+    transaction commits.
+
+    Unless ``USAGE_EMISSIONS_RECOMPUTE_ASYNC`` is disabled, the work is queued as a job committed
+    along with the transaction and run by a run_jobs worker, until then aggregates keep reporting
+    the emissions of the previous factor.
+    """
+    if settings.USAGE_EMISSIONS_RECOMPUTE_ASYNC:
+        enqueue('recompute_emissions', {
+            'usage_type': usage_type_id,
+            'start': start.isoformat() if start else None,
+            'end': end.isoformat() if end else None,
+        })
+    else:
+        transaction.on_commit(lambda: recompute_emissions(usage_type_id, start, end))
@@ -0,0 +1,55 @@
+import csv
+import json
+
+EXPORT_FIELDS = ('id', 'user', 'usage_type', 'usage_at', 'amount', 'emissions')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """
+    A file-like object that returns what is written to it instead of buffering it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def format_datetime(value):
+    """
+    Formats a datetime the same way the REST framework DateTimeField and JSON encoder do.
+    """
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def export_rows(queryset, chunk_size):
+    """
+    Yields the exported columns of the given Usage queryset, fetching ``chunk_size`` rows at a time.
+    """
+    queryset = queryset.values_list(*EXPORT_FIELDS)
+    for usage_id, user_id, usage_type_id, usage_at, amount, emissions in queryset.iterator(chunk_size=chunk_size):
+        yield usage_id, user_id, usage_type_id, format_datetime(usage_at), amount, emissions
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': csv_lines,
+    'ndjson': ndjson_lines,
+}
@@ -1,17 +1,48 @@
+from django import forms
 from django_filters import rest_framework as filters
 
+from carbon_usage.cache import usage_types_cache
 from carbon_usage.models import Usage, UsageTypes
 
 
+class UsageTypeChoiceField(forms.IntegerField):
+    """
+    A usage type choice validated against the UsageTypes cache instead of the database.
+    """
+    default_error_messages = {
+        'invalid_choice': forms.ModelChoiceField.default_error_messages['invalid_choice'],
+    }
+
+    def clean(self, value):
+        value = super().clean(value)
+        if value is None:
+            return None
+
+        usage_type = usage_types_cache.get(value)
+        if usage_type is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return usage_type
+
+
+class UsageTypeFilter(filters.Filter):
+    field_class = UsageTypeChoiceField
+
+
 class UsageFilter(filters.FilterSet):
+    usage_type = UsageTypeFilter(field_name="usage_type")
     min_amount = filters.NumberFilter(field_name="amount", lookup_expr='gte')
     max_amount = filters.NumberFilter(field_name="amount", lookup_expr='lte')
     min_usage_at = filters.DateTimeFilter(field_name="usage_at", lookup_expr='gte')
     max_usage_at = filters.DateTimeFilter(field_name="usage_at", lookup_expr='lte')
+    min_emissions = filters.NumberFilter(field_name="emissions", lookup_expr='gte')
+    max_emissions = filters.NumberFilter(field_name="emissions", lookup_expr='lte')
 
     class Meta:
         model = Usage
-        fields = ('user', 'usage_type', 'min_amount', 'max_amount', 'min_usage_at', 'max_usage_at')
+        fields = (
+            'user', 'usage_type', 'min_amount', 'max_amount', 'min_usage_at', 'max_usage_at',
+            'min_emissions', 'max_emissions',
+        )
 
 
 class UsageTypesFilter(filters.FilterSet):
@@ -0,0 +1,132 @@
+"""
+Time series of the usage counts, amounts and emissions of every usage type, bucketed by the wall
+clock time of a timezone.
+
+Buckets are truncated inside the database in the requested timezone, so the day buckets of
+Europe/Berlin start at its midnights whatever the UTC offset of the day. Buckets without usages
+are filled with zeros, and a range needing more than ``max_buckets`` buckets of the requested
+interval is downsampled to the first coarser interval that fits.
+"""
+from datetime import timedelta, timezone
+
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import Trunc
+from rest_framework.exceptions import ValidationError
+
+from carbon_usage.archive import archived_slots
+
+# From the finest to the coarsest, downsampling moves along this order
+INTERVALS = ('hour', 'day', 'week', 'month', 'quarter', 'year')
+MONTHS = {'month': 1, 'quarter': 3, 'year': 12}
+
+
+def local(value, tz):
+    """
+    Returns the naive wall clock time of an aware datetime in the given timezone.
+    """
+    return value.astimezone(tz).replace(tzinfo=None)
+
+
+def truncate(value, interval):
+    """
+    Returns the start of the bucket containing a naive wall clock time, weeks start on Mondays.
+    """
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if interval == 'hour':
+        return value
+    value = value.replace(hour=0)
+    if interval == 'day':
+        return value
+    if interval == 'week':
+        return value - timedelta(days=value.weekday())
+    return value.replace(month=value.month - (value.month - 1) % MONTHS[interval], day=1)
+
+
+def next_bucket(value, interval):
+    if interval in ('hour', 'day', 'week'):
+        return value + timedelta(**{f'{interval}s': 1})
+    index = value.year * 12 + value.month - 1 + MONTHS[interval]
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def bucket_starts(start, end, interval, tz, limit):
+    """
+    Returns the wall clock starts of the buckets from the one containing ``start`` to the one
+    containing ``end``, or None when there are more than ``limit`` of them. Hours skipped by a
+    daylight saving time change are left out.
+    """
+    buckets = []
+    bucket, last = truncate(start, interval), truncate(end, interval)
+    while bucket <= last:
+        # Through UTC, astimezone returns a datetime of the same timezone unchanged
+        if interval != 'hour' or local(bucket.replace(tzinfo=tz).astimezone(timezone.utc), tz) == bucket:
+            if len(buckets) == limit:
+                return None
+            buckets.append(bucket)
+        bucket = next_bucket(bucket, interval)
+    return buckets
+
+
+def usage_extent(queryset, archived):
+    """
+    Returns the first and last usage_at of the given usages and archived slots, or Nones without any.
+    """
+    extent = queryset.order_by().aggregate(first=Min('usage_at'), last=Max('usage_at'))
+    slots = [slot for _, slot, *_ in archived]
+    firsts = [value for value in (extent['first'], min(slots, default=None)) if value is not None]
+    lasts = [value for value in (extent['last'], max(slots, default=None)) if value is not None]
+    return min(firsts, default=None), max(lasts, default=None)
+
+
+def usage_histogram(queryset, filters, interval, tz, max_buckets):
+    """
+    Buckets the usages of a Usage queryset filtered by the given UsageFilter cleaned data by
+    ``interval`` in the ``tz`` timezone, adding the archived usages the usage_at range reaches.
+
+    Returns the interval used, the aware starts of the buckets and a series of counts, amounts
+    and emissions of every usage type with usages, aligned with the buckets.
+    """
+    archived = list(archived_slots(filters))
+    start, end = filters.get('min_usage_at'), filters.get('max_usage_at')
+    if start is None or end is None:
+        first, last = usage_extent(queryset, archived)
+        start, end = start or first, end or last
+    if start is None or end is None:
+        return {'interval': interval, 'buckets': [], 'series': []}
+
+    for candidate in INTERVALS[INTERVALS.index(interval):]:
+        starts = bucket_starts(local(start, tz), local(end, tz), candidate, tz, max_buckets)
+        if starts is not None:
+            interval = candidate
+            break
+    else:
+        raise ValidationError({'max_buckets': [f'The usage_at range needs more than {max_buckets} yearly buckets.']})
+
+    positions = {bucket: position for position, bucket in enumerate(starts)}
+    series = {}
+
+    def add(usage_type_id, bucket, count, amount, emissions):
+        position = positions.get(bucket)
+        if position is None:
+            return
+        values = series.setdefault(usage_type_id, {
+            'count': [0] * len(starts), 'amount': [0.0] * len(starts), 'emissions': [0.0] * len(starts),
+        })
+        values['count'][position] += count
+        values['amount'][position] += amount
+        values['emissions'][position] += emissions
+
+    rows = (
+        queryset.order_by().annotate(bucket=Trunc('usage_at', interval, tzinfo=tz))
+        .values_list('usage_type', 'bucket').annotate(Count('id'), Sum('amount'), Sum('emissions'))
+    )
+    for usage_type_id, bucket, count, amount, emissions in rows:
+        add(usage_type_id, local(bucket, tz), count, amount, emissions)
+    for usage_type_id, slot, count, amount, emissions in archived:
+        add(usage_type_id, truncate(local(slot, tz), interval), count, amount, emissions)
+
+    return {
+        'interval': interval,
+        'buckets': [bucket.replace(tzinfo=tz) for bucket in starts],
+        'series': [{'usage_type': usage_type_id, **series[usage_type_id]} for usage_type_id in sorted(series)],
+    }
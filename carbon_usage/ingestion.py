@@ -0,0 +1,196 @@
+from datetime import timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Min, Q
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from carbon_usage.archive import archived_amounts
+from carbon_usage.cache import usage_types_cache
+from carbon_usage.conditional import mark_deleted
+from carbon_usage.models import Usage
+from carbon_usage.rollups import refresh_rollups, rollup_key
+from carbon_usage.serializers import BulkUsageSerializer
+
+# Natural keys deleted by one statement of dedupe_usages
+DEDUPE_BATCH_SIZE = 100
+
+CONFLICT_MESSAGE = 'A usage of this user and usage type already exists at this usage_at with another amount.'
+
+
+class UsageConflict(APIException):
+    """
+    A write that would store a second usage of the same user, usage type and usage_at.
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_code = 'usage_conflict'
+
+    def __init__(self, existing):
+        super().__init__(CONFLICT_MESSAGE)
+        # The id of the stored usage stays a number in the response
+        self.detail = {'detail': self.detail, 'id': existing.pk}
+        self.existing = existing
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def natural_key(user_id, usage_type_id, usage_at):
+    return user_id, usage_type_id, usage_at.astimezone(timezone.utc)
+
+
+def existing_amounts(keys):
+    """
+    Returns the amount of the stored usages of the given natural keys, by natural key, looking the
+    keys missing from the usage table up in the archives of their months.
+    """
+    if not keys:
+        return {}
+    usages = Usage.objects.filter(
+        user__in={user_id for user_id, _, _ in keys},
+        usage_type__in={usage_type_id for _, usage_type_id, _ in keys},
+        usage_at__in={usage_at for _, _, usage_at in keys},
+    ).values_list('user_id', 'usage_type_id', 'usage_at', 'amount')
+    amounts = {natural_key(user_id, usage_type_id, usage_at): amount for user_id, usage_type_id, usage_at, amount in usages}
+    amounts = {key: amount for key, amount in amounts.items() if key in keys}
+    amounts.update(archived_amounts(keys - amounts.keys()))
+    return amounts
+
+
+def _check_batch(batch, user_ids, usage_types, amounts):
+    """
+    Returns the Usage instances to insert for the given validated rows, the number of duplicates
+    and the row errors, against the stored ``amounts`` of their natural keys.
+    """
+    amounts = dict(amounts)
+    usages = []
+    duplicates = 0
+    errors = []
+    for index, data in batch:
+        row_errors = {}
+        if data['user'] not in user_ids:
+            row_errors['user'] = [f'Invalid pk "{data["user"]}" - object does not exist.']
+        if data['usage_type'] not in usage_types:
+            row_errors['usage_type'] = [f'Invalid pk "{data["usage_type"]}" - object does not exist.']
+        key = natural_key(data['user'], data['usage_type'], data['usage_at'])
+        if not row_errors and key in amounts:
+            if amounts[key] == data['amount']:
+                duplicates += 1
+                continue
+            row_errors['usage_at'] = [CONFLICT_MESSAGE]
+        if row_errors:
+            errors.append({'index': index, 'errors': row_errors})
+            continue
+        # Later rows of the same key in this request are duplicates or conflicts of this one
+        amounts[key] = data['amount']
+        usages.append(Usage(
+            user_id=data['user'],
+            usage_type_id=data['usage_type'],
+            usage_at=data['usage_at'],
+            amount=data['amount'],
+            emissions=data['amount'] * usage_types_cache.factor_at(data['usage_type'], data['usage_at']),
+        ))
+    return usages, duplicates, errors
+
+
+def bulk_create_usages(rows, batch_size=None):
+    """
+    Validates and inserts the given Usage rows, resolving their users with one query per batch
+    and their usage types through the UsageTypes cache.
+
+    Ingestion is idempotent: rows whose (user, usage type, usage_at) natural key is already stored
+    with the same amount, in the usage table or in an archive, are counted as duplicates and
+    skipped, so retrying a batch changes nothing. Rows of a stored key with another amount are
+    errors. Invalid rows are reported by their index in ``rows`` and skipped, every valid row is
+    written inside a single transaction together with the daily rollups it changes. Returns the
+    list of created Usage instances, without primary keys, the number of duplicates and the row
+    errors.
+    """
+    batch_size = batch_size or settings.USAGE_BULK_BATCH_SIZE
+    errors = []
+    valid_rows = []
+    for index, row in enumerate(rows):
+        serializer = BulkUsageSerializer(data=row)
+        if serializer.is_valid():
+            valid_rows.append((index, serializer.validated_data))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+
+    created = []
+    duplicates = 0
+    with transaction.atomic():
+        for batch in _chunks(valid_rows, batch_size):
+            user_ids = set(get_user_model().objects.filter(
+                pk__in={data['user'] for _, data in batch}
+            ).values_list('pk', flat=True))
+            usage_types = usage_types_cache.all()
+            keys = {natural_key(data['user'], data['usage_type'], data['usage_at']) for _, data in batch}
+            amounts = existing_amounts(keys)
+            while True:
+                usages, batch_duplicates, batch_errors = _check_batch(batch, user_ids, usage_types, amounts)
+                if not usages:
+                    break
+                try:
+                    with transaction.atomic():
+                        Usage.objects.bulk_create(usages, batch_size=batch_size)
+                    break
+                except IntegrityError:
+                    # A concurrent request stored some of the keys since they were looked up, their rows
+                    # are checked again as duplicates or conflicts of the stored usages
+                    stored = existing_amounts(keys)
+                    if stored.keys() == amounts.keys():
+                        raise
+                    amounts = stored
+            created.extend(usages)
+            duplicates += batch_duplicates
+            errors.extend(batch_errors)
+        refresh_rollups(rollup_key(usage) for usage in created)
+
+    errors.sort(key=lambda error: error['index'])
+    return created, duplicates, errors
+
+
+def duplicate_groups(user_ids):
+    """
+    Returns the natural keys of the given users stored more than once, with the first id of each.
+    """
+    return (
+        Usage.objects.filter(user__in=user_ids).order_by()
+        .values('user', 'usage_type', 'usage_at')
+        .annotate(count=Count('id'), keep=Min('id'))
+        .filter(count__gt=1)
+    )
+
+
+def dedupe_usages(chunk_size=100, dry_run=False):
+    """
+    Deletes the usages sharing their natural key with an older one, keeping the first stored.
+
+    Users are processed ``chunk_size`` at a time in their own transaction, which only locks the
+    deleted rows and the rollups it refreshes. Returns the number of deleted usages, or of usages
+    that would be deleted with ``dry_run``.
+    """
+    user_ids = list(get_user_model().objects.order_by('pk').values_list('pk', flat=True))
+    deleted = 0
+    for chunk in _chunks(user_ids, chunk_size):
+        with transaction.atomic():
+            groups = list(duplicate_groups(chunk))
+            if dry_run:
+                deleted += sum(group['count'] - 1 for group in groups)
+                continue
+            for batch in _chunks(groups, DEDUPE_BATCH_SIZE):
+                condition = Q()
+                for group in batch:
+                    key = Q(user=group['user'], usage_type=group['usage_type'], usage_at=group['usage_at'])
+                    condition |= key & ~Q(pk=group['keep'])
+                deleted += Usage.objects.filter(condition).delete()[0]
+            refresh_rollups(
+                (group['user'], group['usage_type'], group['usage_at'].astimezone(timezone.utc).date()) for group in groups
+            )
+    if deleted and not dry_run:
+        mark_deleted(Usage)
+    return deleted
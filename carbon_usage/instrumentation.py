@@ -0,0 +1,107 @@
+"""
+Per route request metrics of a sample of the requests, see middleware.RequestMetricsMiddleware.
+
+A sampled request carries a RequestSample in a context variable, which the query wrapper
+installed on every database connection and the serialization timers add to. The variable is
+copied into the threads running the sync parts of async requests, so those are counted too.
+Requests out of the sample only pay for a context variable lookup per query.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from carbon_usage import metrics
+
+# Route label of the requests no URL pattern matched, to keep the label values bounded
+UNMATCHED_ROUTE = 'unmatched'
+
+REQUEST_SAMPLE_RATE = metrics.gauge('http_request_sample_rate', 'Fraction of the requests the request metrics observe.')
+REQUESTS = metrics.counter(
+    'http_sampled_requests_total', 'Sampled requests by route, method and status code.', ('route', 'method', 'status')
+)
+REQUEST_SECONDS = metrics.histogram(
+    'http_request_duration_seconds', 'Time from the request reaching the application to its response.',
+    ('route', 'method'),
+)
+REQUEST_QUERIES = metrics.histogram(
+    'http_request_db_queries', 'Database queries run by a request.', ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250),
+)
+REQUEST_DB_SECONDS = metrics.histogram(
+    'http_request_db_seconds', 'Time a request spent running database queries.', ('route',)
+)
+REQUEST_SERIALIZATION_SECONDS = metrics.histogram(
+    'http_request_serialization_seconds', 'Time a request spent serializing and rendering its response.', ('route',)
+)
+RESPONSE_BYTES = metrics.histogram(
+    'http_response_size_bytes', 'Size of the response bodies, streamed responses are left out.', ('route',),
+    buckets=tuple(4 ** exponent for exponent in range(4, 13)),
+)
+
+current_sample = ContextVar('current_sample', default=None)
+
+
+class RequestSample:
+    __slots__ = ('queries', 'db_seconds', 'serialization_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+
+def is_sampled():
+    rate = settings.REQUEST_METRICS_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    A database execute wrapper counting the queries of sampled requests and their time.
+    """
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.db_seconds += time.perf_counter() - started
+        sample.queries += 1
+
+
+def instrument_connection(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed_serialization():
+    sample = current_sample.get()
+    if sample is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample.serialization_seconds += time.perf_counter() - started
+
+
+def route_name(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match.view_name if resolver_match is not None else UNMATCHED_ROUTE
+
+
+def record_request(request, response, sample, seconds):
+    route = route_name(request)
+    REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    REQUEST_SECONDS.observe(seconds, route=route, method=request.method)
+    REQUEST_QUERIES.observe(sample.queries, route=route)
+    REQUEST_DB_SECONDS.observe(sample.db_seconds, route=route)
+    REQUEST_SERIALIZATION_SECONDS.observe(sample.serialization_seconds, route=route)
+    if not response.streaming:
+        RESPONSE_BYTES.observe(len(response.content), route=route)
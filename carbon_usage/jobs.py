@@ -0,0 +1,224 @@
+"""
+A queue of background jobs kept in the Job table, run by the ``run_jobs`` management command.
+
+Workers claim the oldest due job with ``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent
+workers neither wait for each other nor run the same job. Handlers are registered per job kind
+with the ``handler`` decorator by the modules of JOB_MODULES. They get the job and return the
+path of its result file relative to JOB_RESULTS_ROOT, or None. Files of a job are written to its
+own directory, ``job_directory(job)``.
+
+A failing job is queued again JOB_RETRY_DELAY seconds later, times its attempts, until it failed
+JOB_MAX_ATTEMPTS times. While a job runs, its worker bumps its updated_at every
+JOB_HEARTBEAT_INTERVAL seconds. A running job without a heartbeat for more than JOB_TIMEOUT
+seconds was left by a worker that died, it is queued again the same way. A worker only records
+the outcome of a job it still holds the claim of, identified by the job's attempts.
+"""
+import logging
+import shutil
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from importlib import import_module
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from carbon_usage.models import Job
+
+logger = logging.getLogger(__name__)
+
+# Shown to users instead of the exception, which can quote SQL or paths, the worker logs it
+JOB_FAILED_ERROR = 'The job failed unexpectedly.'
+
+HANDLERS = {}
+
+JOB_MODULES = (
+    'carbon_usage.emissions',
+    'carbon_usage.reports',
+)
+
+
+def handler(kind):
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def load_handlers():
+    for module in JOB_MODULES:
+        import_module(module)
+    return HANDLERS
+
+
+def results_root():
+    return Path(settings.JOB_RESULTS_ROOT)
+
+
+def job_directory(job):
+    """
+    Returns the directory of the files of a job relative to JOB_RESULTS_ROOT.
+    """
+    return Path(f'job={job.pk}')
+
+
+def enqueue(kind, parameters=None, user=None):
+    """
+    Queues a job, it becomes visible to the workers when the current transaction commits.
+    """
+    return Job.objects.create(kind=kind, parameters=parameters or {}, user=user)
+
+
+def claim_job():
+    """
+    Marks the oldest due queued job running and returns it, or None when no job is due.
+    """
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=timezone.now()).order_by('run_after', 'id')
+    # Without SKIP LOCKED, on SQLite, the status condition of the update alone keeps two workers from
+    # claiming the same job. It runs outside a transaction there, SQLite cannot upgrade a concurrent read one
+    locking = connections[router.db_for_write(Job)].features.has_select_for_update_skip_locked
+    with transaction.atomic() if locking else nullcontext():
+        job = (due.select_for_update(skip_locked=True) if locking else due).first()
+        if job is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, attempts=F('attempts') + 1, started_at=now, updated_at=now
+        )
+        if not claimed:
+            return None
+    job.status, job.attempts, job.started_at = Job.RUNNING, job.attempts + 1, now
+    return job
+
+
+def _retry_or_fail(job, error):
+    job.error = error
+    if job.attempts < settings.JOB_MAX_ATTEMPTS:
+        job.status = Job.QUEUED
+        job.run_after = timezone.now() + timedelta(seconds=settings.JOB_RETRY_DELAY * job.attempts)
+    else:
+        job.status = Job.FAILED
+        job.finished_at = timezone.now()
+
+
+def own_claim(job):
+    """
+    Returns a queryset of the job as long as it is still running under the claim of the given instance.
+    """
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts)
+
+
+@contextmanager
+def heartbeat(job):
+    """
+    Bumps the updated_at of a claimed job every JOB_HEARTBEAT_INTERVAL seconds from a thread, so
+    that requeue_stale_jobs tells a long job from one whose worker died.
+    """
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(settings.JOB_HEARTBEAT_INTERVAL):
+                try:
+                    if not own_claim(job).update(updated_at=timezone.now()):
+                        return
+                except DatabaseError:
+                    logger.exception('Heartbeat of job %s failed', job.pk)
+        finally:
+            # Connections are per thread, these are the heartbeat's own
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_job(job):
+    """
+    Runs a claimed job with the handler of its kind and records the outcome, unless the job was
+    taken for abandoned and claimed again meanwhile.
+    """
+    try:
+        with heartbeat(job):
+            result_path = load_handlers()[job.kind](job)
+    except Exception:
+        logger.exception('Job %s of kind %s failed', job.pk, job.kind)
+        _retry_or_fail(job, JOB_FAILED_ERROR)
+    else:
+        job.status = Job.SUCCEEDED
+        job.result_path = result_path or ''
+        job.error = ''
+        job.finished_at = timezone.now()
+    recorded = own_claim(job).update(
+        status=job.status, result_path=job.result_path, error=job.error, run_after=job.run_after,
+        finished_at=job.finished_at, updated_at=timezone.now(),
+    )
+    if not recorded:
+        logger.warning('Job %s lost its claim while running, its outcome is discarded', job.pk)
+        job.refresh_from_db()
+    return job
+
+
+def requeue_stale_jobs():
+    """
+    Queues again, or fails once out of attempts, the running jobs without a heartbeat for more than
+    JOB_TIMEOUT seconds. Returns the number of jobs found.
+    """
+    stale = Job.objects.filter(
+        status=Job.RUNNING, updated_at__lt=timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+    )
+    jobs = list(stale)
+    for job in jobs:
+        _retry_or_fail(job, 'Abandoned by its worker.')
+        stale.filter(pk=job.pk).update(
+            status=job.status, error=job.error, run_after=job.run_after, finished_at=job.finished_at,
+            updated_at=timezone.now(),
+        )
+    return len(jobs)
+
+
+def delete_expired_jobs():
+    """
+    Deletes the jobs finished more than JOB_RETENTION_DAYS days ago along with their result files
+    and directories. Returns the number of jobs deleted.
+    """
+    expired = Job.objects.filter(finished_at__lt=timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS))
+    deleted = 0
+    for job in expired.only('pk', 'result_path').iterator():
+        if job.result_path:
+            (results_root() / job.result_path).unlink(missing_ok=True)
+        # Also left by failed attempts that never returned a result path
+        shutil.rmtree(results_root() / job_directory(job), ignore_errors=True)
+        deleted += Job.objects.filter(pk=job.pk).delete()[0]
+    return deleted
+
+
+def work(burst=False, poll_interval=None):
+    """
+    Claims and runs jobs one at a time, waiting ``poll_interval`` seconds while no job is due.
+    With ``burst`` it returns once no job is due. Returns the number of jobs run.
+    """
+    poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+    load_handlers()
+    ran = 0
+    while True:
+        # Workers live long, connections broken or older than CONN_MAX_AGE are replaced like between requests
+        close_old_connections()
+        job = claim_job()
+        if job is not None:
+            run_job(job)
+            ran += 1
+            continue
+        requeue_stale_jobs()
+        delete_expired_jobs()
+        if burst:
+            return ran
+        time.sleep(poll_interval)
@@ -0,0 +1,43 @@
+from django.db import models
+from rest_framework.response import Response
+
+from carbon_usage.exports import format_datetime
+from carbon_usage.instrumentation import timed_serialization
+
+
+class ValuesListMixin:
+    """
+    Serves list responses from ``.values()`` rows of the serializer fields.
+
+    It skips the ModelSerializer field machinery for read-only listings of serializers that only
+    render plain model columns and foreign key ids, formatting datetimes like DateTimeField does.
+    """
+
+    def get_list_fields(self):
+        return self.get_serializer_class().Meta.fields
+
+    def get_list_formatters(self, queryset, fields):
+        formatters = {}
+        for name in fields:
+            if isinstance(queryset.model._meta.get_field(name), models.DateTimeField):
+                formatters[name] = format_datetime
+        return formatters
+
+    def format_rows(self, rows, formatters):
+        if not formatters:
+            return list(rows)
+        with timed_serialization():
+            return [
+                {**row, **{name: format(row[name]) for name, format in formatters.items() if row[name] is not None}}
+                for row in rows
+            ]
+
+    def get_list_response(self, queryset):
+        fields = self.get_list_fields()
+        formatters = self.get_list_formatters(queryset, fields)
+        rows = queryset.values(*fields)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.format_rows(page, formatters))
+        return Response(self.format_rows(rows, formatters))
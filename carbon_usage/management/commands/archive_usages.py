@@ -0,0 +1,34 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from carbon_usage.archive import archive_usages
+from carbon_usage.partitions import add_months, month_start
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').replace(tzinfo=dt_timezone.utc)
+    except ValueError:
+        raise CommandError(f'Invalid month, expected YYYY-MM: {value}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the usages of old UTC months out of the database into compressed column files '
+        'under USAGE_ARCHIVE_ROOT, see restore_usages to move them back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before',
+                            help='Archives the months before this YYYY-MM month, defaults to USAGE_ARCHIVE_AFTER_MONTHS ago.')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            before = parse_month(options['before'])
+        else:
+            before = add_months(month_start(timezone.now()), -settings.USAGE_ARCHIVE_AFTER_MONTHS)
+        moved = archive_usages(before)
+        self.stdout.write(f'Archived {moved} usages of the months before {before:%Y-%m}.')
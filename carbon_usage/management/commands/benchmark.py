@@ -0,0 +1,57 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from carbon_usage.benchmarks import compare_results, load_scenarios, run_scenario
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs in-process benchmarks of the carbon_usage API inside a rolled back transaction, optionally '
+        'saving the results as JSON and flagging regressions against a saved baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Scenarios to run, all of them by default.')
+        parser.add_argument('--rows', type=int, help='Number of usages seeded or sent by the scenario.')
+        parser.add_argument('--users', type=int, help='Number of users owning the seeded usages.')
+        parser.add_argument('--usage-types', type=int, help='Number of usage types of the seeded usages.')
+        parser.add_argument('--repeat', type=int, help='Number of times every measured request is sent.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random seeded values.')
+        parser.add_argument('--output', help='Writes the results to this JSON file.')
+        parser.add_argument('--baseline', help='Compares the results to those of this JSON file written by --output.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Slowdown against the baseline flagged as a regression, 0.2 for 20%%.')
+
+    def handle(self, *args, **options):
+        scenario_options = {
+            name: options[name] for name in ('rows', 'users', 'usage_types', 'repeat') if options[name]
+        }
+        results = {}
+        for name in options['scenarios'] or sorted(load_scenarios()):
+            random.seed(options['seed'])
+            results[name] = run_scenario(name, **scenario_options)
+            self.stdout.write(json.dumps({name: results[name]}, indent=2))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({
+                    'database': connection.vendor,
+                    'seed': options['seed'],
+                    'options': scenario_options,
+                    'results': results,
+                }, output, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                baseline = json.load(baseline)
+            if baseline.get('database') != connection.vendor or baseline.get('options') != scenario_options:
+                self.stderr.write('The baseline was measured with another database or other options.')
+            regressions = compare_results(baseline['results'], results, options['threshold'])
+            for path, before, value, slowdown in regressions:
+                self.stdout.write(f'REGRESSION {path}: {before:g} -> {value:g} ({slowdown:+.0%})')
+            if regressions:
+                raise CommandError(f'{len(regressions)} measurements regressed by more than {options["threshold"]:.0%}.')
+            self.stdout.write('No regression against the baseline.')
@@ -0,0 +1,25 @@
+import shutil
+
+from django.core.management.base import BaseCommand
+
+from carbon_usage.schema import build_schema, code_version, schema_root
+
+
+class Command(BaseCommand):
+    help = (
+        'Builds the OpenAPI schema documents of the current code version under OPENAPI_SCHEMA_ROOT, '
+        'to run on deploy so that no process generates them on a request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-old', action='store_true',
+                            help='Keeps the documents of the other code versions, removed by default.')
+
+    def handle(self, *args, **options):
+        version = code_version()
+        directory = build_schema(version)
+        if not options['keep_old']:
+            for path in schema_root().iterdir():
+                if path.is_dir() and path.name != version and not path.name.startswith('.'):
+                    shutil.rmtree(path, ignore_errors=True)
+        self.stdout.write(f'Built the OpenAPI schema of version {version} in {directory}.')
@@ -0,0 +1,53 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from carbon_usage.aggregations import GROUP_BY_CHOICES
+from carbon_usage.calculator import calculate_emissions
+from carbon_usage.filters import UsageFilter
+from carbon_usage.models import Usage
+
+
+def key_value(value):
+    name, separator, argument = value.partition('=')
+    if not separator:
+        raise ValueError(value)
+    return name, argument
+
+
+class Command(BaseCommand):
+    help = (
+        'Computes the emissions of the usages in NumPy, optionally as if some usage types had other '
+        'factors, and prints the totals as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group-by', choices=GROUP_BY_CHOICES)
+        parser.add_argument('--factor', type=key_value, action='append', default=[], dest='factors',
+                            metavar='USAGE_TYPE=FACTOR', help='Overrides the factor of a usage type, can be repeated.')
+        parser.add_argument('--filter', type=key_value, action='append', default=[], dest='filters',
+                            metavar='NAME=VALUE', help='A /usage filter, for example min_usage_at=2021-01-01, can be repeated.')
+        parser.add_argument('--chunk-size', type=int, help='Usages read at a time.')
+
+    def handle(self, *args, **options):
+        try:
+            factors = {int(pk): float(factor) for pk, factor in options['factors']}
+        except ValueError as error:
+            raise CommandError(f'Invalid factor: {error}')
+
+        filterset = UsageFilter(dict(options['filters']), queryset=Usage.objects.all())
+        if not filterset.is_valid():
+            raise CommandError(f'Invalid filters: {filterset.errors.as_json()}')
+
+        started = time.perf_counter()
+        results = calculate_emissions(
+            filterset.qs, group_by=options['group_by'], factors=factors, chunk_size=options['chunk_size']
+        )
+        self.stdout.write(json.dumps({
+            'group_by': options['group_by'],
+            'factors': factors,
+            'seconds': round(time.perf_counter() - started, 3),
+            'results': results,
+        }, cls=DjangoJSONEncoder, indent=2))
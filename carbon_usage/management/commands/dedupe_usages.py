@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from carbon_usage.ingestion import dedupe_usages
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the usages stored more than once for the same user, usage type and usage_at, keeping '
+        'the first one. Run it before migration 0010_usage_natural_key.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Users whose duplicates are deleted by one short transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only counts the duplicates.')
+
+    def handle(self, *args, **options):
+        deleted = dedupe_usages(chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(f'{verb} {deleted} duplicate usages.')
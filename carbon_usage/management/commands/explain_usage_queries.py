@@ -0,0 +1,106 @@
+import itertools
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from carbon_usage.benchmarks import Rollback, seed_usages
+from carbon_usage.filters import UsageFilter
+from carbon_usage.models import Usage
+from carbon_usage.partitions import is_partitioned, partitions
+
+FILTER_SHAPES = (
+    (),
+    ('user',),
+    ('user', 'min_usage_at', 'max_usage_at'),
+    ('usage_type',),
+    ('usage_type', 'min_usage_at', 'max_usage_at'),
+    ('usage_type', 'min_amount', 'max_amount'),
+    ('user', 'usage_type', 'min_usage_at', 'max_usage_at'),
+    ('min_usage_at', 'max_usage_at'),
+    ('min_emissions', 'max_emissions'),
+)
+
+# The usage list orders by id unless another ordering is requested
+ORDERINGS = ('id', 'usage_at', '-usage_at', 'amount', 'emissions')
+
+FULL_SCAN_PATTERNS = {
+    # The partitions of a partitioned usage table are scanned under their own names
+    'postgresql': re.compile(r'Seq Scan on carbon_usage_usage(_\w+)?\b'),
+    'sqlite': re.compile(r'SCAN (TABLE )?carbon_usage_usage\b(?! USING (COVERING )?INDEX)'),
+}
+
+PARTITION_PATTERN = re.compile(r'\bon (carbon_usage_usage_(?:p\d{4}_\d{2}|default))\b')
+
+SORT_PATTERNS = {
+    'postgresql': re.compile(r'^\s*(->\s*)?Sort\b', re.MULTILINE),
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs EXPLAIN on every supported UsageFilter and ordering combination of the usage list '
+        'and reports the queries that scan the whole usage table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=20000,
+                            help='Usages seeded inside a rolled back transaction before explaining, 0 to use existing data.')
+        parser.add_argument('--limit', type=int, default=20, help='Page size of the explained queries.')
+        parser.add_argument('--fail-on-full-scan', action='store_true',
+                            help='Exit with an error when a query scans the whole table.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                full_scans = self.explain_all(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+        if full_scans and options['fail_on_full_scan']:
+            raise CommandError(f'{len(full_scans)} usage queries scan the whole table: {", ".join(full_scans)}')
+
+    def explain_all(self, options):
+        if options['seed']:
+            seed_usages(options['seed'])
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE carbon_usage_usage')
+
+        sample = Usage.objects.order_by('usage_at').first()
+        if sample is None:
+            raise CommandError('There are no usages to explain, use --seed to create some.')
+        values = {
+            'user': sample.user_id,
+            'usage_type': sample.usage_type_id,
+            'min_usage_at': sample.usage_at.isoformat(),
+            'max_usage_at': Usage.objects.order_by('-usage_at').first().usage_at.isoformat(),
+            'min_amount': 10,
+            'max_amount': 20,
+            'min_emissions': 10,
+            'max_emissions': 20,
+        }
+
+        partition_count = len(partitions(connection)) if is_partitioned(connection) else None
+        full_scans = []
+        for shape, ordering in itertools.product(FILTER_SHAPES, ORDERINGS):
+            queryset = UsageFilter({name: values[name] for name in shape}, queryset=Usage.objects.all()).qs
+            plan = queryset.order_by(ordering)[:options['limit']].explain()
+
+            label = '&'.join([*shape, f'ordering={ordering}'])
+            full_scan = bool(FULL_SCAN_PATTERNS[connection.vendor].search(plan)) if connection.vendor in FULL_SCAN_PATTERNS else False
+            sort = bool(SORT_PATTERNS[connection.vendor].search(plan)) if connection.vendor in SORT_PATTERNS else False
+            # An unfiltered page in primary key order stops reading the table after LIMIT rows
+            if full_scan and (shape or ordering != 'id'):
+                full_scans.append(label)
+
+            status = 'FULL SCAN' if full_scan else 'index'
+            if partition_count is not None:
+                # Partitions pruned at planning time do not appear in the plan
+                status += f', {len(set(PARTITION_PATTERN.findall(plan)))}/{partition_count} partitions'
+            self.stdout.write(f'{label}: {status}{" + sort" if sort else ""}')
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+        return full_scans
@@ -0,0 +1,71 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from carbon_usage.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends concurrent GET requests to a running server and reports the latency percentiles, '
+        'for example to compare DATABASE_CONN_MAX_AGE=0 against persistent or pooled connections.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='URL to request, for example http://0.0.0.0:8000/usage/?limit=20')
+        parser.add_argument('--requests', type=int, default=1000, help='Total number of measured requests.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at the same time.')
+        parser.add_argument('--warmup', type=int, default=0, help='Requests sent before measuring.')
+        parser.add_argument('--token', help='JWT access token sent as a bearer token.')
+        parser.add_argument('--username', help='Obtains a token from /api/token/ of the same server.')
+        parser.add_argument('--password')
+
+    def get_token(self, options):
+        if options['token'] or not options['username']:
+            return options['token']
+        token_url = requests.compat.urljoin(options['url'], '/api/token/')
+        response = requests.post(token_url, data={'username': options['username'], 'password': options['password']})
+        if response.status_code != 200:
+            raise CommandError(f'Could not obtain a token: {response.status_code} {response.text}')
+        return response.json()['access']
+
+    def handle(self, *args, **options):
+        token = self.get_token(options)
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        local = threading.local()
+
+        def send(_):
+            # One keep-alive HTTP session per thread, so only the server side connection handling is measured
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            started = time.perf_counter()
+            try:
+                response = local.session.get(options['url'], headers=headers)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(send, range(options['warmup'])))
+            started = time.perf_counter()
+            results = list(executor.map(send, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, ok in results if ok)
+        self.stdout.write(json.dumps({
+            'url': options['url'],
+            'requests': len(results),
+            'errors': sum(1 for _, ok in results if not ok),
+            'concurrency': options['concurrency'],
+            'requests_per_second': round(len(results) / elapsed, 1) if elapsed else None,
+            **{
+                f'p{int(fraction * 100)}_ms': round(percentile(latencies, fraction) * 1000, 2) if latencies else None
+                for fraction in (0.5, 0.9, 0.99)
+            },
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+        }, indent=2))
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from carbon_usage.archive import archive_usages
+from carbon_usage.partitions import (
+    add_months, create_partition, detach_partition, is_partitioned, month_start, months_between, partition_month,
+    partition_name, partitions
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the monthly partitions of the usage table for the coming months and detaches the '
+        'partitions of old months, on PostgreSQL databases where migration 0008 partitioned it. '
+        'The usages of old months are moved to the usage archives before their partitions are detached.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Months after the current one that must have a partition.')
+        parser.add_argument('--retain-months', type=int,
+                            help='Detaches the partitions of the months before the last RETAIN_MONTHS ones.')
+        parser.add_argument('--archive-schema',
+                            help='Moves the detached partitions to this schema instead of leaving them next to the table.')
+        parser.add_argument('--skip-usage-archive', action='store_true',
+                            help='Detaches old partitions with their usages instead of archiving them first, '
+                                 'they stop counting in every aggregate.')
+        parser.add_argument('--dry-run', action='store_true', help='Only prints what would be done.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not is_partitioned(connection):
+            raise CommandError(f'The usage table of the {options["database"]} database is not partitioned.')
+
+        current_month = month_start(timezone.now())
+        existing = set(partitions(connection))
+        for month in months_between(current_month, add_months(current_month, options['months_ahead'])):
+            name = partition_name(month)
+            if name in existing:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'Would create {name}.')
+                continue
+            moved = create_partition(connection, month)
+            self.stdout.write(f'Created {name}, {moved} rows moved out of the default partition.')
+
+        if options['retain_months'] is None:
+            return
+        oldest_kept = add_months(current_month, -options['retain_months'] + 1)
+        old = [
+            name for name in sorted(existing)
+            if partition_month(name) is not None and partition_month(name) < oldest_kept
+        ]
+        if old and not options['skip_usage_archive']:
+            # Archived usages stay visible to the aggregations and exports, detached rows do not
+            if options['dry_run']:
+                self.stdout.write(f'Would archive the usages of the months before {oldest_kept:%Y-%m}.')
+            else:
+                moved = archive_usages(oldest_kept)
+                self.stdout.write(f'Archived {moved} usages of the months before {oldest_kept:%Y-%m}.')
+        for name in old:
+            archived = f' to the {options["archive_schema"]} schema' if options['archive_schema'] else ''
+            if options['dry_run']:
+                self.stdout.write(f'Would detach {name}{archived}.')
+                continue
+            detach_partition(connection, name, archive_schema=options['archive_schema'])
+            self.stdout.write(f'Detached {name}{archived}.')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from carbon_usage.models import DailyUsageRollup
+from carbon_usage.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily usage rollup table from scratch out of the raw usages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usage-type', type=int, action='append', dest='usage_types',
+                            help='Only rebuild the rollups of this usage type id, can be repeated.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuild_rollups(usage_types=options['usage_types'], batch_size=options['batch_size'])
+        self.stdout.write(f'Rebuilt {DailyUsageRollup.objects.count()} daily usage rollups.')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from carbon_usage.archive import restore_usages
+from carbon_usage.management.commands.archive_usages import parse_month
+
+
+class Command(BaseCommand):
+    help = 'Moves archived usages back from the column files into the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='first', help='First YYYY-MM month to restore.')
+        parser.add_argument('--to', dest='last', help='Last YYYY-MM month to restore.')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only restores the usages of this user id, can be repeated.')
+
+    def handle(self, *args, **options):
+        first = parse_month(options['first']) if options['first'] else None
+        last = parse_month(options['last']) if options['last'] else None
+        restored, dropped = restore_usages(start=first, end=last, users=options['users'])
+        self.stdout.write(f'Restored {restored} archived usages.')
+        if dropped:
+            self.stdout.write(f'Dropped {dropped} archived usages whose natural key is stored again.')
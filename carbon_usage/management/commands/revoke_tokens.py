@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+
+from carbon_usage.authentication import revoke_token, revoke_user
+
+
+class Command(BaseCommand):
+    help = 'Revokes JWTs before they expire, every token issued so far to a user or single tokens.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', default=[], dest='usernames',
+                            help='Revokes every token of the user with this username, can be repeated.')
+        parser.add_argument('--token', action='append', default=[], dest='tokens',
+                            help='Revokes this encoded access or refresh token, can be repeated.')
+
+    def handle(self, *args, **options):
+        if not options['usernames'] and not options['tokens']:
+            raise CommandError('Pass at least one --user or --token.')
+
+        User = get_user_model()
+        for username in options['usernames']:
+            try:
+                user = User.objects.get(**{User.USERNAME_FIELD: username})
+            except User.DoesNotExist:
+                raise CommandError(f'Unknown user: {username}')
+            revoke_user(user.pk)
+            self.stdout.write(f'Revoked the tokens of {username}.')
+
+        for token in options['tokens']:
+            try:
+                token = UntypedToken(token)
+            except TokenError as error:
+                raise CommandError(f'Invalid token: {error}')
+            revoke_token(token)
+            self.stdout.write(f'Revoked the token {token[api_settings.JTI_CLAIM]}.')
@@ -0,0 +1,40 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from carbon_usage.jobs import work
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the queued background jobs, reports and emission recomputes, in a pool of worker '
+        'processes that each claim one job at a time from the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKER_PROCESSES,
+                            help='Worker processes, 1 runs the jobs in this process.')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds a worker waits before polling the queue again while it is empty.')
+        parser.add_argument('--burst', action='store_true', help='Stops once no job is due instead of waiting for more.')
+
+    def handle(self, *args, **options):
+        processes = max(options['processes'], 1)
+        if processes == 1:
+            ran = work(burst=options['burst'], poll_interval=options['poll_interval'])
+        else:
+            # Fresh interpreters set Django up again instead of sharing the connections of this process
+            connections.close_all()
+            with ProcessPoolExecutor(
+                processes, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+            ) as pool:
+                workers = [
+                    pool.submit(work, burst=options['burst'], poll_interval=options['poll_interval'])
+                    for _ in range(processes)
+                ]
+                ran = sum(worker.result() for worker in workers)
+        self.stdout.write(f'Ran {ran} jobs.')
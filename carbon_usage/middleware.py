@@ -0,0 +1,140 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from carbon_usage.instrumentation import REQUEST_SAMPLE_RATE, RequestSample, current_sample, is_sampled, record_request
+from carbon_usage.routers import current_request, pin_to_primary
+
+
+class AsyncCapableMiddleware(ABC):
+    """
+    Base of middleware that serve sync and async requests without a thread switch, like
+    Django's MiddlewareMixin does for process_request and process_response hooks. Subclasses
+    implement both ``call`` and ``__acall__``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Tells Django's handler to await the instance
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.call(request)
+
+    @abstractmethod
+    def call(self, request):
+        """
+        Handles a request of a sync handler.
+        """
+
+    @abstractmethod
+    async def __acall__(self, request):
+        """
+        Handles a request of an async handler.
+        """
+
+
+class StaticFilesMiddleware(AsyncCapableMiddleware, WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware also serving async requests, whitenoise 5 only supports sync ones.
+    """
+
+    def __init__(self, get_response=None):
+        WhiteNoiseMiddleware.__init__(self, get_response, settings=settings)
+        AsyncCapableMiddleware.__init__(self, get_response)
+
+    def call(self, request):
+        return WhiteNoiseMiddleware.__call__(self, request)
+
+    async def __acall__(self, request):
+        response = self.process_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+
+class ReplicaRoutingMiddleware(AsyncCapableMiddleware):
+    """
+    Exposes the current request to PrimaryReplicaRouter and pins the reads of users who just
+    wrote something to the primary database.
+    """
+
+    def call(self, request):
+        token = current_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+        if request.method not in SAFE_METHODS:
+            self.pin_writer(request)
+        return response
+
+    async def __acall__(self, request):
+        # The context variable is copied into the threads running the sync parts of the request
+        token = current_request.set(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+        if request.method not in SAFE_METHODS:
+            await sync_to_async(self.pin_writer)(request)
+        return response
+
+    def pin_writer(self, request):
+        # The REST framework authenticates inside the view and sets the user on the request
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user)
+
+
+class RequestMetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Observes the latency, database queries, serialization time and response size of a
+    ``REQUEST_METRICS_SAMPLE_RATE`` fraction of the requests, by URL name, for /metrics/.
+
+    It goes first in MIDDLEWARE so the latency covers the other middleware.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        REQUEST_SAMPLE_RATE.set(settings.REQUEST_METRICS_SAMPLE_RATE)
+
+    def call(self, request):
+        if not is_sampled():
+            return self.get_response(request)
+
+        sample = RequestSample()
+        token = current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_sample.reset(token)
+        record_request(request, response, sample, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not is_sampled():
+            return await self.get_response(request)
+
+        sample = RequestSample()
+        token = current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_sample.reset(token)
+        record_request(request, response, sample, time.perf_counter() - started)
+        return response
@@ -37,8 +37,9 @@ usage_types = [
 
 def create_usage_types(apps, schema_editor):
     UsageTypes = apps.get_model('carbon_usage', 'UsageTypes')
+    db_alias = schema_editor.connection.alias
     for usage_type in usage_types:
-        UsageTypes.objects.create(**usage_type)
+        UsageTypes.objects.using(db_alias).create(**usage_type)
 
 
 class Migration(migrations.Migration):
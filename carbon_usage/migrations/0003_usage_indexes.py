@@ -0,0 +1,51 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('carbon_usage', '0002_usage_types_inital_data_insertion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usage',
+            index=models.Index(fields=['user', 'usage_at'], name='usage_user_usage_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usage',
+            index=models.Index(fields=['usage_type', 'usage_at'], name='usage_type_usage_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usage',
+            index=models.Index(fields=['user', 'usage_type', 'usage_at'], name='usage_user_type_usage_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usage',
+            index=models.Index(fields=['usage_type', 'amount'], name='usage_type_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usage',
+            index=models.Index(fields=['usage_at', 'id'], name='usage_usage_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usage',
+            index=models.Index(fields=['amount', 'id'], name='usage_amount_id_idx'),
+        ),
+        # The single column foreign key indexes are dropped once the composite indexes exist
+        migrations.AlterField(
+            model_name='usage',
+            name='usage_type',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='carbon_usage.usagetypes'),
+        ),
+        migrations.AlterField(
+            model_name='usage',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
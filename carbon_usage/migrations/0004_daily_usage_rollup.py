@@ -0,0 +1,79 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:53
+
+from datetime import timezone
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Max, Min, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def populate_daily_usage_rollups(apps, schema_editor):
+    Usage = apps.get_model('carbon_usage', 'Usage')
+    DailyUsageRollup = apps.get_model('carbon_usage', 'DailyUsageRollup')
+    db_alias = schema_editor.connection.alias
+    rows = (
+        Usage.objects.using(db_alias).order_by()
+        .annotate(
+            day=TruncDate('usage_at', tzinfo=timezone.utc),
+            row_emissions=ExpressionWrapper(F('amount') * F('usage_type__factor'), output_field=FloatField()),
+        )
+        .values('user', 'usage_type', 'day')
+        .annotate(
+            count=Count('id'),
+            amount=Sum('amount'),
+            emissions=Sum('row_emissions'),
+            min_emissions=Min('row_emissions'),
+            max_emissions=Max('row_emissions'),
+        )
+    )
+    batch = []
+    for row in rows.iterator():
+        batch.append(DailyUsageRollup(
+            user_id=row.pop('user'), usage_type_id=row.pop('usage_type'), **row
+        ))
+        if len(batch) >= 1000:
+            DailyUsageRollup.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    DailyUsageRollup.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('carbon_usage', '0003_usage_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField()),
+                ('amount', models.FloatField()),
+                ('emissions', models.FloatField()),
+                ('min_emissions', models.FloatField()),
+                ('max_emissions', models.FloatField()),
+                ('usage_type', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='carbon_usage.usagetypes')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailyusagerollup',
+            index=models.Index(fields=['usage_type', 'day'], name='daily_rollup_type_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyusagerollup',
+            index=models.Index(fields=['day'], name='daily_rollup_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyusagerollup',
+            constraint=models.UniqueConstraint(fields=('user', 'usage_type', 'day'), name='daily_rollup_user_type_day_uniq'),
+        ),
+        migrations.RunPython(populate_daily_usage_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.2 on 2026-10-18 14:02
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def populate_usage_emissions(apps, schema_editor):
+    Usage = apps.get_model('carbon_usage', 'Usage')
+    UsageTypes = apps.get_model('carbon_usage', 'UsageTypes')
+    factor = UsageTypes.objects.filter(pk=OuterRef('usage_type')).values('factor')[:1]
+    Usage.objects.using(schema_editor.connection.alias).update(emissions=F('amount') * Subquery(factor))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_usage', '0004_daily_usage_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usage',
+            name='emissions',
+            field=models.FloatField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_usage_emissions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='usage',
+            index=models.Index(fields=['emissions', 'id'], name='usage_emissions_id_idx'),
+        ),
+    ]
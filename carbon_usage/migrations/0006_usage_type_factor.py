@@ -0,0 +1,42 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_usage_type_factors(apps, schema_editor):
+    UsageTypes = apps.get_model('carbon_usage', 'UsageTypes')
+    UsageTypeFactor = apps.get_model('carbon_usage', 'UsageTypeFactor')
+    # The current factor of every usage type applies to every usage until a new period is added
+    db_alias = schema_editor.connection.alias
+    UsageTypeFactor.objects.using(db_alias).bulk_create([
+        UsageTypeFactor(usage_type_id=pk, factor=factor)
+        for pk, factor in UsageTypes.objects.using(db_alias).values_list('pk', 'factor')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_usage', '0005_usage_emissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageTypeFactor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('factor', models.FloatField()),
+                ('valid_from', models.DateTimeField(blank=True, null=True)),
+                ('valid_to', models.DateTimeField(blank=True, null=True)),
+                ('usage_type', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='factors', to='carbon_usage.usagetypes')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='usagetypefactor',
+            constraint=models.UniqueConstraint(fields=('usage_type', 'valid_from'), name='usage_type_factor_from_uniq'),
+        ),
+        migrations.RunPython(populate_usage_type_factors, migrations.RunPython.noop),
+    ]
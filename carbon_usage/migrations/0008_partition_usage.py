@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+
+from django.db import migrations
+
+# Months after the current one that get a partition right away, manage_usage_partitions adds later ones
+MONTHS_AHEAD = 3
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def rebuild_usage_table(apps, schema_editor, partitioned):
+    """
+    Replaces the usage table by a copy of it, range partitioned by usage_at month or not.
+
+    A partitioned table needs the partition key in its primary key, so the primary key becomes
+    (id, usage_at) while Django keeps treating id as the primary key.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    Usage = apps.get_model('carbon_usage', 'Usage')
+    table, qn = Usage._meta.db_table, schema_editor.quote_name
+    old_table = f'{table}_old'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('p', 'f')",
+            [table]
+        )
+        constraints = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence, = cursor.fetchone()
+
+        # The index and constraint names are reused by the new table
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(old_table)}')
+        for index in Usage._meta.indexes:
+            cursor.execute(f'DROP INDEX {qn(index.name)}')
+        for name, kind, _ in constraints:
+            cursor.execute(f'ALTER TABLE {qn(old_table)} DROP CONSTRAINT {qn(name)}')
+
+        primary_key = '(id, usage_at)' if partitioned else '(id)'
+        cursor.execute(
+            f'CREATE TABLE {qn(table)} (LIKE {qn(old_table)} INCLUDING DEFAULTS)'
+            f'{" PARTITION BY RANGE (usage_at)" if partitioned else ""}'
+        )
+        for name, kind, definition in constraints:
+            definition = f'PRIMARY KEY {primary_key}' if kind == 'p' else definition
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+
+        if partitioned:
+            # The months of the existing usages and the coming ones, rows of other months go to the default partition
+            cursor.execute(f"SELECT DISTINCT date_trunc('month', usage_at AT TIME ZONE 'UTC') FROM {qn(old_table)}")
+            months = {month.replace(tzinfo=timezone.utc) for month, in cursor.fetchall()}
+            now = datetime.now(timezone.utc)
+            months.update(add_months(now, offset) for offset in range(MONTHS_AHEAD + 1))
+            for month in sorted(months):
+                cursor.execute(
+                    f'CREATE TABLE {qn(f"{table}_p{month.year:04d}_{month.month:02d}")} PARTITION OF {qn(table)} '
+                    f'FOR VALUES FROM (%s) TO (%s)',
+                    [month, add_months(month, 1)]
+                )
+            cursor.execute(f'CREATE TABLE {qn(f"{table}_default")} PARTITION OF {qn(table)} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {qn(table)} SELECT * FROM {qn(old_table)}')
+        if sequence:
+            # Dropping the old table would drop the sequence it owns, and with it the default of id
+            cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id')
+        cursor.execute(f'DROP TABLE {qn(old_table)}')
+
+    for index in Usage._meta.indexes:
+        schema_editor.add_index(Usage, index)
+
+
+def partition_usage_table(apps, schema_editor):
+    rebuild_usage_table(apps, schema_editor, partitioned=True)
+
+
+def unpartition_usage_table(apps, schema_editor):
+    rebuild_usage_table(apps, schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_usage', '0007_revoked_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_usage_table, unpartition_usage_table),
+    ]
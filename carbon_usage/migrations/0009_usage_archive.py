@@ -0,0 +1,36 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('carbon_usage', '0008_partition_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('month', models.DateField()),
+                ('path', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField()),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='usagearchive',
+            index=models.Index(fields=['month'], name='usage_archive_month_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='usagearchive',
+            constraint=models.UniqueConstraint(fields=('user', 'month'), name='usage_archive_user_month_uniq'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:52
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    Usage = apps.get_model('carbon_usage', 'Usage')
+    duplicates = (
+        Usage.objects.using(schema_editor.connection.alias).order_by()
+        .values('user', 'usage_type', 'usage_at').annotate(count=Count('id')).filter(count__gt=1)
+    )
+    if duplicates.exists():
+        raise RuntimeError(
+            'Usages share the same user, usage type and usage_at, run "manage.py dedupe_usages" before this migration.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_usage', '0009_usage_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='usage',
+            name='usage_user_type_usage_at_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='usage',
+            constraint=models.UniqueConstraint(fields=('user', 'usage_type', 'usage_at'), name='usage_natural_key_uniq'),
+        ),
+    ]
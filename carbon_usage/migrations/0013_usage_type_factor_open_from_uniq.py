@@ -0,0 +1,17 @@
+# Generated by Django 4.0.2 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_usage', '0012_job_status_updated_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='usagetypefactor',
+            constraint=models.UniqueConstraint(condition=models.Q(('valid_from__isnull', True)), fields=('usage_type',), name='usage_type_factor_open_from_uniq'),
+        ),
+    ]
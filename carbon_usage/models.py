@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 from PlanetlyProject.settings.base import DEFAULT_MAX_LENGTH
 
@@ -13,13 +14,166 @@ class AbstractBaseModel(models.Model):
 
 
 class Usage(AbstractBaseModel):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    usage_type = models.ForeignKey("UsageTypes", on_delete=models.CASCADE)
+    # On PostgreSQL the table is partitioned by usage_at month with an (id, usage_at) primary key,
+    # see carbon_usage.partitions
+    # The foreign keys are covered by the leading columns of the composite indexes below
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
+    usage_type = models.ForeignKey("UsageTypes", on_delete=models.CASCADE, db_index=False)
     usage_at = models.DateTimeField()
     amount = models.FloatField()
+    # amount * the usage type factor effective at usage_at, recomputed in the background when it changes
+    emissions = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # The natural key of a meter reading, retried ingestions find the rows they already wrote.
+            # Its index also serves the queries filtering on user, usage type and usage_at
+            models.UniqueConstraint(fields=['user', 'usage_type', 'usage_at'], name='usage_natural_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'usage_at'], name='usage_user_usage_at_idx'),
+            models.Index(fields=['usage_type', 'usage_at'], name='usage_type_usage_at_idx'),
+            models.Index(fields=['usage_type', 'amount'], name='usage_type_amount_idx'),
+            models.Index(fields=['usage_at', 'id'], name='usage_usage_at_id_idx'),
+            models.Index(fields=['amount', 'id'], name='usage_amount_id_idx'),
+            models.Index(fields=['emissions', 'id'], name='usage_emissions_id_idx'),
+        ]
+
+    def compute_emissions(self):
+        # The UsageTypes cache module imports this one
+        from carbon_usage.cache import usage_types_cache
+
+        factor = usage_types_cache.factor_at(self.usage_type_id, self.usage_at)
+        if factor is None:
+            factor = self.usage_type.factor
+        return self.amount * factor
+
+    def save(self, *args, **kwargs):
+        self.emissions = self.compute_emissions()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'emissions' not in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'emissions'}
+        super().save(*args, **kwargs)
 
 
 class UsageTypes(AbstractBaseModel):
     name = models.CharField(max_length=DEFAULT_MAX_LENGTH)
     unit = models.CharField(max_length=15)
+    # The factor effective now, the factors of other periods are kept in UsageTypeFactor
     factor = models.FloatField()
+
+
+class UsageTypeFactor(AbstractBaseModel):
+    """
+    The factor of a usage type over the ``[valid_from, valid_to)`` interval of usage_at.
+
+    The intervals of a usage type are contiguous and do not overlap, a null valid_from or
+    valid_to leaves the interval open on that side.
+    """
+    usage_type = models.ForeignKey("UsageTypes", on_delete=models.CASCADE, related_name='factors', db_index=False)
+    factor = models.FloatField()
+    valid_from = models.DateTimeField(null=True, blank=True)
+    valid_to = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usage_type', 'valid_from'], name='usage_type_factor_from_uniq'),
+            # Nulls are distinct in the constraint above, a usage type has a single open start
+            models.UniqueConstraint(
+                fields=['usage_type'], condition=models.Q(valid_from__isnull=True), name='usage_type_factor_open_from_uniq'
+            ),
+        ]
+
+
+class DailyUsageRollup(AbstractBaseModel):
+    """
+    Usage totals of a user and usage type over one UTC day, kept in sync by carbon_usage.rollups.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
+    usage_type = models.ForeignKey("UsageTypes", on_delete=models.CASCADE, db_index=False)
+    day = models.DateField()
+    count = models.PositiveIntegerField()
+    amount = models.FloatField()
+    emissions = models.FloatField()
+    min_emissions = models.FloatField()
+    max_emissions = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'usage_type', 'day'], name='daily_rollup_user_type_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['usage_type', 'day'], name='daily_rollup_type_day_idx'),
+            models.Index(fields=['day'], name='daily_rollup_day_idx'),
+        ]
+
+
+class RevokedToken(AbstractBaseModel):
+    """
+    A revoked JWT, or with a null jti every token of the user issued up to created_at.
+
+    The user is not a foreign key so that the tokens of deleted users stay revoked. Rows are
+    ignored once expires_at has passed, the revoked tokens have expired by then.
+    """
+    jti = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    user_id = models.BigIntegerField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='revoked_token_expires_at_idx'),
+        ]
+
+
+class UsageArchive(AbstractBaseModel):
+    """
+    The usages of a user over one UTC month of usage_at, moved out of the usage table into the
+    archive file at ``path`` by carbon_usage.archive.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
+    month = models.DateField()
+    path = models.CharField(max_length=255)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='usage_archive_user_month_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['month'], name='usage_archive_month_idx'),
+        ]
+
+
+class Job(AbstractBaseModel):
+    """
+    A unit of background work of a given kind, queued in the database and run by the run_jobs
+    workers, see carbon_usage.jobs.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(status, status) for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)]
+
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # The user who submitted a report, null for internal jobs like emission recomputes
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, db_index=False)
+    parameters = models.JSONField(default=dict)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Path of the result file relative to JOB_RESULTS_ROOT
+    result_path = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Only the queued jobs are read by the workers polling the queue
+            models.Index(fields=['run_after', 'id'], name='job_queued_idx', condition=models.Q(status='queued')),
+            # Running jobs are found stale by the updated_at their worker's heartbeat bumps
+            models.Index(fields=['status', 'updated_at'], name='job_status_updated_at_idx'),
+            models.Index(fields=['user', 'id'], name='job_user_id_idx'),
+            models.Index(fields=['finished_at'], name='job_finished_at_idx'),
+        ]
@@ -0,0 +1,154 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetOrLimitOffsetPagination(LimitOffsetPagination):
+    """
+    A limit/offset pagination that switches to keyset pagination on request. For example:
+
+    http://api.example.org/usage/?pagination=keyset&limit=100
+
+    The following pages are requested through the opaque ``cursor`` of the ``next`` link.
+    Keyset pages are read with a ``WHERE (ordering) > (last row)`` condition instead of an
+    OFFSET and skip the COUNT query, so their latency does not depend on the page depth.
+    The ordering follows the ``ordering`` query parameter, or else the view ``keyset_ordering``,
+    and always ends with ``id`` to make it total.
+    """
+    mode_query_param = 'pagination'
+    keyset_mode = 'keyset'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    # Row count of the queryset when the view already knows it, saving the COUNT query
+    count_hint = None
+
+    def uses_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == self.keyset_mode
+            or self.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.uses_keyset(request)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        self.request = request
+        self.ordering = self.get_keyset_ordering(request, queryset, view)
+        queryset = queryset.order_by(*self.ordering)
+
+        # .values() rows need the ordering columns to compute the next position, even hidden ones
+        hidden = []
+        if queryset._fields:
+            hidden = [field.lstrip('-') for field in self.ordering if field.lstrip('-') not in queryset._fields]
+            if hidden:
+                queryset = queryset.values(*queryset._fields, *hidden)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_condition(queryset.model, position))
+
+        results = list(queryset[:self.limit + 1])
+        self.has_next = len(results) > self.limit
+        results = results[:self.limit]
+        self.next_position = self.get_position(results[-1]) if self.has_next else None
+        if hidden:
+            results = [{name: value for name, value in row.items() if name not in hidden} for row in results]
+        return results
+
+    def get_count(self, queryset):
+        if self.count_hint is not None:
+            return self.count_hint
+        return super().get_count(queryset)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_keyset_ordering(self, request, queryset, view):
+        ordering = None
+        if OrderingFilter.ordering_param in request.query_params:
+            ordering = OrderingFilter().get_ordering(request, queryset, view)
+        if not ordering:
+            ordering = (getattr(view, 'keyset_ordering', 'id'),)
+
+        ordering = [field for field in ordering if field.lstrip('-') != 'pk']
+        if not any(field.lstrip('-') == 'id' for field in ordering):
+            ordering.append('id')
+        return ordering
+
+    def get_keyset_condition(self, model, position):
+        """
+        Builds the lexicographic ``(ordering) > (position)`` condition, honouring descending fields.
+        """
+        try:
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            field_condition = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(self.ordering[:index], position[:index]):
+                field_condition &= Q(**{previous.lstrip('-'): value})
+            condition |= field_condition
+        return condition
+
+    def get_position(self, row):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if isinstance(row, dict):
+                value = row[name]
+            else:
+                value = getattr(row, row._meta.get_field(name).attname)
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return position
+
+    def encode_cursor(self, position):
+        data = json.dumps({'o': self.ordering, 'p': position}, separators=(',', ':'))
+        return urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            data = json.loads(urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            ordering, position = data['o'], data['p']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if ordering != self.ordering or len(position) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
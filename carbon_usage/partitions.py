@@ -0,0 +1,119 @@
+"""
+Monthly range partitions of the usage table on PostgreSQL, see migration 0008_partition_usage.
+
+Every partition holds the usages of one UTC month of usage_at and is named after it, for example
+``carbon_usage_usage_p2021_03``. Rows outside of every monthly partition land in the default
+partition, they are moved out when their month gets a partition. Other databases keep the
+usage table unpartitioned.
+"""
+import re
+from datetime import datetime, timezone
+
+from django.db import transaction
+
+from carbon_usage.conditional import mark_deleted
+from carbon_usage.models import DailyUsageRollup, Usage
+
+TABLE = Usage._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(value):
+    """
+    Returns the first instant of the UTC month of a datetime or date.
+    """
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def months_between(first, last):
+    """
+    Yields the start of every month from the month of ``first`` to the month of ``last`` included.
+    """
+    month, last = month_start(first), month_start(last)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month.year:04d}_{month.month:02d}'
+
+
+def partition_month(name):
+    """
+    Returns the month of a monthly partition name, or None for other tables.
+    """
+    match = PARTITION_NAME.match(name)
+    return datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc) if match else None
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def partitions(connection):
+    """
+    Returns the names of the partitions attached to the usage table.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = to_regclass(%s) ORDER BY child.relname',
+            [TABLE]
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def create_partition(connection, month):
+    """
+    Creates the partition of a month, moving its rows out of the default partition first.
+
+    The partition is filled while it is still a standalone table, attaching it afterwards only
+    checks that the default partition has no more rows of that month.
+    """
+    name, qn = partition_name(month), connection.ops.quote_name
+    bounds = [month, add_months(month, 1)]
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {qn(DEFAULT_PARTITION)} WHERE usage_at >= %s AND usage_at < %s RETURNING *) '
+            f'INSERT INTO {qn(name)} SELECT * FROM moved',
+            bounds
+        )
+        moved = cursor.rowcount
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)', bounds)
+    return moved
+
+
+def detach_partition(connection, name, archive_schema=None):
+    """
+    Detaches a partition from the usage table, its rows stop being visible to every query. The
+    rollups of its month are deleted in the same transaction, so that the aggregates answered from
+    them stop counting its rows too.
+
+    With an ``archive_schema``, the detached table is moved to that schema, created when missing.
+    """
+    qn = connection.ops.quote_name
+    month = partition_month(name)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}')
+        if archive_schema:
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {qn(archive_schema)}')
+            cursor.execute(f'ALTER TABLE {qn(name)} SET SCHEMA {qn(archive_schema)}')
+        DailyUsageRollup.objects.using(connection.alias).filter(
+            day__gte=month.date(), day__lt=add_months(month, 1).date()
+        ).delete()
+        mark_deleted(Usage)
@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+from carbon_usage import metrics
+
+POOL_CHECKOUTS = metrics.counter(
+    'db_pool_checkouts_total', 'Connections handed out by the database connection pool.', ('alias',)
+)
+POOL_WAITS = metrics.counter(
+    'db_pool_waits_total', 'Checkouts that had to wait for a connection to be returned.', ('alias',)
+)
+POOL_WAIT_SECONDS = metrics.histogram(
+    'db_pool_wait_seconds', 'Time checkouts waited for a connection to be returned.', ('alias',)
+)
+POOL_CONNECTION_AGE_SECONDS = metrics.histogram(
+    'db_pool_connection_age_seconds', 'Age of the connections handed out by the pool.', ('alias',),
+    buckets=(1, 10, 30, 60, 300, 600, 1800, 3600),
+)
+POOL_DISCARDS = metrics.counter(
+    'db_pool_discards_total', 'Pooled connections closed because they were too old or unusable.', ('alias', 'reason')
+)
+POOL_IN_USE = metrics.gauge('db_pool_connections_in_use', 'Connections currently checked out.', ('alias',))
+POOL_IDLE = metrics.gauge('db_pool_connections_idle', 'Connections waiting in the pool.', ('alias',))
+CONNECTIONS_OPENED = metrics.counter(
+    'db_connections_opened_total', 'New database connections opened, with their network and authentication cost.',
+    ('alias',)
+)
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """
+    A thread safe pool of at most ``max_size`` open database connections.
+
+    ``connect`` opens a new connection, ``is_usable`` tells whether an idle connection still works
+    and ``reset`` prepares a returned connection for its next user. Idle connections older than
+    ``max_age`` seconds are replaced instead of being handed out.
+    """
+
+    def __init__(self, alias, connect, max_size, timeout=5, max_age=None, is_usable=None, reset=None, close=None):
+        self.alias = alias
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.is_usable = is_usable or (lambda connection: True)
+        self.reset = reset or (lambda connection: None)
+        self.close = close or (lambda connection: connection.close())
+        self._condition = threading.Condition()
+        self._idle = deque()
+        self._opened_at = {}
+        self._size = 0
+
+    def _discard(self, connection, reason):
+        POOL_DISCARDS.inc(alias=self.alias, reason=reason)
+        self._opened_at.pop(id(connection), None)
+        self._size -= 1
+        try:
+            self.close(connection)
+        except Exception:
+            pass
+
+    def _update_gauges(self):
+        POOL_IDLE.set(len(self._idle), alias=self.alias)
+        POOL_IN_USE.set(self._size - len(self._idle), alias=self.alias)
+
+    def checkout(self):
+        """
+        Returns an open connection, waiting at most ``timeout`` seconds for one to be returned
+        when ``max_size`` connections are already in use.
+        """
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self._condition:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = self.timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f'No connection of the {self.alias} database pool was returned within {self.timeout} seconds.'
+                        )
+                    waited = True
+                    self._condition.wait(remaining)
+
+                if not self._idle:
+                    self._size += 1
+                    break
+                connection = self._idle.pop()
+                age = time.monotonic() - self._opened_at[id(connection)]
+
+            # Checked outside of the lock, the health check is a round trip to the database
+            reason = None
+            if self.max_age is not None and age > self.max_age:
+                reason = 'max_age'
+            elif not self.is_usable(connection):
+                reason = 'unusable'
+            with self._condition:
+                if reason is None:
+                    return self._handed_out(connection, age, started, waited)
+                self._discard(connection, reason)
+                self._condition.notify()
+
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        CONNECTIONS_OPENED.inc(alias=self.alias)
+        with self._condition:
+            self._opened_at[id(connection)] = time.monotonic()
+            return self._handed_out(connection, 0, started, waited)
+
+    def _handed_out(self, connection, age, started, waited):
+        POOL_CHECKOUTS.inc(alias=self.alias)
+        POOL_CONNECTION_AGE_SECONDS.observe(age, alias=self.alias)
+        if waited:
+            POOL_WAITS.inc(alias=self.alias)
+            POOL_WAIT_SECONDS.observe(time.monotonic() - started, alias=self.alias)
+        self._update_gauges()
+        return connection
+
+    def checkin(self, connection, discard=False):
+        """
+        Returns a connection to the pool, closing it instead when it is broken or ``discard`` is set.
+        """
+        if not discard:
+            try:
+                self.reset(connection)
+            except Exception:
+                discard = True
+
+        with self._condition:
+            if discard:
+                self._discard(connection, 'broken')
+            else:
+                self._idle.append(connection)
+            self._update_gauges()
+            self._condition.notify()
+
+    def close_all(self):
+        with self._condition:
+            while self._idle:
+                self._discard(self._idle.pop(), 'closed')
+            self._update_gauges()
@@ -0,0 +1,37 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from carbon_usage.instrumentation import timed_serialization
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    A JSONRenderer encoding compact responses with orjson when it is installed.
+
+    The output matches the REST framework renderer except for floats: orjson writes exponents
+    without sign or padding (``1e16`` for ``1e+16``) and NaN and infinities as ``null`` where
+    the REST framework renderer raises. Pretty printed responses and environments without
+    orjson fall back to it.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed_serialization():
+            return self.encode(data, accepted_media_type, renderer_context)
+
+    def encode(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+        )
+        # Escaped like the REST framework renderer does to keep the output a strict javascript subset
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
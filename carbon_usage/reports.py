@@ -0,0 +1,82 @@
+"""
+Reports over the usages matching UsageFilter parameters, too slow for a request and computed
+by the job workers instead. Every report is written to a file under JOB_RESULTS_ROOT.
+"""
+from itertools import chain
+
+from django.conf import settings
+
+from carbon_usage.aggregations import aggregate_filtered_emissions
+from carbon_usage.archive import archived_export_rows
+from carbon_usage.exports import CONTENT_TYPES, EXPORT_FORMATS, export_rows
+from carbon_usage.filters import UsageFilter
+from carbon_usage.jobs import handler, job_directory, results_root
+from carbon_usage.models import Usage
+from carbon_usage.renderers import FastJSONRenderer
+
+REPORT_KINDS = ('export', 'emissions')
+
+RESULT_CONTENT_TYPES = {
+    **CONTENT_TYPES,
+    'json': 'application/json',
+}
+
+
+def usage_filterset(filters):
+    """
+    Returns the UsageFilter of the given parameters, raising ValueError when they are invalid.
+    """
+    filterset = UsageFilter(filters, queryset=Usage.objects.all())
+    if not filterset.is_valid():
+        raise ValueError(dict(filterset.errors))
+    return filterset
+
+
+def usage_export_rows(queryset, filters):
+    """
+    Yields the exported columns of the archived usages matching the given UsageFilter cleaned data,
+    then those of the queryset. Archived usages are older than those of the usage table.
+    """
+    return chain(
+        archived_export_rows(filters),
+        export_rows(queryset, settings.USAGE_EXPORT_CHUNK_SIZE),
+    )
+
+
+def result_path(job, extension):
+    """
+    Returns the path of the result file of a job relative to JOB_RESULTS_ROOT, creating its directory.
+    """
+    path = job_directory(job) / f'{job.kind}.{extension}'
+    (results_root() / path).parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+@handler('export')
+def export_report(job):
+    """
+    Writes every filtered usage with its emissions as CSV or newline delimited JSON.
+    """
+    filterset = usage_filterset(job.parameters['filters'])
+    export_format = job.parameters['export_format']
+    rows = usage_export_rows(filterset.qs.order_by('id'), filterset.form.cleaned_data)
+    path = result_path(job, export_format)
+    with open(results_root() / path, 'w', newline='') as output:
+        output.writelines(EXPORT_FORMATS[export_format](rows))
+    return str(path)
+
+
+@handler('emissions')
+def emissions_report(job):
+    """
+    Writes the emissions aggregation of the filtered usages, as returned by the emissions endpoint.
+    """
+    filterset = usage_filterset(job.parameters['filters'])
+    group_by = job.parameters.get('group_by')
+    report = {
+        'group_by': group_by,
+        'results': aggregate_filtered_emissions(filterset.qs, filterset.form.cleaned_data, group_by=group_by),
+    }
+    path = result_path(job, 'json')
+    (results_root() / path).write_bytes(FastJSONRenderer().render(report))
+    return str(path)
@@ -0,0 +1,155 @@
+import hashlib
+from collections import defaultdict
+from datetime import timedelta, timezone
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+
+from carbon_usage.aggregations import day_start, emissions_expression
+from carbon_usage.models import DailyUsageRollup, Usage
+
+REFRESH_CHUNK_SIZE = 500
+
+
+def rollup_key(usage):
+    """
+    Returns the (user id, usage type id, UTC day) rollup row a Usage instance is counted in.
+    """
+    return usage.user_id, usage.usage_type_id, usage.usage_at.astimezone(timezone.utc).date()
+
+
+def daily_totals(queryset):
+    """
+    Groups the given Usage queryset into the rows of the rollup table.
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(day=TruncDate('usage_at', tzinfo=timezone.utc), row_emissions=emissions_expression())
+        .values('user', 'usage_type', 'day')
+        .annotate(
+            count=Count('id'),
+            amount=Sum('amount'),
+            emissions=Sum('row_emissions'),
+            min_emissions=Min('row_emissions'),
+            max_emissions=Max('row_emissions'),
+        )
+    )
+    for row in rows.iterator():
+        yield DailyUsageRollup(
+            user_id=row['user'],
+            usage_type_id=row['usage_type'],
+            day=row['day'],
+            count=row['count'],
+            amount=row['amount'],
+            emissions=row['emissions'],
+            min_emissions=row['min_emissions'],
+            max_emissions=row['max_emissions'],
+        )
+
+
+def _replace(rollups, usages, batch_size):
+    rollups.delete()
+    batch = []
+    for rollup in daily_totals(usages):
+        batch.append(rollup)
+        if len(batch) >= batch_size:
+            DailyUsageRollup.objects.bulk_create(batch)
+            batch = []
+    DailyUsageRollup.objects.bulk_create(batch)
+
+
+def _lock_id(*parts):
+    return int.from_bytes(hashlib.blake2b(repr(parts).encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+def lock_rollups(keys=(), usage_types=(), exclusive_usage_types=False, everything=False):
+    """
+    Takes the transaction scoped PostgreSQL advisory locks of rollup rows before they are recomputed.
+
+    Refreshes lock the whole table and their usage types shared, then their keys exclusively.
+    Rebuilds lock their usage types, or the whole table, exclusively. Locks are always taken in
+    that order and sorted, so two transactions never wait for each other in a cycle. Other
+    databases serialize writing transactions by themselves.
+    """
+    connection = connections[router.db_for_write(DailyUsageRollup)]
+    if connection.vendor != 'postgresql':
+        return
+    shared = sorted({_lock_id('usage_type', usage_type_id) for usage_type_id in usage_types})
+    exclusive = sorted({_lock_id('key', *key) for key in keys})
+    if exclusive_usage_types:
+        shared, exclusive = [], shared
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT pg_advisory_xact_lock{"" if everything else "_shared"}(%s)', [_lock_id('all')]
+        )
+        for function, ids in (('pg_advisory_xact_lock_shared', shared), ('pg_advisory_xact_lock', exclusive)):
+            if ids:
+                cursor.execute(
+                    f'SELECT {function}(id) FROM (SELECT unnest(%s::bigint[]) AS id ORDER BY 1) AS ids', [ids]
+                )
+
+
+def _day_runs(days):
+    """
+    Groups sorted days into (first, last) runs of consecutive days.
+    """
+    runs = []
+    for day in days:
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def _key_conditions(keys):
+    """
+    Returns the conditions matching exactly the rollup rows of the given keys and their usages.
+    """
+    days = defaultdict(set)
+    for user_id, usage_type_id, day in keys:
+        days[user_id, usage_type_id].add(day)
+
+    rollups, usages = Q(), Q()
+    for (user_id, usage_type_id), pair_days in sorted(days.items()):
+        pair_days = sorted(pair_days)
+        rollups |= Q(user=user_id, usage_type=usage_type_id, day__in=pair_days)
+        ranges = Q()
+        for first, last in _day_runs(pair_days):
+            ranges |= Q(usage_at__gte=day_start(first), usage_at__lt=day_start(last + timedelta(days=1)))
+        usages |= Q(user=user_id, usage_type=usage_type_id) & ranges
+    return rollups, usages
+
+
+def refresh_rollups(keys, batch_size=1000):
+    """
+    Recomputes the rollup rows of the given (user id, usage type id, day) keys from the raw usages.
+
+    The keys are locked first, so that concurrent writes of the same keys recompute them one
+    after the other. Keys are then processed in chunks, every chunk recomputing exactly its keys
+    with one grouped query.
+    """
+    keys = sorted(set(keys), key=lambda key: (key[2], key[0], key[1]))
+    if not keys:
+        return
+    with transaction.atomic():
+        lock_rollups(keys, usage_types={usage_type_id for _, usage_type_id, _ in keys})
+        for start in range(0, len(keys), REFRESH_CHUNK_SIZE):
+            rollups, usages = _key_conditions(keys[start:start + REFRESH_CHUNK_SIZE])
+            _replace(DailyUsageRollup.objects.filter(rollups), Usage.objects.filter(usages), batch_size)
+
+
+def rebuild_rollups(usage_types=None, batch_size=1000):
+    """
+    Rebuilds the whole rollup table, or the rows of the given usage types, from the raw usages.
+    """
+    rollups = DailyUsageRollup.objects.all()
+    usages = Usage.objects.all()
+    if usage_types is not None:
+        rollups = rollups.filter(usage_type__in=usage_types)
+        usages = usages.filter(usage_type__in=usage_types)
+
+    with transaction.atomic():
+        lock_rollups(usage_types=usage_types or (), exclusive_usage_types=True, everything=usage_types is None)
+        _replace(rollups, usages, batch_size)
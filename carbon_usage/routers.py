@@ -0,0 +1,73 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# The request being handled by the current thread or task, set by ReplicaRoutingMiddleware
+current_request = ContextVar('carbon_usage_current_request', default=None)
+
+ROUTED_APP_LABELS = ('carbon_usage',)
+
+
+def _pin_key(user_id):
+    return f'carbon_usage:replica:pinned:{user_id}'
+
+
+def pin_to_primary(user):
+    """
+    Sends the reads of the given user to the primary database for ``REPLICA_STICKY_SECONDS``,
+    so they see their own writes before the replicas catch up.
+    """
+    caches[settings.REPLICA_PIN_CACHE].set(_pin_key(user.pk), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return bool(caches[settings.REPLICA_PIN_CACHE].get(_pin_key(user.pk)))
+
+
+def reads_from_replica(request):
+    """
+    Tells whether the reads of a request may be served by a replica: it must use a safe method
+    and its user must not have written during the last ``REPLICA_STICKY_SECONDS``.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return False
+
+    decision = getattr(request, '_carbon_usage_replica', None)
+    if decision is not None:
+        return decision
+
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        # Not authenticated yet, decide again once the view has authenticated the request
+        return True
+    request._carbon_usage_replica = not is_pinned_to_primary(user)
+    return request._carbon_usage_replica
+
+
+class PrimaryReplicaRouter:
+    """
+    Routes the reads of carbon_usage models made while handling a safe request to one of the
+    ``DATABASE_REPLICAS`` aliases, every other query goes to the primary database.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or model._meta.app_label not in ROUTED_APP_LABELS:
+            return None
+        if reads_from_replica(current_request.get()):
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in ROUTED_APP_LABELS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,166 @@
+"""
+The OpenAPI schema of the API, generated by drf_yasg once per code version instead of on every
+documentation request.
+
+The ``build_openapi_schema`` command writes the JSON and YAML documents, with gzipped copies, to
+``OPENAPI_SCHEMA_ROOT/<code version>/``. Processes serving the documentation load the documents
+of the current code version once and keep them in memory, building them first when a deployment
+skipped the command. drf_yasg is only imported to build the schema and render the UI pages, so
+processes that never serve the documentation do not load it.
+"""
+import gzip
+import hashlib
+import logging
+import shutil
+import threading
+import uuid
+from importlib import metadata
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Formats of the schema URL and the media types they are served as
+FORMATS = {
+    '.json': 'application/json',
+    '.yaml': 'application/yaml',
+}
+
+INFO = {
+    'title': 'Documentation',
+    'default_version': 'v1',
+    'description': 'Planetly documentation',
+    'terms_of_service': 'https://www.google.com/policies/terms/',
+}
+
+# Libraries whose version changes the generated schema along with the project sources
+SCHEMA_LIBRARIES = ('Django', 'djangorestframework', 'django-filter', 'drf-yasg')
+
+_documents = None
+_lock = threading.Lock()
+
+
+class SchemaDocument:
+    """
+    A schema document and its gzipped copy, with their strong ETags.
+    """
+
+    def __init__(self, content, gzipped):
+        self.content = content
+        self.gzipped = gzipped
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+
+
+def schema_root():
+    return Path(settings.OPENAPI_SCHEMA_ROOT)
+
+
+def code_version():
+    """
+    Returns APP_VERSION when the deployment sets it, or else a digest of the project sources and
+    of the versions of the libraries generating the schema.
+    """
+    if settings.APP_VERSION:
+        return str(settings.APP_VERSION)
+
+    digest = hashlib.sha256()
+    for library in SCHEMA_LIBRARIES:
+        digest.update(f'{library}=={metadata.version(library)}\n'.encode())
+    project_root = Path(settings.BASE_DIR).parent
+    for package in (Path(settings.BASE_DIR), Path(__file__).resolve().parent):
+        for path in sorted(package.rglob('*.py')):
+            if 'tests' not in path.relative_to(package).parts:
+                digest.update(str(path.relative_to(project_root)).encode())
+                digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def api_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(**INFO, license=openapi.License(name='BSD License'))
+
+
+def generate_schema():
+    """
+    Generates the public schema of every endpoint, returning its encoded documents by format.
+    """
+    from drf_yasg.app_settings import swagger_settings
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+
+    generator = swagger_settings.DEFAULT_GENERATOR_CLASS(api_info())
+    schema = generator.get_schema(request=None, public=True)
+    return {'.json': OpenAPICodecJson([]).encode(schema), '.yaml': OpenAPICodecYaml([]).encode(schema)}
+
+
+def write_schema(version, documents):
+    """
+    Writes the documents of a code version to a new directory swapped in once complete, keeping the
+    directory of another process that got there first.
+    """
+    target = schema_root() / version
+    partial = schema_root() / f'.{version}-{uuid.uuid4().hex}'
+    partial.mkdir(parents=True)
+    for format, content in documents.items():
+        (partial / f'swagger{format}').write_bytes(content)
+        # Without a timestamp, builds of the same schema are identical
+        (partial / f'swagger{format}.gz').write_bytes(gzip.compress(content, mtime=0))
+    try:
+        partial.rename(target)
+    except OSError:
+        shutil.rmtree(partial, ignore_errors=True)
+    return target
+
+
+def build_schema(version=None):
+    """
+    Builds the schema documents of a code version, the current one by default, and returns their directory.
+    """
+    version = version or code_version()
+    shutil.rmtree(schema_root() / version, ignore_errors=True)
+    return write_schema(version, generate_schema())
+
+
+def read_schema(directory):
+    return {
+        format: SchemaDocument((directory / f'swagger{format}').read_bytes(), (directory / f'swagger{format}.gz').read_bytes())
+        for format in FORMATS
+    }
+
+
+def load_schema(version):
+    """
+    Reads the documents of a code version, building them when they are missing.
+    """
+    directory = schema_root() / version
+    if not directory.is_dir():
+        documents = generate_schema()
+        try:
+            directory = write_schema(version, documents)
+        except OSError:
+            # Read-only deployments still serve the schema, built by every process
+            logger.warning('Could not write the OpenAPI schema to %s', schema_root(), exc_info=True)
+            return {
+                format: SchemaDocument(content, gzip.compress(content, mtime=0)) for format, content in documents.items()
+            }
+    return read_schema(directory)
+
+
+def schema_documents():
+    """
+    Returns the SchemaDocument of every format for the current code version, loaded once per process.
+    """
+    global _documents
+    if _documents is None:
+        with _lock:
+            if _documents is None:
+                _documents = load_schema(code_version())
+    return _documents
+
+
+def clear_schema_documents():
+    global _documents
+    _documents = None
@@ -1,15 +1,185 @@
+try:
+    import zoneinfo
+except ImportError:
+    # Python 3.8, see requirements.txt
+    from backports import zoneinfo
+
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+
+from carbon_usage.aggregations import GROUP_BY_CHOICES
+from carbon_usage.cache import usage_types_cache
+from carbon_usage.exports import EXPORT_FORMATS
+from carbon_usage.filters import UsageFilter
+from carbon_usage.histograms import INTERVALS
+from carbon_usage.instrumentation import timed_serialization
+from carbon_usage.models import Job, Usage, UsageTypeFactor, UsageTypes
+from carbon_usage.reports import REPORT_KINDS
+
+
+class CachedUsageTypeField(serializers.PrimaryKeyRelatedField):
+    """
+    A usage type primary key field validated against the UsageTypes cache instead of the database.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            usage_type = usage_types_cache.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if usage_type is None:
+            self.fail('does_not_exist', pk_value=data)
+        return usage_type
 
-from carbon_usage.models import Usage, UsageTypes
 
+class TimedSerializerMixin:
+    """
+    Counts the representation of instances in the serialization time of sampled requests.
+    """
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+class UsageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    usage_type = CachedUsageTypeField(queryset=UsageTypes.objects.all())
 
-class UsageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Usage
         fields = ['id', 'user', 'usage_type', 'usage_at', 'amount']
 
 
-class UsageTypesSerializer(serializers.ModelSerializer):
+class UsageTypesSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = UsageTypes
         fields = ['id', 'name', 'unit', 'factor']
+
+
+class UsageTypeFactorSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    valid_from = serializers.DateTimeField()
+
+    class Meta:
+        model = UsageTypeFactor
+        fields = ['id', 'factor', 'valid_from', 'valid_to']
+        read_only_fields = ['valid_to']
+
+
+class EmissionsQuerySerializer(serializers.Serializer):
+    group_by = serializers.ChoiceField(choices=GROUP_BY_CHOICES, required=False)
+
+
+class HistogramQuerySerializer(serializers.Serializer):
+    interval = serializers.ChoiceField(choices=INTERVALS, default='day')
+    timezone = serializers.CharField(default='UTC')
+    max_buckets = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_timezone(self, value):
+        try:
+            return zoneinfo.ZoneInfo(value)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError(f'Unknown timezone "{value}".')
+
+    def validate_max_buckets(self, value):
+        if value > settings.USAGE_HISTOGRAM_MAX_BUCKETS:
+            raise serializers.ValidationError(
+                f'Ensure this value is less than or equal to {settings.USAGE_HISTOGRAM_MAX_BUCKETS}.'
+            )
+        return value
+
+
+class WhatIfSerializer(serializers.Serializer):
+    """
+    Validates the factors overriding those of some usage types, keyed by usage type id.
+    """
+    group_by = serializers.ChoiceField(choices=GROUP_BY_CHOICES, required=False)
+    factors = serializers.DictField(child=serializers.FloatField(), required=False, default=dict)
+
+    def validate_factors(self, value):
+        factors = {}
+        for key, factor in value.items():
+            try:
+                pk = int(key)
+            except ValueError:
+                raise serializers.ValidationError(f'Invalid usage type id "{key}".')
+            if usage_types_cache.get(pk) is None:
+                raise serializers.ValidationError(f'Invalid pk "{key}" - object does not exist.')
+            factors[pk] = factor
+        return factors
+
+
+class BulkUsageSerializer(serializers.Serializer):
+    """
+    Validates a single row of a bulk ingestion request without querying the referenced objects.
+    """
+    user = serializers.IntegerField()
+    usage_type = serializers.IntegerField()
+    usage_at = serializers.DateTimeField()
+    amount = serializers.FloatField()
+
+
+class BulkUpdateSerializer(serializers.Serializer):
+    """
+    Validates the changes applied to every usage matched by the filters of a bulk update.
+    """
+    scale_amount = serializers.FloatField(min_value=0, required=False)
+    usage_type = CachedUsageTypeField(queryset=UsageTypes.objects.all(), required=False)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if 'scale_amount' not in attrs and 'usage_type' not in attrs:
+            raise serializers.ValidationError('Expected a scale_amount or a usage_type.')
+        return attrs
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    dry_run = serializers.BooleanField(default=False)
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    export_format = serializers.ChoiceField(choices=EXPORT_FORMATS, default='csv')
+
+
+class ReportSerializer(serializers.ModelSerializer):
+    """
+    Validates a report request, the UsageFilter parameters of the usages it covers and the options
+    of its kind, and represents its job.
+    """
+    url = serializers.HyperlinkedIdentityField(view_name='carbon-usage:reports-detail')
+    kind = serializers.ChoiceField(choices=REPORT_KINDS)
+    filters = serializers.DictField(child=serializers.CharField(), required=False, default=dict, write_only=True)
+    export_format = serializers.ChoiceField(choices=EXPORT_FORMATS, default='csv', write_only=True)
+    group_by = serializers.ChoiceField(choices=GROUP_BY_CHOICES, required=False, allow_null=True, write_only=True)
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'url', 'kind', 'status', 'parameters', 'filters', 'export_format', 'group_by', 'attempts', 'error',
+            'created_at', 'started_at', 'finished_at', 'download',
+        ]
+        read_only_fields = ['status', 'parameters', 'attempts', 'error', 'started_at', 'finished_at']
+
+    def validate_filters(self, value):
+        filterset = UsageFilter(value, queryset=Usage.objects.none())
+        if not filterset.is_valid():
+            raise serializers.ValidationError(filterset.errors)
+        return value
+
+    def validate(self, attrs):
+        parameters = {'filters': attrs.pop('filters')}
+        export_format, group_by = attrs.pop('export_format'), attrs.pop('group_by', None)
+        if attrs['kind'] == 'export':
+            parameters['export_format'] = export_format
+        else:
+            parameters['group_by'] = group_by
+        attrs['parameters'] = parameters
+        return attrs
+
+    def get_download(self, job):
+        if job.status != Job.SUCCEEDED:
+            return None
+        return reverse('carbon-usage:reports-download', kwargs={'pk': job.pk}, request=self.context.get('request'))
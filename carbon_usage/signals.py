@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from carbon_usage.authentication import revoke_user
+from carbon_usage.conditional import mark_deleted
+from carbon_usage.instrumentation import instrument_connection
+from carbon_usage.models import Usage, UsageTypes
+
+
+@receiver(post_save, sender=get_user_model())
+def revoke_inactive_user_tokens(sender, instance, created, **kwargs):
+    # The tokens of a user carry its is_active state, a deactivation has to revoke them
+    if not created and not instance.is_active:
+        revoke_user(instance.pk)
+
+
+@receiver(post_delete, sender=get_user_model())
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revoke_user(instance.pk)
+
+
+@receiver(post_delete, sender=get_user_model())
+@receiver(post_delete, sender=UsageTypes)
+def mark_cascaded_usages_deleted(sender, instance, **kwargs):
+    # The usages deleted along with their user or usage type send no signal of their own
+    if sender is UsageTypes:
+        mark_deleted(UsageTypes)
+    mark_deleted(Usage)
+
+
+@receiver(connection_created)
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument_connection(connection)
@@ -1,9 +1,11 @@
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
-from rest_framework_simplejwt.tokens import RefreshToken
 
 import pytest
 
+from carbon_usage.authentication import UserStateRefreshToken, token_denylist as denylist, user_states
+from carbon_usage.cache import usage_types_cache as cache
+
 
 @pytest.fixture
 def user():
@@ -11,9 +13,28 @@ def user():
 
 
 @pytest.fixture
-def api_client(user):
+def api_client(user, token_denylist):
+    # The denylist is loaded once per process, the query counts asserted by the tests are those of a warm process
+    token_denylist.revoked()
     client = APIClient()
-    refresh = RefreshToken.for_user(user)
+    refresh = UserStateRefreshToken.for_user(user)
     client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
 
     return client
+
+
+@pytest.fixture(autouse=True)
+def usage_types_cache():
+    # Every test starts from the database state, not from usage types cached by a previous test
+    cache.invalidate()
+    yield cache
+    cache.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def token_denylist():
+    denylist.invalidate()
+    user_states.clear()
+    yield denylist
+    denylist.invalidate()
+    user_states.clear()
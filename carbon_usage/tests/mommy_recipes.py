@@ -1,8 +1,23 @@
+import random
+from datetime import datetime, timedelta
+
 from django.contrib.auth.models import User
-from model_bakery.recipe import Recipe
+from model_bakery.recipe import Recipe, seq
 
 from carbon_usage.models import Usage, UsageTypes
 
 base_user = Recipe(User)
 base_usage = Recipe(Usage)
 base_usage_types = Recipe(UsageTypes)
+
+# Volumes seeded by carbon_usage.benchmarks, random values follow the seed of the random module
+seed_user = Recipe(User, username=seq('benchmark-seed-'))
+seed_usage_types = Recipe(
+    UsageTypes, name=seq('benchmark type '), unit='kwh', factor=lambda: round(random.uniform(0.1, 5), 3)
+)
+seed_usage = Recipe(
+    Usage,
+    # model_bakery only takes a naive start, the sequence is made aware in UTC
+    usage_at=seq(datetime(2020, 1, 1), increment_by=timedelta(minutes=1)),
+    amount=lambda: round(random.uniform(0, 100), 3),
+)
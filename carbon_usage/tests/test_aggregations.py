@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+from ..rollups import rebuild_rollups
+
+pytestmark = pytest.mark.django_db
+
+
+def test_emissions_is_invalid(client):
+    url = reverse('carbon-usage:usage-emissions')
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_emissions_without_usages(api_client):
+    url = reverse('carbon-usage:usage-emissions')
+    response = api_client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data == {
+        "group_by": None,
+        "results": [
+            {
+                "count": 0,
+                "amount": None,
+                "emissions": None,
+                "min_emissions": None,
+                "max_emissions": None,
+            }
+        ]
+    }
+
+
+def test_emissions_totals(api_client):
+    carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=10)
+    carbon_usage_recipes.base_usage.make(usage_type_id=101, amount=2)
+    rebuild_rollups()
+    url = reverse('carbon-usage:usage-emissions')
+    response = api_client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["results"] == [
+        {
+            "count": 2,
+            "amount": 12,
+            "emissions": pytest.approx(10 * 1.5 + 2 * 26.93),
+            "min_emissions": pytest.approx(15),
+            "max_emissions": pytest.approx(53.86),
+        }
+    ]
+
+
+def test_emissions_grouped_by_usage_type_with_filters(api_client):
+    carbon_usage_recipes.base_usage.make(_quantity=2, usage_type_id=100, amount=10)
+    carbon_usage_recipes.base_usage.make(_quantity=3, usage_type_id=102, amount=1)
+    carbon_usage_recipes.base_usage.make(usage_type_id=102, amount=50)
+    rebuild_rollups()
+    url = reverse('carbon-usage:usage-emissions')
+    response = api_client.get(f"{url}?group_by=usage_type&max_amount=20")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["group_by"] == "usage_type"
+    assert [(row["usage_type"], row["count"], row["amount"]) for row in response.data["results"]] == [
+        (100, 2, 20),
+        (102, 3, 3),
+    ]
+    assert response.data["results"][1]["emissions"] == pytest.approx(3 * 3.892)
+
+
+def test_emissions_grouped_by_month(api_client):
+    carbon_usage_recipes.base_usage.make(_quantity=2, usage_at=datetime(2021, 10, 10, 15, 13), amount=1)
+    carbon_usage_recipes.base_usage.make(usage_at=datetime(2021, 11, 2, 8, 0), amount=4)
+    rebuild_rollups()
+    url = reverse('carbon-usage:usage-emissions')
+    response = api_client.get(f"{url}?group_by=month")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [(row["month"], row["count"], row["amount"]) for row in response.data["results"]] == [
+        (datetime(2021, 10, 1, tzinfo=timezone.utc), 2, 2),
+        (datetime(2021, 11, 1, tzinfo=timezone.utc), 1, 4),
+    ]
+
+
+def test_emissions_invalid_group_by(api_client):
+    url = reverse('carbon-usage:usage-emissions')
+    response = api_client.get(f"{url}?group_by=year")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize("filters", [
+    "",
+    "min_usage_at=2021-10-10T12:00",
+    "max_usage_at=2021-10-12T12:00",
+    "min_usage_at=2021-10-10T12:00&max_usage_at=2021-10-12T12:00",
+    "min_usage_at=2021-10-10&max_usage_at=2021-10-11T23:59:59.999999",
+    "min_usage_at=2021-10-11T01:00&max_usage_at=2021-10-11T20:00",
+    "usage_type=100&min_usage_at=2021-10-10T12:00",
+])
+@pytest.mark.parametrize("group_by", ["", "user", "usage_type", "day", "week", "month"])
+def test_emissions_from_rollups_match_raw_usages(api_client, filters, group_by):
+    for hour in range(0, 24 * 4, 5):
+        carbon_usage_recipes.base_usage.make(
+            usage_type_id=100 + hour % 2,
+            usage_at=datetime(2021, 10, 9, tzinfo=timezone.utc) + timedelta(hours=hour),
+            amount=hour,
+        )
+    url = reverse('carbon-usage:usage-emissions')
+    raw_response = api_client.get(f"{url}?group_by={group_by}&{filters}&min_amount=0")
+    rebuild_rollups()
+    response = api_client.get(f"{url}?group_by={group_by}&{filters}")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["results"] == [
+        {
+            **row,
+            "emissions": pytest.approx(row["emissions"]),
+            "min_emissions": pytest.approx(row["min_emissions"]),
+            "max_emissions": pytest.approx(row["max_emissions"]),
+        }
+        for row in raw_response.data["results"]
+    ]
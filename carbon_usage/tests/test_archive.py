@@ -0,0 +1,207 @@
+import csv
+import io
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from . import mommy_recipes as carbon_usage_recipes
+from ..archive import archive_usages, read_columns, restore_usages
+from ..models import DailyUsageRollup, Usage, UsageArchive
+from ..rollups import rebuild_rollups
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def archive_root(settings, tmp_path):
+    settings.USAGE_ARCHIVE_ROOT = tmp_path
+    return tmp_path
+
+
+@pytest.fixture
+def usages(user):
+    usages = [
+        carbon_usage_recipes.base_usage.make(
+            user=user, usage_type_id=usage_type_id, amount=amount, usage_at=datetime(*usage_at, tzinfo=timezone.utc)
+        )
+        for usage_type_id, amount, usage_at in [
+            (100, 1, (2020, 1, 5, 10)),
+            (101, 2, (2020, 1, 31, 23, 59)),
+            (100, 3, (2020, 2, 1)),
+            (102, 4, (2020, 3, 15, 12)),
+            (100, 5, (2021, 6, 1)),
+        ]
+    ]
+    rebuild_rollups()
+    return usages
+
+
+def exported(api_client, query=""):
+    response = api_client.get(f"{reverse('carbon-usage:usage-export')}{query}")
+    return list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+
+
+@pytest.mark.parametrize("query", [
+    "",
+    "?group_by=month",
+    "?group_by=day&min_usage_at=2020-01-31T12:00:00Z&max_usage_at=2020-03-15T00:00:00Z",
+    "?group_by=usage_type&min_amount=2",
+    "?group_by=week&usage_type=100",
+])
+def test_emissions_read_archived_usages(api_client, usages, query, django_capture_on_commit_callbacks):
+    url = f"{reverse('carbon-usage:usage-emissions')}{query}"
+    expected = api_client.get(url).data["results"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        assert archive_usages(datetime(2021, 1, 1, tzinfo=timezone.utc)) == 4
+
+    assert Usage.objects.count() == 1
+    assert not DailyUsageRollup.objects.filter(day__lt=datetime(2021, 1, 1).date()).exists()
+    results = api_client.get(url).data["results"]
+    assert [{**row, "emissions": pytest.approx(row["emissions"])} for row in results] == expected
+
+
+def test_export_reads_archived_usages(api_client, usages, django_capture_on_commit_callbacks):
+    expected = exported(api_client, "?ordering=id")
+    with django_capture_on_commit_callbacks(execute=True):
+        archive_usages(datetime(2020, 3, 1, tzinfo=timezone.utc))
+
+    assert exported(api_client, "?ordering=id") == expected
+    assert exported(api_client, "?max_usage_at=2020-01-31T23:59:00Z&min_amount=2") == [expected[0], expected[2]]
+
+
+def test_archives_are_partitioned_by_month_and_user(archive_root, user, usages, django_capture_on_commit_callbacks):
+    other = carbon_usage_recipes.base_usage.make(usage_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+    with django_capture_on_commit_callbacks(execute=True):
+        archive_usages(datetime(2020, 3, 1, tzinfo=timezone.utc))
+
+    assert list(UsageArchive.objects.order_by("month", "user").values_list("month", "user", "count")) == [
+        (datetime(2020, 1, 1).date(), user.id, 2),
+        (datetime(2020, 1, 1).date(), other.user_id, 1),
+        (datetime(2020, 2, 1).date(), user.id, 1),
+    ]
+    assert {path.relative_to(archive_root).parts[:2] for path in archive_root.glob("*/*/*.npz")} == {
+        ("month=2020-01", f"user={user.id}"),
+        ("month=2020-01", f"user={other.user_id}"),
+        ("month=2020-02", f"user={user.id}"),
+    }
+
+
+def test_late_usages_join_their_archive(archive_root, user, usages, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        archive_usages(datetime(2020, 2, 1, tzinfo=timezone.utc))
+    late = carbon_usage_recipes.base_usage.make(user=user, usage_at=datetime(2020, 1, 20, tzinfo=timezone.utc))
+    with django_capture_on_commit_callbacks(execute=True):
+        assert archive_usages(datetime(2020, 2, 1, tzinfo=timezone.utc)) == 1
+
+    archive = UsageArchive.objects.get()
+    assert archive.count == 3
+    assert read_columns(archive.path)["id"].tolist() == [usages[0].id, usages[1].id, late.id]
+    assert len(list(archive_root.glob("*/*/*.npz"))) == 1
+
+
+def test_uncompressed_archives_are_memory_mapped(settings, usages, django_capture_on_commit_callbacks):
+    settings.USAGE_ARCHIVE_COMPRESS = False
+    with django_capture_on_commit_callbacks(execute=True):
+        archive_usages(datetime(2020, 2, 1, tzinfo=timezone.utc))
+
+    columns = read_columns(UsageArchive.objects.get().path)
+    assert isinstance(columns["amount"], np.memmap)
+    assert columns["amount"].tolist() == [1, 2]
+
+
+def test_archive_and_restore_commands(archive_root, user, usages, django_capture_on_commit_callbacks):
+    fields = ("id", "user", "usage_type", "usage_at", "amount", "emissions", "created_at")
+    rows = list(Usage.objects.order_by("id").values_list(*fields))
+    rollups = list(DailyUsageRollup.objects.order_by("day").values_list("user", "usage_type", "day", "count", "emissions"))
+    out = io.StringIO()
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("archive_usages", "--before", "2021-01", stdout=out)
+    assert out.getvalue() == "Archived 4 usages of the months before 2021-01.\n"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("restore_usages", "--from", "2020-02", "--to", "2020-03", stdout=out)
+    assert Usage.objects.count() == 3
+    assert UsageArchive.objects.count() == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("restore_usages", "--user", str(user.id), stdout=out)
+    assert out.getvalue().splitlines()[1:] == ["Restored 2 archived usages."] * 2
+    assert list(Usage.objects.order_by("id").values_list(*fields)) == rows
+    assert list(DailyUsageRollup.objects.order_by("day").values_list(
+        "user", "usage_type", "day", "count", "emissions"
+    )) == rollups
+    assert not UsageArchive.objects.exists()
+    assert not list(archive_root.glob("*/*/*"))
+
+
+def test_ingestion_and_restore_keep_archived_natural_keys(api_client, user, usages, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        archive_usages(datetime(2020, 2, 1, tzinfo=timezone.utc))
+    row = {"user": user.id, "usage_type": 100, "usage_at": "2020-01-05T10:00:00Z", "amount": 1}
+
+    response = api_client.post(reverse('carbon-usage:usage-bulk'), data=[
+        row, {**row, "usage_type": 101, "usage_at": "2020-01-31T23:59:00Z", "amount": 3},
+    ], format='json')
+
+    assert response.data["created"] == 0
+    assert response.data["duplicates"] == 1
+    assert [(error["index"], list(error["errors"])) for error in response.data["errors"]] == [(1, ["usage_at"])]
+    assert Usage.objects.filter(usage_at__lt=datetime(2020, 2, 1, tzinfo=timezone.utc)).count() == 0
+
+    # A usage of an archived natural key stored by another path supersedes the archived one
+    stored = carbon_usage_recipes.base_usage.make(
+        user=user, usage_type_id=101, amount=3, usage_at=datetime(2020, 1, 31, 23, 59, tzinfo=timezone.utc)
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        assert restore_usages() == (1, 1)
+
+    assert sorted(Usage.objects.filter(
+        usage_at__lt=datetime(2020, 2, 1, tzinfo=timezone.utc)
+    ).values_list("id", "amount")) == [(usages[0].id, 1), (stored.id, 3)]
+    assert not UsageArchive.objects.exists()
+
+
+def test_archived_emissions_follow_factor_corrections(api_client, usages, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        archive_usages(datetime(2021, 1, 1, tzinfo=timezone.utc))
+        api_client.post(
+            reverse('carbon-usage:usage_types-factors', kwargs={"pk": 100}),
+            data={"factor": 10, "valid_from": "2020-02-01T00:00:00Z"},
+        )
+    url = f"{reverse('carbon-usage:usage-emissions')}?group_by=month&usage_type=100"
+
+    assert [row["emissions"] for row in api_client.get(url).data["results"]] == [1.5, 30, 50]
+    assert [row[-1] for row in exported(api_client, "?ordering=id&usage_type=100")[1:]] == ["1.5", "30.0", "50.0"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        restore_usages()
+
+    assert sorted(Usage.objects.filter(usage_type=100).values_list("amount", "emissions")) == [(1, 1.5), (3, 30), (5, 50)]
+    assert [row["emissions"] for row in api_client.get(url).data["results"]] == [1.5, 30, 50]
+
+
+def test_usage_writes_conflict_with_archived_usages(api_client, user, usages, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        archive_usages(datetime(2020, 2, 1, tzinfo=timezone.utc))
+    url = reverse('carbon-usage:usage-list')
+    row = {"user": user.id, "usage_type": 100, "usage_at": "2020-01-05T10:00:00Z", "amount": 1}
+
+    # A retry of an archived usage returns it
+    response = api_client.post(url, data=row)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["id"] == usages[0].id
+
+    response = api_client.post(url, data={**row, "amount": 2})
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.data["id"] == usages[0].id
+
+    detail_url = reverse('carbon-usage:usage-detail', kwargs={"pk": usages[2].id})
+    response = api_client.patch(detail_url, data={"usage_at": "2020-01-05T10:00:00Z"})
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.data["id"] == usages[0].id
+    assert Usage.objects.count() == 3
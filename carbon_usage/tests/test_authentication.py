@@ -0,0 +1,137 @@
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..authentication import UserStateRefreshToken, user_states
+from ..models import RevokedToken
+
+pytestmark = pytest.mark.django_db
+
+
+def authenticated_client(token):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+def test_obtained_tokens_carry_is_active(user):
+    response = APIClient().post(reverse('token_obtain_pair'), data={"username": "john", "password": "js.sj"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert RefreshToken(response.data["refresh"])["is_active"] is True
+
+    response = authenticated_client(response.data["access"]).get(reverse('carbon-usage:usage-list'))
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_deactivated_user_tokens_are_revoked(api_client, user, django_capture_on_commit_callbacks):
+    url = reverse('carbon-usage:usage-list')
+    assert api_client.get(url).status_code == status.HTTP_200_OK
+
+    with django_capture_on_commit_callbacks(execute=True):
+        user.is_active = False
+        user.save()
+
+    response = api_client.get(url)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.data["detail"].code == "token_revoked"
+
+
+def test_deleted_user_tokens_are_revoked(api_client, user, django_capture_on_commit_callbacks):
+    user_id = user.pk
+    with django_capture_on_commit_callbacks(execute=True):
+        user.delete()
+
+    response = api_client.get(reverse('carbon-usage:usage-list'))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert RevokedToken.objects.filter(user_id=user_id, jti=None).exists()
+
+
+def test_revoked_refresh_token_cannot_be_refreshed(user, django_capture_on_commit_callbacks):
+    refresh = UserStateRefreshToken.for_user(user)
+    client = APIClient()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(reverse('token_revoke'), data={"refresh": str(refresh)})
+    assert response.status_code == status.HTTP_200_OK
+
+    response = client.post(reverse('token_refresh'), data={"refresh": str(refresh)})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_refresh_checks_revocations_of_other_processes(user, token_denylist, settings):
+    settings.AUTH_DENYLIST_CHECK_INTERVAL = 60
+    token_denylist.revoked()
+    refresh, other = UserStateRefreshToken.for_user(user), UserStateRefreshToken.for_user(user)
+    client = APIClient()
+    assert client.post(reverse('token_refresh'), data={"refresh": str(refresh)}).status_code == status.HTTP_200_OK
+
+    # Revoked by another process, whose invalidation of the denylist does not reach this one
+    RevokedToken.objects.create(jti=refresh["jti"], expires_at="2999-01-01T00:00Z")
+    assert not token_denylist.is_revoked(refresh)
+
+    response = client.post(reverse('token_refresh'), data={"refresh": str(refresh)})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.post(reverse('token_refresh'), data={"refresh": str(other)}).status_code == status.HTTP_200_OK
+
+    RevokedToken.objects.create(user_id=user.pk, expires_at="2999-01-01T00:00Z")
+    response = client.post(reverse('token_refresh'), data={"refresh": str(other)})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_denylist_follows_version_stamp(token_denylist, user, settings):
+    settings.AUTH_DENYLIST_CHECK_INTERVAL = 60
+    access = UserStateRefreshToken.for_user(user).access_token
+    other_process = type(token_denylist)()
+    assert not other_process.is_revoked(access)
+
+    RevokedToken.objects.create(jti=access["jti"], expires_at="2999-01-01T00:00Z")
+    assert not other_process.is_revoked(access)
+
+    settings.AUTH_DENYLIST_CHECK_INTERVAL = 0
+    token_denylist.invalidate()
+    assert other_process.is_revoked(access)
+
+
+def test_tokens_without_is_active_use_user_state_cache(user, django_assert_num_queries, token_denylist):
+    token_denylist.revoked()
+    client = authenticated_client(RefreshToken.for_user(user).access_token)
+    url = reverse('carbon-usage:usage-list')
+
+    # The user state and the validators aggregate, then only the aggregate
+    with django_assert_num_queries(2):
+        assert client.get(url).status_code == status.HTTP_200_OK
+    with django_assert_num_queries(1):
+        assert client.get(url).status_code == status.HTTP_200_OK
+
+    # Bypasses the revocation signal, the state is only seen once the cached entry is gone
+    User.objects.filter(pk=user.pk).update(is_active=False)
+    assert client.get(url).status_code == status.HTTP_200_OK
+    user_states.clear()
+    response = client.get(url)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.data["detail"].code == "user_inactive"
+
+
+def test_user_state_cache_is_bounded(user, settings, django_assert_num_queries):
+    settings.AUTH_USER_STATE_CACHE_SIZE = 1
+
+    assert user_states.is_active(user.pk) is True
+    assert user_states.is_active(999) is None
+    with django_assert_num_queries(1):
+        assert user_states.is_active(user.pk) is True
+
+
+def test_revoke_tokens_command(api_client, user, django_capture_on_commit_callbacks):
+    out = StringIO()
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("revoke_tokens", "--user", "john", stdout=out)
+
+    assert out.getvalue() == "Revoked the tokens of john.\n"
+    assert api_client.get(reverse('carbon-usage:usage-list')).status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,140 @@
+from datetime import datetime, timezone
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+from ..emissions import add_factor_period
+from ..models import DailyUsageRollup, Usage, UsageTypes
+from ..rollups import rebuild_rollups
+
+pytestmark = pytest.mark.django_db
+
+UPDATE_URL = reverse('carbon-usage:usage-bulk-update')
+DELETE_URL = reverse('carbon-usage:usage-bulk-delete')
+
+
+@pytest.fixture(autouse=True)
+def batch_size(settings):
+    # Several ranges for the handful of usages of a test
+    settings.USAGE_BULK_EDIT_BATCH_SIZE = 2
+
+
+@pytest.fixture
+def meter(user):
+    usages = [
+        carbon_usage_recipes.base_usage.make(
+            user=user, usage_type_id=100, amount=2, usage_at=datetime(year, 6, day, tzinfo=timezone.utc)
+        )
+        for year in (2020, 2021) for day in (1, 2)
+    ]
+    carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=5, usage_at=datetime(2021, 6, 1, tzinfo=timezone.utc))
+    rebuild_rollups()
+    return usages
+
+
+def rollups():
+    return sorted(DailyUsageRollup.objects.values_list('user', 'usage_type', 'day', 'count', 'amount', 'emissions'))
+
+
+def assert_rollups_match_usages():
+    stored = rollups()
+    rebuild_rollups()
+    assert stored == rollups()
+
+
+def test_bulk_edits_are_invalid(client):
+    assert client.post(UPDATE_URL, data={"scale_amount": 2}).status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.post(DELETE_URL).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.parametrize("url, params, data, field", [
+    (UPDATE_URL, "", {"scale_amount": 2}, "detail"),
+    (DELETE_URL, "", {}, "detail"),
+    (UPDATE_URL, "?usage_type=100", {}, "non_field_errors"),
+    (UPDATE_URL, "?usage_type=100", {"scale_amount": -1}, "scale_amount"),
+    (UPDATE_URL, "?usage_type=100", {"usage_type": 999}, "usage_type"),
+    (DELETE_URL, "?min_usage_at=yesterday", {}, "min_usage_at"),
+])
+def test_bulk_edit_parameters_are_validated(api_client, meter, url, params, data, field):
+    response = api_client.post(f"{url}{params}", data=data, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert set(response.data) == {field}
+    assert Usage.objects.filter(amount=2).count() == 4
+
+
+def test_bulk_update_scales_amounts_and_emissions(api_client, user, meter):
+    url = f"{UPDATE_URL}?user={user.id}&min_usage_at=2021-01-01T00:00:00Z"
+    expected = {
+        "count": 2, "conflicts": 0,
+        "before": {"amount": 4.0, "emissions": 6.0}, "after": {"amount": 5.0, "emissions": 7.5},
+    }
+
+    response = api_client.post(url, data={"scale_amount": 1.25, "dry_run": True}, format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data == {**expected, "dry_run": True}
+    assert Usage.objects.filter(amount=2).count() == 4
+
+    response = api_client.post(url, data={"scale_amount": 1.25}, format="json")
+
+    assert response.data == {**expected, "dry_run": False}
+    assert sorted(Usage.objects.values_list('amount', 'emissions')) == [
+        (2, 3), (2, 3), (2.5, 3.75), (2.5, 3.75), (5, 7.5),
+    ]
+    assert_rollups_match_usages()
+
+
+def test_bulk_update_moves_usages_to_the_factors_of_another_usage_type(api_client, user, meter):
+    add_factor_period(UsageTypes.objects.get(pk=101), 10, datetime(2021, 1, 1, tzinfo=timezone.utc))
+    url = f"{UPDATE_URL}?user={user.id}"
+
+    response = api_client.post(url, data={"usage_type": 101, "dry_run": True}, format="json")
+
+    assert response.data["after"] == {"amount": 8.0, "emissions": pytest.approx(2 * 2 * 26.93 + 2 * 2 * 10)}
+    assert not Usage.objects.filter(usage_type=101).exists()
+
+    response = api_client.post(url, data={"usage_type": 101}, format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["count"] == 4
+    assert sorted(Usage.objects.filter(user=user).values_list('usage_type', 'emissions')) == [
+        (101, 20), (101, 20), (101, pytest.approx(53.86)), (101, pytest.approx(53.86)),
+    ]
+    assert_rollups_match_usages()
+    assert not DailyUsageRollup.objects.filter(user=user, usage_type=100).exists()
+
+
+def test_bulk_update_refuses_to_break_the_natural_key(api_client, user, meter):
+    carbon_usage_recipes.base_usage.make(user=user, usage_type_id=101, amount=1, usage_at=meter[0].usage_at)
+    url = f"{UPDATE_URL}?user={user.id}&usage_type=100"
+
+    response = api_client.post(url, data={"usage_type": 101, "dry_run": True}, format="json")
+
+    assert response.data["conflicts"] == 1
+
+    response = api_client.post(url, data={"usage_type": 101, "scale_amount": 2}, format="json")
+
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.data["conflicts"] == 1
+    assert Usage.objects.filter(user=user, usage_type=100, amount=2).count() == 4
+
+
+def test_bulk_delete_removes_usages_and_their_rollups(api_client, user, meter):
+    url = f"{DELETE_URL}?user={user.id}&max_usage_at=2020-12-31T00:00:00Z"
+    list_response = api_client.get(reverse('carbon-usage:usage-list'))
+
+    response = api_client.post(url, data={"dry_run": True}, format="json")
+
+    assert response.data == {"count": 2, "amount": 4.0, "emissions": 6.0, "dry_run": True}
+    assert Usage.objects.count() == 5
+
+    response = api_client.post(url, format="json")
+
+    assert response.data == {"count": 2, "amount": 4.0, "emissions": 6.0, "dry_run": False}
+    assert sorted(Usage.objects.values_list('usage_at__year', flat=True)) == [2021, 2021, 2021]
+    assert_rollups_match_usages()
+    response = api_client.get(reverse('carbon-usage:usage-list'), HTTP_IF_NONE_MATCH=list_response["ETag"])
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["count"] == 3
@@ -0,0 +1,90 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+from ..checks import check_shared_caches
+
+pytestmark = pytest.mark.django_db
+
+
+def test_usage_types_cache_loads_once(usage_types_cache, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        assert usage_types_cache.get(100).name == "electricity"
+        assert usage_types_cache.factors()[101] == 26.93
+
+    usage_types_cache.invalidate()
+    with django_assert_num_queries(1):
+        assert usage_types_cache.get(999) is None
+
+
+def test_usage_types_cache_follows_version_stamp(usage_types_cache, settings, django_assert_num_queries):
+    settings.USAGE_TYPES_VERSION_CHECK_INTERVAL = 0
+    usage_types_cache.all()
+    other_process = type(usage_types_cache)()
+    other_process.all()
+
+    usage_types_cache.invalidate()
+
+    with django_assert_num_queries(1):
+        other_process.all()
+
+
+def test_usage_requests_without_usage_type_queries(api_client, user, usage_types_cache):
+    usage_types_cache.all()
+    carbon_usage_recipes.base_usage.make(_quantity=3, usage_type_id=102)
+    url = reverse('carbon-usage:usage-list')
+    data = {"user": user.id, "usage_type": 100, "usage_at": "2020-10-10 10:10", "amount": 1}
+
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get(f"{url}?usage_type=102")
+        assert response.data["count"] == 3
+        response = api_client.post(url, data=data)
+        assert response.status_code == status.HTTP_201_CREATED
+        response = api_client.get(f"{reverse('carbon-usage:usage-emissions')}?usage_type=100&min_amount=0")
+        assert response.data["results"][0]["emissions"] == 1.5
+
+    assert not [query for query in queries if "carbon_usage_usagetypes" in query["sql"]]
+
+
+def test_usage_type_changes_invalidate_cache(api_client, user):
+    url = reverse('carbon-usage:usage_types-list')
+    response = api_client.post(url, data={"name": "cooling", "unit": "m3", "factor": 5.34})
+    assert response.status_code == status.HTTP_201_CREATED
+    usage_type_id = response.data["id"]
+
+    data = {"user": user.id, "usage_type": usage_type_id, "usage_at": "2020-10-10 10:10", "amount": 1}
+    response = api_client.post(reverse('carbon-usage:usage-list'), data=data)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = api_client.delete(reverse('carbon-usage:usage_types-detail', kwargs={"pk": usage_type_id}))
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = api_client.post(reverse('carbon-usage:usage-list'), data=data)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data["usage_type"][0].code == "does_not_exist"
+
+
+def test_usage_invalid_usage_type_filter(api_client):
+    url = reverse('carbon-usage:usage-list')
+    response = api_client.get(f"{url}?usage_type=999")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_shared_caches_must_not_be_process_local(settings):
+    settings.DEBUG = False
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "shared": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://localhost:6379"},
+    }
+    settings.AUTH_DENYLIST_CACHE = "shared"
+
+    messages = check_shared_caches(None)
+
+    assert [message.id for message in messages] == ["carbon_usage.E001"] * 3
+    assert "USAGE_TYPES_CACHE" in messages[0].msg
+
+    settings.DEBUG = True
+    assert {message.id for message in check_shared_caches(None)} == {"carbon_usage.W001"}
@@ -0,0 +1,108 @@
+import json
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+from ..aggregations import aggregate_emissions
+from ..calculator import calculate_emissions
+from ..models import Usage, UsageTypeFactor
+
+pytestmark = pytest.mark.django_db
+
+
+def make_usages():
+    for hour in range(0, 24 * 70, 7):
+        carbon_usage_recipes.base_usage.make(
+            usage_type_id=100 + hour % 3,
+            usage_at=datetime(2021, 9, 25, tzinfo=timezone.utc) + timedelta(hours=hour),
+            amount=hour % 50,
+        )
+
+
+def approx_rows(rows):
+    return [
+        {
+            **row,
+            **{name: pytest.approx(row[name]) for name in ("amount", "emissions", "min_emissions", "max_emissions")},
+        }
+        for row in rows
+    ]
+
+
+@pytest.mark.parametrize("group_by", [None, "user", "usage_type", "day", "week", "month"])
+def test_calculator_matches_database_aggregation(group_by):
+    make_usages()
+
+    assert calculate_emissions(Usage.objects.all(), group_by=group_by, chunk_size=17) == approx_rows(
+        aggregate_emissions(Usage.objects.all(), group_by=group_by)
+    )
+
+
+def test_calculator_without_usages():
+    assert calculate_emissions(Usage.objects.all()) == aggregate_emissions(Usage.objects.all())
+    assert calculate_emissions(Usage.objects.all(), group_by="day") == []
+
+
+def test_calculator_follows_factor_periods():
+    UsageTypeFactor.objects.filter(usage_type=100).update(valid_to=datetime(2021, 1, 1, tzinfo=timezone.utc))
+    UsageTypeFactor.objects.create(usage_type_id=100, factor=3, valid_from=datetime(2021, 1, 1, tzinfo=timezone.utc))
+    carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=2, usage_at=datetime(2020, 12, 31, 23, 59, tzinfo=timezone.utc))
+    carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=2, usage_at=datetime(2021, 1, 1, tzinfo=timezone.utc))
+
+    rows = calculate_emissions(Usage.objects.all(), group_by="month")
+    assert [row["emissions"] for row in rows] == [3, 6]
+
+    rows = calculate_emissions(Usage.objects.all(), group_by="month", factors={100: 1})
+    assert [row["emissions"] for row in rows] == [2, 2]
+
+
+def test_what_if_endpoint(api_client):
+    carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=10)
+    carbon_usage_recipes.base_usage.make(usage_type_id=101, amount=2)
+    carbon_usage_recipes.base_usage.make(usage_type_id=101, amount=50)
+    url = reverse('carbon-usage:usage-what-if')
+    response = api_client.post(f"{url}?max_amount=20", data={
+        "group_by": "usage_type", "factors": {"101": 1.2}
+    }, format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data == {
+        "group_by": "usage_type",
+        "factors": {101: 1.2},
+        "results": [
+            {"usage_type": 100, "count": 1, "amount": 10, "emissions": 15, "min_emissions": 15, "max_emissions": 15},
+            {"usage_type": 101, "count": 1, "amount": 2, "emissions": 2.4, "min_emissions": 2.4, "max_emissions": 2.4},
+        ],
+    }
+
+
+@pytest.mark.parametrize("data", [
+    {"factors": {"999": 1}},
+    {"factors": {"electricity": 1}},
+    {"factors": {"100": "a lot"}},
+    {"group_by": "year"},
+])
+def test_what_if_endpoint_is_invalid(api_client, data):
+    url = reverse('carbon-usage:usage-what-if')
+    response = api_client.post(url, data=data, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_calculate_emissions_command():
+    carbon_usage_recipes.base_usage.make(_quantity=2, usage_type_id=100, amount=10, usage_at=datetime(2021, 10, 1, tzinfo=timezone.utc))
+    carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=10, usage_at=datetime(2021, 11, 1, tzinfo=timezone.utc))
+    out = StringIO()
+    call_command(
+        "calculate_emissions", "--group-by", "month", "--factor", "100=2", "--filter", "min_usage_at=2021-10-15",
+        stdout=out
+    )
+
+    output = json.loads(out.getvalue())
+    assert output["results"] == [{
+        "month": "2021-11-01T00:00:00Z", "count": 1, "amount": 10, "emissions": 20, "min_emissions": 20, "max_emissions": 20
+    }]
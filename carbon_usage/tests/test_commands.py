@@ -0,0 +1,116 @@
+from io import StringIO
+
+import json
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..benchmarks import compare_results
+from ..models import DailyUsageRollup, Usage, UsageTypes
+from ..rollups import rebuild_rollups
+from . import mommy_recipes as carbon_usage_recipes
+
+pytestmark = pytest.mark.django_db
+
+
+def test_explain_usage_queries_uses_indexes():
+    out = StringIO()
+    call_command("explain_usage_queries", "--seed", "500", "--fail-on-full-scan", stdout=out)
+
+    lines = out.getvalue().splitlines()
+    assert "user&min_usage_at&max_usage_at&ordering=usage_at: index" in lines
+    assert "usage_type&min_amount&max_amount&ordering=amount: index" in lines
+    assert Usage.objects.count() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_test_reports_percentiles(live_server, user):
+    out = StringIO()
+    token = str(RefreshToken.for_user(user).access_token)
+    call_command(
+        "load_test", f"{live_server.url}/usage/", "--requests", "20", "--concurrency", "4", "--warmup", "2",
+        "--token", token, stdout=out
+    )
+
+    report = json.loads(out.getvalue())
+    assert report["requests"] == 20
+    assert report["errors"] == 0
+    assert report["p50_ms"] <= report["p99_ms"] <= report["max_ms"]
+
+
+def test_benchmark_command_saves_and_compares_results(tmp_path):
+    output = tmp_path / "results.json"
+    call_command(
+        "benchmark", "api", "--rows", "60", "--users", "3", "--usage-types", "7", "--repeat", "3",
+        "--output", str(output), stdout=StringIO()
+    )
+
+    saved = json.loads(output.read_text())
+    assert saved["options"] == {"rows": 60, "users": 3, "usage_types": 7, "repeat": 3}
+    assert set(saved["results"]["api"]["paths"]) == {
+        "list", "filtered_list", "ordered_list", "detail", "usage_types_list", "create", "bulk_create", "token"
+    }
+    assert saved["results"]["api"]["paths"]["token"]["requests"] == 3
+    # The seeded rows are rolled back
+    assert not Usage.objects.exists() and not User.objects.exists()
+    assert UsageTypes.objects.count() == 5
+
+    for timings in saved["results"]["api"]["paths"].values():
+        timings.update({name: value / 1000 for name, value in timings.items() if name.endswith("_ms")})
+    faster = tmp_path / "faster.json"
+    faster.write_text(json.dumps(saved))
+    out = StringIO()
+    with pytest.raises(CommandError, match="measurements regressed by more than 20%"):
+        call_command(
+            "benchmark", "api", "--rows", "60", "--users", "3", "--usage-types", "7", "--repeat", "3",
+            "--baseline", str(faster), stdout=out
+        )
+    assert "REGRESSION api.paths.list.p50_ms: " in out.getvalue()
+
+
+def test_compare_results_flags_slower_timings_and_rates():
+    baseline = {"rows": 10, "pages": [{"offset_seconds": 1.0}], "bulk": {"rows_per_second": 100}, "speedup": 2}
+    results = {"rows": 20, "pages": [{"offset_seconds": 1.1}], "bulk": {"rows_per_second": 50}, "speedup": 2.5}
+
+    assert compare_results(baseline, results, threshold=0.2) == [("bulk.rows_per_second", 100, 50, 1.0)]
+    assert compare_results(baseline, results, threshold=0.05) == [
+        ("pages.0.offset_seconds", 1.0, 1.1, pytest.approx(0.1)), ("bulk.rows_per_second", 100, 50, 1.0)
+    ]
+
+
+@pytest.fixture
+def without_natural_key(monkeypatch):
+    # Rows stored before migration 0010 can share their natural key. SQLite rebuilds the table
+    # from the model, which must not have the constraint anymore
+    constraint, = Usage._meta.constraints
+    with monkeypatch.context() as patch, connection.schema_editor() as schema_editor:
+        patch.setattr(Usage._meta, "constraints", [])
+        schema_editor.remove_constraint(Usage, constraint)
+    yield
+    with connection.schema_editor() as schema_editor:
+        schema_editor.add_constraint(Usage, constraint)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_dedupe_usages_keeps_the_first_usage_of_every_natural_key(without_natural_key):
+    usage_type = carbon_usage_recipes.base_usage_types.make(factor=2)
+    first, other = carbon_usage_recipes.base_user.make(_quantity=2)
+    kept = [
+        carbon_usage_recipes.base_usage.make(user=user, usage_type=usage_type, usage_at=usage_at, amount=1)
+        for user in (first, other) for usage_at in ("2021-01-01T00:00:00Z", "2021-01-02T00:00:00Z")
+    ]
+    carbon_usage_recipes.base_usage.make(user=first, usage_type=usage_type, usage_at="2021-01-01T00:00:00Z", amount=1)
+    carbon_usage_recipes.base_usage.make(user=other, usage_type=usage_type, usage_at="2021-01-02T00:00:00Z", amount=5)
+    carbon_usage_recipes.base_usage.make(user=other, usage_type=usage_type, usage_at="2021-01-02T00:00:00Z", amount=1)
+    rebuild_rollups()
+
+    out = StringIO()
+    call_command("dedupe_usages", "--dry-run", stdout=out)
+    call_command("dedupe_usages", "--chunk-size", "1", stdout=out)
+
+    assert out.getvalue().splitlines() == ["Would delete 3 duplicate usages.", "Deleted 3 duplicate usages."]
+    assert sorted(Usage.objects.values_list("pk", flat=True)) == [usage.pk for usage in kept]
+    assert set(DailyUsageRollup.objects.values_list("count", "amount")) == {(1, 1)}
@@ -0,0 +1,124 @@
+from datetime import datetime, timezone
+
+import pytest
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+from ..models import Usage
+
+pytestmark = pytest.mark.django_db
+
+
+def test_usage_list_not_modified(api_client, django_assert_num_queries):
+    carbon_usage_recipes.base_usage.make(_quantity=5)
+    url = reverse('carbon-usage:usage-list')
+    response = api_client.get(f"{url}?limit=2")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"]
+    assert response["Last-Modified"]
+
+    # Only the validators aggregate, authentication does not query the user
+    with django_assert_num_queries(1):
+        response = api_client.get(f"{url}?limit=2", HTTP_IF_NONE_MATCH=response["ETag"])
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert not response.content
+
+
+def test_usage_list_etag_follows_changes(api_client):
+    usages = carbon_usage_recipes.base_usage.make(_quantity=3)
+    url = reverse('carbon-usage:usage-list')
+    etags = [api_client.get(url)["ETag"]]
+
+    carbon_usage_recipes.base_usage.make()
+    etags.append(api_client.get(url)["ETag"])
+
+    response = api_client.delete(reverse('carbon-usage:usage-detail', kwargs={"pk": usages[0].id}))
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    etags.append(api_client.get(url)["ETag"])
+
+    etags.append(api_client.get(f"{url}?ordering=amount")["ETag"])
+
+    assert len(set(etags)) == 4
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etags[0])
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["count"] == 3
+
+
+def test_usage_list_if_modified_since(api_client):
+    carbon_usage_recipes.base_usage.make(_quantity=2)
+    url = reverse('carbon-usage:usage-list')
+    last_modified = api_client.get(url)["Last-Modified"]
+
+    response = api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_usage_list_if_modified_since_follows_cascade_deletes(api_client):
+    usage = carbon_usage_recipes.base_usage.make()
+    carbon_usage_recipes.base_usage.make()
+    Usage.objects.update(updated_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+    # Deletions of previous tests are not older than the second of this one
+    caches[settings.CONDITIONAL_GET_CACHE].clear()
+    url = reverse('carbon-usage:usage-list')
+    last_modified = api_client.get(url)["Last-Modified"]
+
+    usage.user.delete()
+
+    response = api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["count"] == 1
+
+
+def test_usage_keyset_pages_skip_the_validators_aggregate(api_client, django_assert_num_queries):
+    carbon_usage_recipes.base_usage.make(_quantity=5)
+    url = f"{reverse('carbon-usage:usage-list')}?pagination=keyset&limit=2"
+    response = api_client.get(url)
+
+    assert "Last-Modified" not in response
+
+    # Only the page query, which also validates the ETag digest of the page
+    with django_assert_num_queries(1):
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    carbon_usage_recipes.base_usage.make(usage_at=datetime(2000, 1, 1, tzinfo=timezone.utc))
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code == status.HTTP_200_OK
+
+
+def test_usage_retrieve_not_modified(api_client):
+    usage = carbon_usage_recipes.base_usage.make()
+    url = reverse('carbon-usage:usage-detail', kwargs={"pk": usage.id})
+    etag = api_client.get(url)["ETag"]
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    api_client.patch(url, data={"amount": 1})
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["amount"] == 1
+
+
+def test_usage_types_list_not_modified(api_client):
+    url = reverse('carbon-usage:usage_types-list')
+    etag = api_client.get(url)["ETag"]
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    api_client.patch(reverse('carbon-usage:usage_types-detail', kwargs={"pk": 101}), data={"factor": 1})
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_conditional_get_varies_on_authorization(api_client):
+    url = reverse('carbon-usage:usage_types-list')
+    response = api_client.get(url)
+
+    assert "Authorization" in response["Vary"]
@@ -0,0 +1,229 @@
+from datetime import datetime, timezone
+
+import pytest
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+from ..emissions import recompute_emissions
+from ..ingestion import bulk_create_usages
+from ..models import DailyUsageRollup, Usage, UsageTypeFactor, UsageTypes
+from ..rollups import rebuild_rollups
+
+pytestmark = pytest.mark.django_db
+
+
+def test_emissions_are_stored_on_save():
+    usage = carbon_usage_recipes.base_usage.make(usage_type_id=101, amount=2)
+
+    assert usage.emissions == pytest.approx(53.86)
+    usage.amount = 3
+    usage.save(update_fields=["amount"])
+    usage.refresh_from_db()
+    assert usage.emissions == pytest.approx(3 * 26.93)
+
+
+def test_emissions_are_stored_on_api_create(api_client, user):
+    url = reverse('carbon-usage:usage-list')
+    response = api_client.post(url, data={
+        "user": user.id, "usage_type": 102, "usage_at": "2021-10-10 10:10", "amount": 10
+    })
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert Usage.objects.get(pk=response.data["id"]).emissions == pytest.approx(38.92)
+
+
+def test_emissions_are_stored_on_bulk_create(user):
+    created, _, errors = bulk_create_usages([
+        {"user": user.id, "usage_type": 100, "usage_at": "2021-10-10T10:10:00Z", "amount": 4},
+    ])
+
+    assert errors == []
+    assert created[0].emissions == Usage.objects.get().emissions == pytest.approx(6)
+
+
+def test_recompute_emissions_in_batches(django_assert_max_num_queries):
+    carbon_usage_recipes.base_usage.make(_quantity=5, usage_type_id=100, amount=2)
+    other = carbon_usage_recipes.base_usage.make(usage_type_id=101, amount=2)
+    UsageTypeFactor.objects.filter(usage_type=100).update(factor=10)
+
+    # Every batch also refreshes the rollups of its days
+    with django_assert_max_num_queries(40) as queries:
+        assert recompute_emissions(100, batch_size=2) == 5
+
+    updates = [query["sql"] for query in queries.captured_queries if query["sql"].startswith('UPDATE "carbon_usage_usage"')]
+    assert len(updates) == 3
+
+    assert set(Usage.objects.filter(usage_type=100).values_list("emissions", flat=True)) == {20}
+    other.refresh_from_db()
+    assert other.emissions == pytest.approx(53.86)
+
+
+def test_factor_change_recomputes_emissions(api_client, django_capture_on_commit_callbacks):
+    past = carbon_usage_recipes.base_usage.make(usage_type_id=101, amount=2)
+    usage = carbon_usage_recipes.base_usage.make(
+        usage_type_id=101, amount=2, usage_at=datetime(2100, 1, 1, tzinfo=timezone.utc)
+    )
+    url = reverse('carbon-usage:usage_types-detail', kwargs={"pk": 101})
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        response = api_client.patch(url, data={"name": "renamed"})
+    assert response.status_code == status.HTTP_200_OK
+    # Only the cache invalidation, the factor did not change
+    assert len(callbacks) == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.patch(url, data={"factor": 10})
+    assert response.status_code == status.HTTP_200_OK
+    usage.refresh_from_db()
+    assert usage.emissions == 20
+    # The initial open period keeps the previous factor for the past
+    past.refresh_from_db()
+    assert past.emissions == pytest.approx(53.86)
+    assert list(UsageTypeFactor.objects.filter(usage_type=101).order_by("id").values_list("factor", "valid_to")) == [
+        (26.93, UsageTypeFactor.objects.get(usage_type=101, factor=10).valid_from), (10, None),
+    ]
+
+
+@pytest.mark.parametrize("filters, amounts", [
+    ("min_emissions=10", [10, 20]),
+    ("max_emissions=15", [2, 10]),
+    ("min_emissions=10&max_emissions=15", [10]),
+])
+def test_usage_filtered_by_emissions(api_client, filters, amounts):
+    for amount in (20, 2, 10):
+        carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=amount)
+    url = reverse('carbon-usage:usage-list')
+    response = api_client.get(f"{url}?{filters}&ordering=emissions")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [row["amount"] for row in response.data["results"]] == amounts
+
+
+def test_usage_keyset_pages_ordered_by_emissions(api_client):
+    for amount in (5, 1, 4, 2, 3):
+        carbon_usage_recipes.base_usage.make(
+            usage_type_id=100, amount=amount, usage_at=datetime(2021, 10, 10, tzinfo=timezone.utc)
+        )
+    url = reverse('carbon-usage:usage-list')
+    response = api_client.get(f"{url}?pagination=keyset&ordering=-emissions&limit=3")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [row["amount"] for row in response.data["results"]] == [5, 4, 3]
+    assert "emissions" not in response.data["results"][0]
+
+    response = api_client.get(response.data["next"])
+    assert [row["amount"] for row in response.data["results"]] == [2, 1]
+    assert response.data["next"] is None
+
+
+def add_factor(api_client, usage_type_id, factor, valid_from, django_capture_on_commit_callbacks):
+    url = reverse('carbon-usage:usage_types-factors', kwargs={"pk": usage_type_id})
+    with django_capture_on_commit_callbacks(execute=True):
+        return api_client.post(url, data={"factor": factor, "valid_from": valid_from})
+
+
+def test_factor_at_follows_periods(usage_types_cache):
+    UsageTypeFactor.objects.filter(usage_type=100).update(valid_to=datetime(2021, 1, 1, tzinfo=timezone.utc))
+    UsageTypeFactor.objects.create(usage_type_id=100, factor=3, valid_from=datetime(2021, 1, 1, tzinfo=timezone.utc))
+
+    assert usage_types_cache.factor_at(100, datetime(2020, 12, 31, 23, 59, tzinfo=timezone.utc)) == 1.5
+    assert usage_types_cache.factor_at(100, datetime(2021, 1, 1, tzinfo=timezone.utc)) == 3
+    assert usage_types_cache.factor_at(100, datetime(2022, 6, 1)) == 3
+    assert usage_types_cache.factor_at(101, datetime(2021, 1, 1, tzinfo=timezone.utc)) == 26.93
+    assert usage_types_cache.factor_at(999, datetime(2021, 1, 1, tzinfo=timezone.utc)) is None
+
+
+def test_add_factor_period_keeps_history(api_client, django_capture_on_commit_callbacks):
+    old = carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=2, usage_at=datetime(2020, 6, 1, tzinfo=timezone.utc))
+    new = carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=2, usage_at=datetime(2021, 6, 1, tzinfo=timezone.utc))
+    rebuild_rollups()
+    old_rollup = DailyUsageRollup.objects.get(day=old.usage_at.date())
+
+    response = add_factor(api_client, 100, 3, "2021-01-01T00:00:00Z", django_capture_on_commit_callbacks)
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data == {"id": response.data["id"], "factor": 3, "valid_from": "2021-01-01T00:00:00Z", "valid_to": None}
+    old.refresh_from_db()
+    new.refresh_from_db()
+    assert (old.emissions, new.emissions) == (3, 6)
+    assert UsageTypes.objects.get(pk=100).factor == 3
+
+    response = api_client.get(reverse('carbon-usage:usage_types-factors', kwargs={"pk": 100}))
+    assert [(row["factor"], row["valid_from"], row["valid_to"]) for row in response.data] == [
+        (1.5, None, "2021-01-01T00:00:00Z"),
+        (3, "2021-01-01T00:00:00Z", None),
+    ]
+
+    response = api_client.get(f"{reverse('carbon-usage:usage-emissions')}?group_by=month&usage_type=100")
+    assert [row["emissions"] for row in response.data["results"]] == [3, 6]
+    # Only the rollups of the recomputed period are rewritten
+    assert DailyUsageRollup.objects.filter(pk=old_rollup.pk).exists()
+    assert DailyUsageRollup.objects.get(day=new.usage_at.date()).emissions == 6
+
+
+def test_add_factor_period_inside_history(api_client, django_capture_on_commit_callbacks):
+    usages = [
+        carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=1, usage_at=datetime(year, 6, 1, tzinfo=timezone.utc))
+        for year in (2019, 2020, 2021)
+    ]
+    add_factor(api_client, 100, 3, "2021-01-01T00:00:00Z", django_capture_on_commit_callbacks)
+    add_factor(api_client, 100, 2, "2020-01-01T00:00:00Z", django_capture_on_commit_callbacks)
+    # Replaces the factor of the period starting at the same datetime
+    add_factor(api_client, 100, 2.5, "2020-01-01T00:00:00Z", django_capture_on_commit_callbacks)
+
+    for usage in usages:
+        usage.refresh_from_db()
+    assert [usage.emissions for usage in usages] == [1.5, 2.5, 3]
+    assert list(UsageTypeFactor.objects.filter(usage_type=100).order_by(F("valid_to").asc(nulls_last=True)).values_list("factor", "valid_to")) == [
+        (1.5, datetime(2020, 1, 1, tzinfo=timezone.utc)),
+        (2.5, datetime(2021, 1, 1, tzinfo=timezone.utc)),
+        (3, None),
+    ]
+
+
+def test_factor_update_corrects_current_period_only(api_client, django_capture_on_commit_callbacks):
+    old = carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=2, usage_at=datetime(2020, 6, 1, tzinfo=timezone.utc))
+    new = carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=2, usage_at=datetime(2021, 6, 1, tzinfo=timezone.utc))
+    add_factor(api_client, 100, 3, "2021-01-01T00:00:00Z", django_capture_on_commit_callbacks)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.patch(reverse('carbon-usage:usage_types-detail', kwargs={"pk": 100}), data={"factor": 4})
+
+    assert response.status_code == status.HTTP_200_OK
+    old.refresh_from_db()
+    new.refresh_from_db()
+    assert (old.emissions, new.emissions) == (3, 8)
+
+
+def test_usage_type_creation_opens_factor_period(api_client):
+    response = api_client.post(reverse('carbon-usage:usage_types-list'), data={"name": "gas", "unit": "m3", "factor": 2})
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert list(UsageTypeFactor.objects.filter(usage_type=response.data["id"]).values_list("factor", "valid_from", "valid_to")) == [
+        (2, None, None)
+    ]
+
+
+def test_usages_resolve_factor_at_usage_at(api_client, user, django_capture_on_commit_callbacks, django_assert_max_num_queries):
+    add_factor(api_client, 101, 10, "2021-01-01T00:00:00Z", django_capture_on_commit_callbacks)
+    created, _, _ = bulk_create_usages([
+        {"user": user.id, "usage_type": 101, "usage_at": f"{year}-{month:02}-01T00:00:00Z", "amount": 1}
+        for year in (2020, 2021) for month in range(1, 13)
+    ])
+    usage = carbon_usage_recipes.base_usage.make(usage_type_id=101, amount=1, usage_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+    assert usage.emissions == 26.93
+    assert sorted({usage.emissions for usage in Usage.objects.all()}) == [10, 26.93]
+
+    url = reverse('carbon-usage:usage-emissions')
+    with django_assert_max_num_queries(3):
+        response = api_client.get(f"{url}?group_by=month&min_amount=0")
+    assert [row["emissions"] for row in response.data["results"][:2]] == [pytest.approx(2 * 26.93), 26.93]
+    assert response.data["results"][-1]["emissions"] == 10
+
+
+def test_usage_type_has_a_single_open_start():
+    with pytest.raises(IntegrityError), transaction.atomic():
+        UsageTypeFactor.objects.create(usage_type_id=100, factor=2)
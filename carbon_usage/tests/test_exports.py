@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+
+pytestmark = pytest.mark.django_db
+
+
+def streamed_content(response):
+    return b"".join(response.streaming_content).decode()
+
+
+def test_usage_export_is_invalid(client):
+    url = reverse('carbon-usage:usage-export')
+    response = client.get(url)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_usage_export_csv(api_client):
+    usages = carbon_usage_recipes.base_usage.make(_quantity=3, usage_type_id=100)
+    url = reverse('carbon-usage:usage-export')
+    response = api_client.get(f"{url}?ordering=id")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "text/csv"
+    assert response["Content-Disposition"] == 'attachment; filename="usage.csv"'
+    rows = list(csv.reader(io.StringIO(streamed_content(response))))
+    assert rows == [
+        ["id", "user", "usage_type", "usage_at", "amount", "emissions"],
+        *[
+            [
+                str(usage.id),
+                str(usage.user.id),
+                "100",
+                usage.usage_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                str(usage.amount),
+                str(usage.amount * 1.5),
+            ]
+            for usage in usages
+        ]
+    ]
+
+
+def test_usage_export_ndjson_with_filters(api_client):
+    usage = carbon_usage_recipes.base_usage.make(usage_type_id=101, amount=2, usage_at=datetime(2021, 10, 10, 15, 13))
+    carbon_usage_recipes.base_usage.make(_quantity=2, usage_at=datetime(2019, 10, 10, 15, 13))
+    url = reverse('carbon-usage:usage-export')
+    response = api_client.get(f"{url}?export_format=ndjson&min_usage_at=2021-01-01")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in streamed_content(response).splitlines()] == [
+        {
+            "id": usage.id,
+            "user": usage.user.id,
+            "usage_type": 101,
+            "usage_at": "2021-10-10T15:13:00Z",
+            "amount": 2.0,
+            "emissions": pytest.approx(53.86),
+        }
+    ]
+
+
+def test_usage_export_invalid_format(api_client):
+    url = reverse('carbon-usage:usage-export')
+    response = api_client.get(f"{url}?export_format=xml")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
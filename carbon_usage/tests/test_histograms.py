@@ -0,0 +1,114 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+from ..archive import archive_usages
+
+pytestmark = pytest.mark.django_db
+
+URL = reverse('carbon-usage:usage-histogram')
+
+
+@pytest.fixture
+def usages():
+    for usage_type_id, amount, usage_at in [
+        (100, 2, datetime(2021, 1, 1, 10, tzinfo=timezone.utc)),
+        (100, 1, datetime(2021, 1, 3, 23, 30, tzinfo=timezone.utc)),
+        (101, 3, datetime(2021, 1, 3, 8, tzinfo=timezone.utc)),
+    ]:
+        carbon_usage_recipes.base_usage.make(usage_type_id=usage_type_id, amount=amount, usage_at=usage_at)
+
+
+def histogram(api_client, **params):
+    response = api_client.get(URL, params)
+    assert response.status_code == status.HTTP_200_OK, response.data
+    return json.loads(response.content)
+
+
+def test_usage_histogram_is_invalid(client):
+    response = client.get(URL)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_usage_histogram_fills_empty_buckets(api_client, usages):
+    assert histogram(api_client) == {
+        "requested_interval": "day",
+        "timezone": "UTC",
+        "interval": "day",
+        "buckets": ["2021-01-01T00:00:00Z", "2021-01-02T00:00:00Z", "2021-01-03T00:00:00Z"],
+        "series": [
+            {"usage_type": 100, "count": [1, 0, 1], "amount": [2.0, 0.0, 1.0], "emissions": [3.0, 0.0, 1.5]},
+            {"usage_type": 101, "count": [0, 0, 1], "amount": [0.0, 0.0, 3.0], "emissions": [0.0, 0.0, pytest.approx(80.79)]},
+        ],
+    }
+
+
+def test_usage_histogram_buckets_by_local_time(api_client, usages):
+    result = histogram(api_client, timezone="Europe/Berlin", usage_type=100, min_usage_at="2021-01-02T00:00:00Z")
+
+    # 2021-01-03 23:30 UTC is already the 4th in Berlin
+    assert result["buckets"] == [
+        "2021-01-02T00:00:00+01:00", "2021-01-03T00:00:00+01:00", "2021-01-04T00:00:00+01:00",
+    ]
+    assert result["series"] == [{"usage_type": 100, "count": [0, 0, 1], "amount": [0.0, 0.0, 1.0], "emissions": [0.0, 0.0, 1.5]}]
+
+
+def test_usage_histogram_skips_hours_missing_on_dst_change(api_client):
+    carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=1, usage_at=datetime(2021, 3, 14, 7, 30, tzinfo=timezone.utc))
+
+    result = histogram(
+        api_client, interval="hour", timezone="America/New_York",
+        min_usage_at="2021-03-14T00:00:00-05:00", max_usage_at="2021-03-14T04:00:00-04:00",
+    )
+
+    assert result["buckets"] == [
+        "2021-03-14T00:00:00-05:00", "2021-03-14T01:00:00-05:00", "2021-03-14T03:00:00-04:00",
+        "2021-03-14T04:00:00-04:00",
+    ]
+    assert result["series"][0]["count"] == [0, 0, 1, 0]
+
+
+@pytest.mark.parametrize("params, interval, buckets", [
+    ({}, "week", 262),
+    ({"max_buckets": 100}, "month", 60),
+    ({"max_buckets": 50}, "quarter", 20),
+    ({"max_buckets": 5}, "year", 5),
+])
+def test_usage_histogram_downsamples_long_ranges(api_client, usages, params, interval, buckets):
+    result = histogram(
+        api_client, interval="hour", min_usage_at="2016-01-01T00:00:00Z", max_usage_at="2020-12-31T23:00:00Z", **params
+    )
+
+    assert result["requested_interval"] == "hour"
+    assert result["interval"] == interval
+    assert len(result["buckets"]) == buckets
+    assert result["series"] == []
+
+
+@pytest.mark.parametrize("params, field", [
+    ({"interval": "minute"}, "interval"),
+    ({"timezone": "Mars/Olympus_Mons"}, "timezone"),
+    ({"max_buckets": 1001}, "max_buckets"),
+    ({"max_buckets": 1, "interval": "year", "min_usage_at": "2020-01-01", "max_usage_at": "2021-01-01"}, "max_buckets"),
+])
+def test_usage_histogram_parameters_are_validated(api_client, usages, params, field):
+    response = api_client.get(URL, params)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert set(response.data) == {field}
+
+
+def test_usage_histogram_reads_archived_usages(settings, tmp_path, api_client, usages):
+    settings.USAGE_ARCHIVE_ROOT = tmp_path
+    params = {"interval": "hour", "timezone": "Asia/Kathmandu", "max_buckets": 50}
+    before = histogram(api_client, **params)
+
+    assert archive_usages(datetime(2021, 2, 1, tzinfo=timezone.utc)) == 3
+
+    assert histogram(api_client, **params) == before
+    assert before["interval"] == "day"
+    assert before["buckets"][0] == "2021-01-01T00:00:00+05:45"
@@ -0,0 +1,182 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from .. import ingestion
+from ..benchmarks import run_scenario
+from ..models import DailyUsageRollup, Usage
+
+pytestmark = pytest.mark.django_db
+
+
+def test_usage_bulk_is_invalid(client):
+    url = reverse('carbon-usage:usage-bulk')
+    response = client.post(url, data=[], content_type='application/json')
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_usage_bulk_creates_objects(api_client, user, django_assert_max_num_queries):
+    url = reverse('carbon-usage:usage-bulk')
+    data = [
+        {
+            "user": user.id,
+            "usage_type": 100 + index % 5,
+            "usage_at": f"2020-10-10T10:{index:02d}",
+            "amount": index
+        }
+        for index in range(50)
+    ]
+
+    # The insert runs in a savepoint and the keys missing from the usage table are looked up in the archives
+    with django_assert_max_num_queries(15):
+        response = api_client.post(url, data=data, format='json')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data == {"created": 50, "duplicates": 0, "errors": []}
+    assert Usage.objects.count() == 50
+    assert sorted(Usage.objects.values_list("amount", flat=True)) == list(range(50))
+    assert sorted(DailyUsageRollup.objects.values_list("usage_type", "count", "amount")) == [
+        (usage_type_id, 10, sum(range(usage_type_id - 100, 50, 5)))
+        for usage_type_id in range(100, 105)
+    ]
+
+
+def test_usage_bulk_reports_row_errors(api_client, user):
+    url = reverse('carbon-usage:usage-bulk')
+    data = [
+        {"user": user.id, "usage_type": 100, "usage_at": "2020-10-10 10:10", "amount": 1},
+        {"user": user.id, "usage_type": 999, "usage_at": "2020-10-10 10:10", "amount": 2},
+        {"user": user.id, "usage_type": 101, "usage_at": "WRONG", "amount": 3},
+        {"user": 424242, "usage_type": 101, "usage_at": "2020-10-10 10:10", "amount": 4},
+    ]
+    response = api_client.post(url, data=data, format='json')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data["created"] == 1
+    assert [error["index"] for error in response.data["errors"]] == [1, 2, 3]
+    assert list(response.data["errors"][0]["errors"]) == ["usage_type"]
+    assert list(response.data["errors"][1]["errors"]) == ["usage_at"]
+    assert list(response.data["errors"][2]["errors"]) == ["user"]
+    assert list(Usage.objects.values_list("amount", flat=True)) == [1]
+
+
+@pytest.mark.parametrize("data", [
+    {"user": 1},
+    [{"amount": "WRONG"}],
+])
+def test_usage_bulk_rejects_invalid_payloads(api_client, data):
+    url = reverse('carbon-usage:usage-bulk')
+    response = api_client.post(url, data=data, format='json')
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert Usage.objects.count() == 0
+
+
+def test_usage_bulk_rejects_too_many_rows(api_client, settings):
+    settings.USAGE_BULK_MAX_ROWS = 2
+    url = reverse('carbon-usage:usage-bulk')
+    response = api_client.post(url, data=[{}, {}, {}], format='json')
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_bulk_create_benchmark_rolls_back():
+    results = run_scenario("bulk_create", rows=20)
+
+    assert results["rows"] == 20
+    assert results["speedup"] > 0
+    assert Usage.objects.count() == 0
+
+
+def test_usage_create_is_idempotent(api_client, user):
+    url = reverse('carbon-usage:usage-list')
+    data = {"user": user.id, "usage_type": 100, "usage_at": "2021-10-10T10:10:00Z", "amount": 2}
+    created = api_client.post(url, data=data)
+    retried = api_client.post(url, data=data)
+
+    assert created.status_code == status.HTTP_201_CREATED
+    assert retried.status_code == status.HTTP_200_OK
+    assert retried.data == created.data
+    assert list(DailyUsageRollup.objects.values_list("count", "amount")) == [(1, 2)]
+
+    conflict = api_client.post(url, data={**data, "amount": 3})
+    assert conflict.status_code == status.HTTP_409_CONFLICT
+    assert conflict.data["id"] == created.data["id"]
+    assert list(Usage.objects.values_list("amount", flat=True)) == [2]
+
+
+def test_usage_update_to_a_stored_natural_key_conflicts(api_client, user):
+    url = reverse('carbon-usage:usage-list')
+    first = api_client.post(url, data={"user": user.id, "usage_type": 100, "usage_at": "2021-10-10T10:10:00Z", "amount": 2})
+    second = api_client.post(url, data={"user": user.id, "usage_type": 100, "usage_at": "2021-10-10T11:10:00Z", "amount": 2})
+
+    detail_url = reverse('carbon-usage:usage-detail', kwargs={"pk": second.data["id"]})
+    response = api_client.patch(detail_url, data={"usage_at": "2021-10-10T10:10:00Z"})
+
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.data["id"] == first.data["id"]
+    assert Usage.objects.get(pk=second.data["id"]).usage_at.hour == 11
+
+
+def test_usage_bulk_retries_do_not_change_totals(api_client, user, django_assert_num_queries):
+    url = reverse('carbon-usage:usage-bulk')
+    data = [
+        {"user": user.id, "usage_type": 100, "usage_at": f"2020-10-10T10:{index:02d}", "amount": index}
+        for index in range(10)
+    ]
+    api_client.post(url, data=data, format='json')
+    rollups = list(DailyUsageRollup.objects.values_list("count", "amount", "emissions"))
+
+    # The user and natural key lookups between the SAVEPOINT and RELEASE of the transaction, no write
+    with django_assert_num_queries(4):
+        response = api_client.post(url, data=data, format='json')
+
+    assert response.data == {"created": 0, "duplicates": 10, "errors": []}
+    assert Usage.objects.count() == 10
+    assert list(DailyUsageRollup.objects.values_list("count", "amount", "emissions")) == rollups
+
+
+def test_usage_bulk_reports_natural_key_conflicts(api_client, user):
+    url = reverse('carbon-usage:usage-bulk')
+    row = {"user": user.id, "usage_type": 100, "usage_at": "2020-10-10T10:10:00Z", "amount": 1}
+    api_client.post(url, data=[row], format='json')
+
+    response = api_client.post(url, data=[
+        row,
+        {**row, "amount": 2},
+        {**row, "usage_at": "2020-10-10T11:10:00Z"},
+        {**row, "usage_at": "2020-10-10T11:10:00Z"},
+        {**row, "usage_at": "2020-10-10T11:10:00Z", "amount": 5},
+    ], format='json')
+
+    assert response.data["created"] == 1
+    assert response.data["duplicates"] == 2
+    assert [(error["index"], list(error["errors"])) for error in response.data["errors"]] == [
+        (1, ["usage_at"]), (4, ["usage_at"])
+    ]
+    assert sorted(Usage.objects.values_list("amount", flat=True)) == [1, 1]
+
+
+def test_usage_bulk_checks_keys_stored_concurrently_again(api_client, user, monkeypatch):
+    url = reverse('carbon-usage:usage-bulk')
+    row = {"user": user.id, "usage_type": 100, "usage_at": "2020-10-10T10:10:00Z", "amount": 1}
+    api_client.post(url, data=[row, {**row, "usage_at": "2020-10-10T11:10:00Z"}], format='json')
+    lookups = []
+    existing_amounts = ingestion.existing_amounts
+
+    def stale_existing_amounts(keys):
+        # The first lookup runs before a concurrent request stores the same keys
+        lookups.append(keys)
+        return existing_amounts(keys) if len(lookups) > 1 else {}
+
+    monkeypatch.setattr(ingestion, "existing_amounts", stale_existing_amounts)
+    response = api_client.post(url, data=[
+        row, {**row, "usage_at": "2020-10-10T11:10:00Z", "amount": 2}, {**row, "usage_at": "2020-10-10T12:10:00Z"},
+    ], format='json')
+
+    assert len(lookups) == 2
+    assert response.data["created"] == 1
+    assert response.data["duplicates"] == 1
+    assert [(error["index"], list(error["errors"])) for error in response.data["errors"]] == [(1, ["usage_at"])]
+    assert Usage.objects.count() == 3
+    assert DailyUsageRollup.objects.get().count == 3
@@ -0,0 +1,70 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+
+from . import mommy_recipes as carbon_usage_recipes
+from ..instrumentation import (
+    REQUEST_DB_SECONDS, REQUEST_QUERIES, REQUEST_SECONDS, REQUEST_SERIALIZATION_SECONDS, REQUESTS, RESPONSE_BYTES
+)
+
+pytestmark = pytest.mark.django_db
+
+LIST_ROUTE = "carbon-usage:usage-list"
+
+
+def test_sampled_requests_are_observed_by_route(api_client, settings):
+    settings.REQUEST_METRICS_SAMPLE_RATE = 1
+    carbon_usage_recipes.base_usage.make(_quantity=3)
+    queries, requests = REQUEST_QUERIES.sum(route=LIST_ROUTE), REQUEST_SECONDS.count(route=LIST_ROUTE, method="GET")
+    responses = RESPONSE_BYTES.sum(route=LIST_ROUTE)
+
+    response = api_client.get(reverse(LIST_ROUTE))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert REQUEST_SECONDS.count(route=LIST_ROUTE, method="GET") == requests + 1
+    assert REQUEST_QUERIES.sum(route=LIST_ROUTE) == queries + 2
+    assert REQUEST_DB_SECONDS.count(route=LIST_ROUTE) == REQUEST_SERIALIZATION_SECONDS.count(route=LIST_ROUTE)
+    assert RESPONSE_BYTES.sum(route=LIST_ROUTE) == responses + len(response.content)
+
+
+def test_serialization_time_covers_serializers_and_rendering(api_client, settings):
+    settings.REQUEST_METRICS_SAMPLE_RATE = 1
+    usage = carbon_usage_recipes.base_usage.make()
+    route = "carbon-usage:usage-detail"
+    serialization = REQUEST_SERIALIZATION_SECONDS.sum(route=route)
+
+    api_client.get(reverse(route, kwargs={"pk": usage.pk}))
+
+    assert REQUEST_SERIALIZATION_SECONDS.sum(route=route) > serialization
+
+
+def test_unmatched_and_token_routes(client, user, settings):
+    settings.REQUEST_METRICS_SAMPLE_RATE = 1
+    not_found = REQUESTS.value(route="unmatched", method="GET", status=404)
+    obtained = REQUESTS.value(route="token_obtain_pair", method="POST", status=200)
+
+    client.get("/missing/")
+    client.post(reverse("token_obtain_pair"), data={"username": "john", "password": "js.sj"})
+
+    assert REQUESTS.value(route="unmatched", method="GET", status=404) == not_found + 1
+    assert REQUESTS.value(route="token_obtain_pair", method="POST", status=200) == obtained + 1
+
+
+def test_requests_out_of_the_sample_are_not_observed(api_client, settings):
+    settings.REQUEST_METRICS_SAMPLE_RATE = 0
+    requests = REQUEST_SECONDS.count(route=LIST_ROUTE, method="GET")
+
+    api_client.get(reverse(LIST_ROUTE))
+
+    assert REQUEST_SECONDS.count(route=LIST_ROUTE, method="GET") == requests
+
+
+def test_request_metrics_are_exposed(client, settings):
+    settings.REQUEST_METRICS_SAMPLE_RATE = 1
+    settings.METRICS_TOKEN = "scrape"
+    client.get(reverse("carbon-usage:metrics"), HTTP_AUTHORIZATION="Bearer scrape")
+
+    body = client.get(reverse("carbon-usage:metrics"), HTTP_AUTHORIZATION="Bearer scrape").content.decode()
+
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_db_queries_count{route="carbon-usage:metrics"}' in body
@@ -0,0 +1,281 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from . import mommy_recipes as carbon_usage_recipes
+from ..authentication import UserStateRefreshToken
+from ..jobs import HANDLERS, JOB_FAILED_ERROR, claim_job, delete_expired_jobs, enqueue, requeue_stale_jobs, run_job
+from ..models import Job, Usage
+from ..rollups import rebuild_rollups
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def results_root(settings, tmp_path):
+    settings.JOB_RESULTS_ROOT = tmp_path
+    return tmp_path
+
+
+def run_queued_jobs():
+    jobs = []
+    job = claim_job()
+    while job is not None:
+        jobs.append(run_job(job))
+        job = claim_job()
+    return jobs
+
+
+def test_report_is_invalid(client):
+    response = client.post(reverse('carbon-usage:reports-list'), data={"kind": "export"})
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_export_report_is_queued_run_and_downloaded(api_client):
+    usage = carbon_usage_recipes.base_usage.make(usage_type_id=101, amount=2, usage_at=datetime(2021, 10, 10, 15, 13))
+    carbon_usage_recipes.base_usage.make(_quantity=2, usage_at=datetime(2019, 10, 10, 15, 13))
+
+    response = api_client.post(reverse('carbon-usage:reports-list'), data={
+        "kind": "export", "export_format": "csv", "filters": {"min_usage_at": "2021-01-01"},
+    }, format="json")
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.data["status"] == Job.QUEUED
+    assert response.data["parameters"] == {"filters": {"min_usage_at": "2021-01-01"}, "export_format": "csv"}
+    assert response.data["download"] is None
+    status_url = response["Location"]
+    assert status_url == response.data["url"]
+
+    download_url = reverse('carbon-usage:reports-download', kwargs={"pk": response.data["id"]})
+    assert api_client.get(download_url).status_code == status.HTTP_409_CONFLICT
+
+    [job] = run_queued_jobs()
+    assert job.status == Job.SUCCEEDED
+
+    response = api_client.get(status_url)
+    assert response.data["status"] == Job.SUCCEEDED
+    assert response.data["attempts"] == 1
+    assert response.data["download"].endswith(download_url)
+
+    response = api_client.get(download_url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "text/csv"
+    assert response["Content-Disposition"] == 'attachment; filename="usage-export.csv"'
+    rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+    assert rows == [
+        ["id", "user", "usage_type", "usage_at", "amount", "emissions"],
+        [str(usage.id), str(usage.user.id), "101", "2021-10-10T15:13:00Z", "2.0", str(usage.emissions)],
+    ]
+
+
+def test_emissions_report_matches_the_emissions_endpoint(api_client):
+    carbon_usage_recipes.base_usage.make(
+        usage_type_id=100, amount=2, usage_at=datetime(2021, 3, 10, tzinfo=dt_timezone.utc)
+    )
+    carbon_usage_recipes.base_usage.make(
+        usage_type_id=101, amount=3, usage_at=datetime(2021, 4, 2, 12, tzinfo=dt_timezone.utc)
+    )
+    rebuild_rollups()
+
+    response = api_client.post(reverse('carbon-usage:reports-list'), data={
+        "kind": "emissions", "group_by": "month", "filters": {"min_usage_at": "2021-01-01"},
+    }, format="json")
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    run_queued_jobs()
+
+    response = api_client.get(reverse('carbon-usage:reports-download', kwargs={"pk": response.data["id"]}))
+    assert response["Content-Type"] == "application/json"
+    report = json.loads(b"".join(response.streaming_content))
+    expected = api_client.get(reverse('carbon-usage:usage-emissions'), {"group_by": "month", "min_usage_at": "2021-01-01"})
+    assert report == json.loads(expected.content)
+    assert [row["count"] for row in report["results"]] == [1, 1]
+
+
+@pytest.mark.parametrize("data, errors", [
+    ({"kind": "unknown"}, {"kind"}),
+    ({"kind": "export", "filters": {"min_usage_at": "yesterday"}}, {"filters"}),
+    ({"kind": "export", "filters": {"usage_type": "999"}}, {"filters"}),
+    ({"kind": "emissions", "group_by": "year"}, {"group_by"}),
+])
+def test_report_parameters_are_validated(api_client, data, errors):
+    response = api_client.post(reverse('carbon-usage:reports-list'), data=data, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert set(response.data) == errors
+    assert not Job.objects.exists()
+
+
+def test_reports_are_only_visible_to_their_user(api_client, user):
+    other = carbon_usage_recipes.base_user.make()
+    other_job = enqueue('export', {"filters": {}, "export_format": "csv"}, user=other)
+    own_job = enqueue('export', {"filters": {}, "export_format": "csv"}, user=user)
+    enqueue('recompute_emissions', {"usage_type": 100, "start": None, "end": None})
+
+    response = api_client.get(reverse('carbon-usage:reports-list'))
+
+    assert [report["id"] for report in response.data["results"]] == [own_job.pk]
+    response = api_client.get(reverse('carbon-usage:reports-detail', kwargs={"pk": other_job.pk}))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_claim_job_takes_the_oldest_due_job_once():
+    first = enqueue('noop')
+    second = enqueue('noop')
+    Job.objects.filter(pk=second.pk).update(run_after=timezone.now() + timedelta(minutes=5))
+
+    claimed = claim_job()
+
+    assert claimed.pk == first.pk
+    assert claimed.status == Job.RUNNING
+    assert claimed.attempts == 1
+    assert Job.objects.get(pk=first.pk).status == Job.RUNNING
+    assert claim_job() is None
+
+
+def test_failing_job_is_retried_then_failed(settings, monkeypatch, caplog):
+    settings.JOB_MAX_ATTEMPTS = 2
+    settings.JOB_RETRY_DELAY = 0
+
+    def broken(job):
+        raise RuntimeError('relation "secret" does not exist')
+
+    monkeypatch.setitem(HANDLERS, 'broken', broken)
+    job = enqueue('broken')
+
+    run_job(claim_job())
+    job.refresh_from_db()
+    # The exception is only logged, users see a generic error
+    assert (job.status, job.attempts, job.error) == (Job.QUEUED, 1, JOB_FAILED_ERROR)
+    assert 'secret' in caplog.records[-1].exc_text
+
+    run_job(claim_job())
+    job.refresh_from_db()
+    assert (job.status, job.attempts) == (Job.FAILED, 2)
+    assert job.finished_at is not None
+    assert claim_job() is None
+
+
+def test_abandoned_jobs_are_queued_again(settings):
+    settings.JOB_MAX_ATTEMPTS = 2
+    settings.JOB_RETRY_DELAY = 0
+    abandoned, out_of_attempts, running = (enqueue('noop') for _ in range(3))
+    long_ago = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT + 1)
+    Job.objects.filter(pk__in=[abandoned.pk, out_of_attempts.pk, running.pk]).update(
+        status=Job.RUNNING, attempts=1, started_at=long_ago, updated_at=long_ago
+    )
+    Job.objects.filter(pk=out_of_attempts.pk).update(attempts=2)
+    # Started as long ago, but its worker is still sending heartbeats
+    Job.objects.filter(pk=running.pk).update(updated_at=timezone.now())
+
+    assert requeue_stale_jobs() == 2
+
+    statuses = dict(Job.objects.values_list('pk', 'status'))
+    assert statuses == {abandoned.pk: Job.QUEUED, out_of_attempts.pk: Job.FAILED, running.pk: Job.RUNNING}
+    assert Job.objects.get(pk=abandoned.pk).error == 'Abandoned by its worker.'
+
+
+def test_job_outcome_is_discarded_once_claimed_again(monkeypatch):
+    monkeypatch.setitem(HANDLERS, 'noop', lambda job: None)
+    enqueue('noop')
+    job = claim_job()
+    # Taken for abandoned and claimed by another worker while it was running
+    Job.objects.filter(pk=job.pk).update(attempts=2)
+
+    run_job(job)
+
+    job.refresh_from_db()
+    assert (job.status, job.attempts, job.finished_at) == (Job.RUNNING, 2, None)
+
+
+def test_expired_jobs_are_deleted_with_their_results(settings, results_root):
+    expired, recent = (enqueue('export') for _ in range(2))
+    directory = results_root / f'job={expired.pk}'
+    directory.mkdir()
+    (directory / 'export.csv').write_text('id\n')
+    Job.objects.filter(pk=expired.pk).update(
+        status=Job.SUCCEEDED, result_path=f'job={expired.pk}/export.csv',
+        finished_at=timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS, seconds=1),
+    )
+    Job.objects.filter(pk=recent.pk).update(status=Job.SUCCEEDED, finished_at=timezone.now())
+
+    assert delete_expired_jobs() == 1
+
+    assert list(Job.objects.values_list('pk', flat=True)) == [recent.pk]
+    assert not directory.exists()
+
+
+def test_factor_change_queues_emissions_recompute(settings, api_client, django_capture_on_commit_callbacks):
+    settings.USAGE_EMISSIONS_RECOMPUTE_ASYNC = True
+    usage = carbon_usage_recipes.base_usage.make(
+        usage_type_id=101, amount=2, usage_at=datetime(2100, 1, 1, tzinfo=dt_timezone.utc)
+    )
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.patch(reverse('carbon-usage:usage_types-detail', kwargs={"pk": 101}), data={"factor": 10})
+    assert response.status_code == status.HTTP_200_OK
+
+    job = Job.objects.get(kind='recompute_emissions')
+    # The factor is effective from now on
+    assert job.parameters["usage_type"] == 101
+    assert job.parameters["start"] is not None and job.parameters["end"] is None
+    usage.refresh_from_db()
+    assert usage.emissions == pytest.approx(53.86)
+
+    run_queued_jobs()
+    usage.refresh_from_db()
+    assert usage.emissions == 20
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_jobs_command_runs_due_jobs(results_root):
+    user = carbon_usage_recipes.base_user.make()
+    # Transactional tests flush the usage types of the data migration
+    usage_type = carbon_usage_recipes.base_usage_types.make(factor=2)
+    carbon_usage_recipes.base_usage.make(usage_type=usage_type, amount=2, user=user)
+    rebuild_rollups()
+    job = enqueue('emissions', {"filters": {"user": str(user.pk)}, "group_by": None}, user=user)
+    out = StringIO()
+
+    call_command("run_jobs", "--processes", "1", "--burst", stdout=out)
+
+    assert out.getvalue() == "Ran 1 jobs.\n"
+    job.refresh_from_db()
+    assert job.status == Job.SUCCEEDED
+    report = json.loads((results_root / job.result_path).read_text())
+    assert report["results"][0]["count"] == Usage.objects.count() == 1
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {UserStateRefreshToken.for_user(user).access_token}')
+    assert client.get(reverse('carbon-usage:reports-download', kwargs={"pk": job.pk})).status_code == 200
+
+
+@pytest.mark.django_db(transaction=True)
+def test_running_jobs_send_heartbeats(settings, monkeypatch):
+    settings.JOB_HEARTBEAT_INTERVAL = 0.01
+    settings.JOB_TIMEOUT = 0.05
+    beats = []
+
+    def slow(job):
+        for _ in range(10):
+            time.sleep(0.02)
+            beats.append(Job.objects.get(pk=job.pk).updated_at)
+            # The heartbeat keeps a job running longer than JOB_TIMEOUT from being taken for abandoned
+            assert requeue_stale_jobs() == 0
+
+    monkeypatch.setitem(HANDLERS, 'slow', slow)
+    enqueue('slow')
+
+    job = run_job(claim_job())
+
+    assert job.status == Job.SUCCEEDED
+    assert len(set(beats)) > 1
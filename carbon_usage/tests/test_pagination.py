@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+
+pytestmark = pytest.mark.django_db
+
+
+def walk_pages(api_client, url):
+    ids = []
+    pages = 0
+    while url:
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert "count" not in response.data
+        ids.extend(usage["id"] for usage in response.data["results"])
+        url = response.data["next"]
+        pages += 1
+    return ids, pages
+
+
+def test_usage_keyset_pagination_orders_by_usage_at(api_client):
+    start = datetime(2021, 10, 10, 15, 13)
+    usages = [
+        carbon_usage_recipes.base_usage.make(usage_at=start - timedelta(hours=index))
+        for index in range(7)
+    ]
+    # Rows sharing the same usage_at are ordered by id
+    usages.extend(carbon_usage_recipes.base_usage.make(_quantity=3, usage_at=start))
+    url = reverse('carbon-usage:usage-list')
+
+    ids, pages = walk_pages(api_client, f"{url}?pagination=keyset&limit=3")
+
+    assert pages == 4
+    assert ids == [
+        usage.id for usage in sorted(usages, key=lambda usage: (usage.usage_at, usage.id))
+    ]
+
+
+@pytest.mark.parametrize("ordering, sort_key", [
+    ("-amount", lambda usage: (-usage.amount, usage.id)),
+    ("usage_type", lambda usage: (usage.usage_type_id, usage.id)),
+    ("-id", lambda usage: -usage.id),
+])
+def test_usage_keyset_pagination_with_ordering(api_client, ordering, sort_key):
+    usages = carbon_usage_recipes.base_usage.make(_quantity=4, amount=5)
+    usages.extend(carbon_usage_recipes.base_usage.make(_quantity=4, amount=1))
+    url = reverse('carbon-usage:usage-list')
+
+    ids, _ = walk_pages(api_client, f"{url}?pagination=keyset&limit=3&ordering={ordering}")
+
+    assert ids == [usage.id for usage in sorted(usages, key=sort_key)]
+
+
+def test_usage_keyset_pagination_with_filters(api_client):
+    carbon_usage_recipes.base_usage.make(_quantity=3, amount=15)
+    carbon_usage_recipes.base_usage.make(_quantity=3, amount=3)
+    url = reverse('carbon-usage:usage-list')
+
+    response = api_client.get(f"{url}?pagination=keyset&min_amount=12")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["next"] is None
+    assert [usage["amount"] for usage in response.data["results"]] == [15, 15, 15]
+
+
+@pytest.mark.parametrize("cursor", ["WRONG", "eyJvIjpbImlkIl0sInAiOlsxXX0"])
+def test_usage_keyset_pagination_invalid_cursor(api_client, cursor):
+    url = reverse('carbon-usage:usage-list')
+    response = api_client.get(f"{url}?cursor={cursor}")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_usage_types_keyset_pagination(api_client):
+    url = reverse('carbon-usage:usage_types-list')
+
+    ids, pages = walk_pages(api_client, f"{url}?pagination=keyset&limit=2&ordering=-factor")
+
+    assert pages == 3
+    assert ids == [101, 104, 103, 102, 100]
@@ -0,0 +1,84 @@
+from datetime import date, datetime, timedelta, timezone
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone as django_timezone
+
+from . import mommy_recipes as carbon_usage_recipes
+from ..management.commands import manage_usage_partitions as command
+from ..models import DailyUsageRollup, Usage
+from ..partitions import add_months, is_partitioned, month_start, months_between, partition_month, partition_name
+from ..rollups import rebuild_rollups
+
+
+def test_month_start_is_utc():
+    cet = timezone(timedelta(hours=1))
+
+    assert month_start(datetime(2021, 3, 1, 0, 30, tzinfo=cet)) == datetime(2021, 2, 1, tzinfo=timezone.utc)
+    assert month_start(date(2021, 3, 17)) == datetime(2021, 3, 1, tzinfo=timezone.utc)
+
+
+def test_add_months_crosses_years():
+    month = datetime(2021, 11, 1, tzinfo=timezone.utc)
+
+    assert add_months(month, 2) == datetime(2022, 1, 1, tzinfo=timezone.utc)
+    assert add_months(month, -11) == datetime(2020, 12, 1, tzinfo=timezone.utc)
+
+
+def test_months_between():
+    months = list(months_between(datetime(2021, 11, 20, tzinfo=timezone.utc), date(2022, 2, 1)))
+
+    assert [partition_name(month) for month in months] == [
+        "carbon_usage_usage_p2021_11",
+        "carbon_usage_usage_p2021_12",
+        "carbon_usage_usage_p2022_01",
+        "carbon_usage_usage_p2022_02",
+    ]
+
+
+def test_partition_month_parses_names():
+    assert partition_month("carbon_usage_usage_p2021_03") == datetime(2021, 3, 1, tzinfo=timezone.utc)
+    assert partition_month("carbon_usage_usage_default") is None
+
+
+@pytest.mark.django_db
+def test_usage_table_is_not_partitioned_on_sqlite():
+    assert not is_partitioned(connection)
+
+    with pytest.raises(CommandError, match="not partitioned"):
+        call_command("manage_usage_partitions")
+
+
+@pytest.mark.django_db
+def test_old_partitions_are_archived_before_they_are_detached(api_client, user, settings, tmp_path, monkeypatch):
+    settings.USAGE_ARCHIVE_ROOT = tmp_path
+    current = month_start(django_timezone.now())
+    old = add_months(current, -2)
+    for usage_at in (old, current):
+        carbon_usage_recipes.base_usage.make(user=user, usage_type_id=100, amount=2, usage_at=usage_at)
+    rebuild_rollups()
+    url = reverse('carbon-usage:usage-emissions')
+    expected = api_client.get(url).data["results"]
+    # The partition DDL needs PostgreSQL
+    detached = []
+    monkeypatch.setattr(command, "is_partitioned", lambda connection: True)
+    monkeypatch.setattr(command, "partitions", lambda connection: [
+        partition_name(month) for month in months_between(old, add_months(current, 3))
+    ])
+    monkeypatch.setattr(command, "detach_partition", lambda connection, name, **options: detached.append(name))
+    out = StringIO()
+
+    call_command("manage_usage_partitions", "--retain-months", "1", stdout=out)
+
+    assert out.getvalue().splitlines() == [
+        f"Archived 1 usages of the months before {current:%Y-%m}.",
+        f"Detached {partition_name(old)}.",
+        f"Detached {partition_name(add_months(old, 1))}.",
+    ]
+    assert detached == [partition_name(old), partition_name(add_months(old, 1))]
+    assert list(Usage.objects.values_list("usage_at", flat=True)) == [current]
+    assert not DailyUsageRollup.objects.filter(day__lt=current.date()).exists()
+    assert api_client.get(url).data["results"] == expected
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+
+import pytest
+from django.db.utils import ConnectionHandler
+from django.urls import reverse
+from rest_framework import status
+
+from ..pool import POOL_CHECKOUTS, POOL_DISCARDS, POOL_WAITS, ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(alias, **kwargs):
+    opened = []
+
+    def connect():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    return ConnectionPool(alias, connect, **{"max_size": 2, "timeout": 0.05, **kwargs}), opened
+
+
+def test_pool_reuses_connections():
+    pool, opened = make_pool("reuse")
+
+    connection = pool.checkout()
+    pool.checkin(connection)
+    assert pool.checkout() is connection
+    assert len(opened) == 1
+    assert POOL_CHECKOUTS.value(alias="reuse") == 2
+
+
+def test_pool_waits_for_returned_connections():
+    pool, opened = make_pool("wait", timeout=1)
+    first, second = pool.checkout(), pool.checkout()
+
+    threading.Timer(0.05, pool.checkin, (first,)).start()
+    assert pool.checkout() is first
+    assert second is not first
+    assert POOL_WAITS.value(alias="wait") == 1
+
+    with pytest.raises(PoolTimeout):
+        pool.timeout = 0.01
+        pool.checkout()
+    assert len(opened) == 2
+
+
+def test_pool_replaces_old_and_unusable_connections():
+    pool, opened = make_pool("discard", max_age=0.01, is_usable=lambda connection: connection is not opened[1])
+    old = pool.checkout()
+    pool.checkin(old)
+    time.sleep(0.02)
+
+    fresh = pool.checkout()
+    assert fresh is not old and old.closed
+    pool.checkin(fresh)
+    assert pool.checkout() is opened[2]
+    assert POOL_DISCARDS.value(alias="discard", reason="max_age") == 1
+    assert POOL_DISCARDS.value(alias="discard", reason="unusable") == 1
+
+
+def test_pool_discards_connections_failing_reset():
+    def reset(connection):
+        raise RuntimeError("connection already closed")
+
+    pool, opened = make_pool("reset", reset=reset)
+    connection = pool.checkout()
+    pool.checkin(connection)
+
+    assert connection.closed
+    assert pool.checkout() is opened[1]
+
+
+def test_pool_bounds_concurrent_connections():
+    pool, opened = make_pool("concurrent", max_size=3, timeout=5)
+
+    def work():
+        for _ in range(20):
+            connection = pool.checkout()
+            time.sleep(0.001)
+            pool.checkin(connection)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(opened) <= 3
+    assert POOL_CHECKOUTS.value(alias="concurrent") == 160
+
+
+@pytest.mark.skipif(not os.environ.get("DATABASE_DEFAULT_HOST"), reason="Needs a PostgreSQL server in DATABASE_DEFAULT_*")
+def test_postgresql_backend_pools_connections(django_db_blocker):
+    psycopg2 = pytest.importorskip("psycopg2")
+    from ..backends.postgresql.base import _pools
+
+    alias = "postgresql_pool"
+    connections = ConnectionHandler({alias: {
+        "ENGINE": "carbon_usage.backends.postgresql",
+        "NAME": os.environ["DATABASE_DEFAULT_NAME"],
+        "USER": os.environ["DATABASE_DEFAULT_USER"],
+        "PASSWORD": os.environ["DATABASE_DEFAULT_PASSWORD"],
+        "HOST": os.environ["DATABASE_DEFAULT_HOST"],
+        "PORT": os.environ["DATABASE_DEFAULT_PORT"],
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": True,
+        "POOL": {"MAX_SIZE": 2, "TIMEOUT": 1},
+    }})
+    database = connections[alias]
+
+    def backend_pid():
+        with database.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            return cursor.fetchone()[0]
+
+    with django_db_blocker.unblock():
+        try:
+            pid = backend_pid()
+        except psycopg2.OperationalError as error:
+            pytest.skip(f"PostgreSQL is unavailable: {error}")
+        try:
+            # Closing returns the connection to the pool, the next query checks it out again
+            checked_out = database.connection
+            database.close()
+            assert database.connection is None and list(_pools[alias]._idle) == [checked_out]
+            assert backend_pid() == pid and database.connection is checked_out
+            assert POOL_CHECKOUTS.value(alias=alias) == 2
+
+            # A connection killed while it sits in the pool is evicted at checkout
+            database.close()
+            killer = psycopg2.connect(**database.get_connection_params())
+            try:
+                killer.autocommit = True
+                with killer.cursor() as cursor:
+                    cursor.execute("SELECT pg_terminate_backend(%s)", [pid])
+                    while cursor.execute("SELECT 1 FROM pg_stat_activity WHERE pid = %s", [pid]) or cursor.fetchone():
+                        time.sleep(0.01)
+            finally:
+                killer.close()
+            assert backend_pid() != pid
+            assert checked_out.closed
+            assert POOL_DISCARDS.value(alias=alias, reason="unusable") == 1
+        finally:
+            database.close()
+            _pools.pop(alias).close_all()
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, settings):
+    url = reverse('carbon-usage:metrics')
+    assert client.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+    settings.METRICS_TOKEN = "scrape"
+    assert client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code == status.HTTP_404_NOT_FOUND
+    make_pool("scraped")[0].checkout()
+    response = client.get(url, HTTP_AUTHORIZATION="Bearer scrape")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+    body = response.content.decode()
+    assert "# TYPE db_pool_checkouts_total counter" in body
+    assert 'db_pool_checkouts_total{alias="scraped"} 1' in body
+    assert 'db_pool_connection_age_seconds_bucket{alias="scraped",le="+Inf"} 1' in body
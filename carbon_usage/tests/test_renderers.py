@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from . import mommy_recipes as carbon_usage_recipes
+from ..models import Usage
+from ..renderers import FastJSONRenderer, orjson
+from ..serializers import UsageSerializer
+
+pytestmark = pytest.mark.django_db
+
+needs_orjson = pytest.mark.skipif(orjson is None, reason="Only orjson formats floats differently")
+
+
+@pytest.mark.parametrize("data", [
+    OrderedDict([("count", 1), ("next", None), ("results", [{"amount": 1.5, "name": "água "}])]),
+    {"usage_at": datetime(2021, 10, 10, 15, 13, 34, 54543, tzinfo=timezone.utc), "amount": Decimal("1.50")},
+    {"usage_at": datetime(2021, 10, 10, 15, 13, tzinfo=timezone.utc), "detail": gettext_lazy("Not found.")},
+])
+def test_fast_json_renderer_matches_json_renderer(data):
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+@pytest.mark.parametrize("value, fast, default", [
+    (1e16, b"1e16", b"1e+16"),
+    (1e-7, b"1e-7", b"1e-07"),
+    (2.5e-5, b"0.000025", b"2.5e-05"),
+    (0.1, b"0.1", b"0.1"),
+    (123456789.123, b"123456789.123", b"123456789.123"),
+])
+@needs_orjson
+def test_fast_json_renderer_float_format(value, fast, default):
+    # The float forms differ but parse to the same value
+    assert FastJSONRenderer().render({"amount": value}) == b'{"amount":' + fast + b'}'
+    assert JSONRenderer().render({"amount": value}) == b'{"amount":' + default + b'}'
+    assert float(fast) == float(default) == value
+
+
+@pytest.mark.parametrize("value", [float("nan"), float("inf"), float("-inf")])
+@needs_orjson
+def test_fast_json_renderer_non_finite_floats(value):
+    assert FastJSONRenderer().render({"amount": value}) == b'{"amount":null}'
+    with pytest.raises(ValueError):
+        JSONRenderer().render({"amount": value})
+
+
+def test_fast_json_renderer_indented_output():
+    renderer = FastJSONRenderer()
+
+    assert renderer.render({"a": 1}, "application/json; indent=2") == JSONRenderer().render(
+        {"a": 1}, "application/json; indent=2"
+    )
+
+
+def test_usage_list_is_byte_compatible(api_client):
+    usages = carbon_usage_recipes.base_usage.make(_quantity=5)
+    carbon_usage_recipes.base_usage.make(usage_at=datetime(2021, 10, 10, 15, 13, tzinfo=timezone.utc))
+    url = reverse('carbon-usage:usage-list')
+    response = api_client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == JSONRenderer().render(OrderedDict([
+        ("count", 6),
+        ("next", None),
+        ("previous", None),
+        ("results", UsageSerializer(sorted(Usage.objects.all(), key=lambda usage: usage.id), many=True).data),
+    ]))
+    assert response.data["results"][0]["usage_at"] == usages[0].usage_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    assert response.data["results"][5]["usage_at"] == "2021-10-10T15:13:00Z"
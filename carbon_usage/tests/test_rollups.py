@@ -0,0 +1,131 @@
+import threading
+from datetime import date, datetime, timedelta, timezone
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+from ..models import DailyUsageRollup
+from ..rollups import rebuild_rollups, refresh_rollups, rollup_key
+
+pytestmark = pytest.mark.django_db
+
+
+def rollups():
+    return list(DailyUsageRollup.objects.order_by("day", "usage_type").values_list(
+        "user", "usage_type", "day", "count", "amount", "emissions"
+    ))
+
+
+def test_rollups_follow_usage_changes(api_client, user):
+    url = reverse('carbon-usage:usage-list')
+    response = api_client.post(url, data={
+        "user": user.id, "usage_type": 100, "usage_at": "2021-10-10 10:10", "amount": 2
+    })
+    assert response.status_code == status.HTTP_201_CREATED
+    usage_id = response.data["id"]
+    api_client.post(url, data={"user": user.id, "usage_type": 100, "usage_at": "2021-10-10 23:10", "amount": 4})
+
+    assert rollups() == [(user.id, 100, date(2021, 10, 10), 2, 6, 9)]
+
+    detail_url = reverse('carbon-usage:usage-detail', kwargs={"pk": usage_id})
+    response = api_client.patch(detail_url, data={"usage_type": 101, "usage_at": "2021-10-11 01:00"})
+    assert response.status_code == status.HTTP_200_OK
+
+    assert rollups() == [
+        (user.id, 100, date(2021, 10, 10), 1, 4, 6),
+        (user.id, 101, date(2021, 10, 11), 1, 2, 53.86),
+    ]
+
+    response = api_client.delete(detail_url)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    assert rollups() == [(user.id, 100, date(2021, 10, 10), 1, 4, 6)]
+
+
+def test_rollups_follow_factor_changes(api_client, django_capture_on_commit_callbacks):
+    usage = carbon_usage_recipes.base_usage.make(
+        usage_type_id=101, amount=2, usage_at=datetime(2100, 10, 10, tzinfo=timezone.utc)
+    )
+    rebuild_rollups()
+    url = reverse('carbon-usage:usage_types-detail', kwargs={"pk": 101})
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.patch(url, data={"factor": 10})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert rollups() == [(usage.user_id, 101, date(2100, 10, 10), 1, 2, 20)]
+
+
+def test_rebuild_usage_rollups_command():
+    carbon_usage_recipes.base_usage.make(_quantity=3, usage_type_id=100, amount=1)
+    DailyUsageRollup.objects.create(
+        user=carbon_usage_recipes.base_user.make(), usage_type_id=101, day=date(2000, 1, 1),
+        count=1, amount=1, emissions=1, min_emissions=1, max_emissions=1
+    )
+    call_command("rebuild_usage_rollups", stdout=StringIO())
+
+    assert DailyUsageRollup.objects.filter(usage_type=101).count() == 0
+    assert sum(DailyUsageRollup.objects.values_list("count", flat=True)) == 3
+
+
+def test_refresh_only_rewrites_the_given_keys():
+    user, other = carbon_usage_recipes.base_user.make(_quantity=2)
+    at = datetime(2021, 10, 10, tzinfo=timezone.utc)
+    for owner in (user, other):
+        for day in range(3):
+            carbon_usage_recipes.base_usage.make(
+                user=owner, usage_type_id=100, amount=1, usage_at=at + timedelta(days=day)
+            )
+    rebuild_rollups()
+    before = set(DailyUsageRollup.objects.values_list("pk", "user", "day"))
+    keys = {
+        rollup_key(carbon_usage_recipes.base_usage.make(user=owner, usage_type_id=100, amount=1, usage_at=usage_at))
+        for owner, usage_at in ((user, at + timedelta(hours=1)), (other, at + timedelta(days=2, hours=1)))
+    }
+
+    refresh_rollups(keys)
+
+    days = [(at + timedelta(days=day)).date() for day in range(3)]
+    assert sorted(DailyUsageRollup.objects.values_list("user", "day", "count")) == sorted(
+        (owner.id, day, 2 if (owner.id, 100, day) in keys else 1) for owner in (user, other) for day in days
+    )
+    # The rows of the keys in between, such as the other user on the first day, are not rewritten
+    assert set(DailyUsageRollup.objects.values_list("pk", "user", "day")) & before == {
+        row for row in before if (row[1], 100, row[2]) not in keys
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(connection.vendor == "sqlite", reason="SQLite runs a single writing transaction at a time")
+def test_concurrent_writes_of_a_key_are_all_counted():
+    user = carbon_usage_recipes.base_user.make()
+    at = datetime(2021, 10, 10, tzinfo=timezone.utc)
+    writers = 8
+    barrier = threading.Barrier(writers)
+    errors = []
+
+    def write(index):
+        try:
+            with transaction.atomic():
+                usage = carbon_usage_recipes.base_usage.make(
+                    user=user, usage_type_id=100, amount=1, usage_at=at + timedelta(minutes=index)
+                )
+                # Every transaction has stored its usage before any of them refreshes the key
+                barrier.wait(timeout=10)
+                refresh_rollups([rollup_key(usage)])
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert rollups() == [(user.id, 100, date(2021, 10, 10), writers, writers, writers * 1.5)]
@@ -0,0 +1,80 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework import status
+from . import mommy_recipes as carbon_usage_recipes
+from ..authentication import UserStateRefreshToken
+from ..models import Usage
+
+pytestmark = pytest.mark.django_db(databases=["default", "replica"])
+
+
+@pytest.fixture
+def replica(settings):
+    settings.DATABASE_REPLICAS = ["replica"]
+    # Users of previous tests that wrote something may share the primary keys of this test
+    caches[settings.REPLICA_PIN_CACHE].clear()
+    # The replica lags behind: it only holds what the test writes to it directly
+    return carbon_usage_recipes.base_usage.prepare(usage_type_id=100, amount=42)
+
+
+def test_safe_requests_read_from_replica(api_client, replica):
+    carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=1)
+    replica.user.save(using="replica")
+    replica.save(using="replica")
+
+    response = api_client.get(reverse('carbon-usage:usage-list'))
+    assert response.status_code == status.HTTP_200_OK
+    assert [row["amount"] for row in response.data["results"]] == [42]
+
+    response = api_client.get(f"{reverse('carbon-usage:usage-emissions')}?min_amount=0")
+    assert response.data["results"][0]["amount"] == 42
+
+
+def test_writes_go_to_primary_and_pin_reads(api_client, user, replica, settings):
+    url = reverse('carbon-usage:usage-list')
+    response = api_client.post(url, data={"user": user.id, "usage_type": 100, "usage_at": "2021-10-10 10:10", "amount": 3})
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert Usage.objects.using("default").filter(amount=3).exists()
+    assert not Usage.objects.using("replica").exists()
+
+    # The user who wrote reads their own write from the primary
+    response = api_client.get(url)
+    assert [row["amount"] for row in response.data["results"]] == [3]
+
+
+def test_pin_expires(api_client, user, replica, settings):
+    settings.REPLICA_STICKY_SECONDS = 0
+    url = reverse('carbon-usage:usage-list')
+    api_client.post(url, data={"user": user.id, "usage_type": 100, "usage_at": "2021-10-10 10:10", "amount": 3})
+
+    response = api_client.get(url)
+    assert response.data["results"] == []
+
+
+def test_reads_outside_requests_use_primary(replica):
+    carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=1)
+
+    assert list(Usage.objects.values_list("amount", flat=True)) == [1]
+
+
+def test_without_replicas_reads_use_primary(api_client):
+    carbon_usage_recipes.base_usage.make(usage_type_id=100, amount=1)
+
+    response = api_client.get(reverse('carbon-usage:usage-list'))
+    assert [row["amount"] for row in response.data["results"]] == [1]
+
+
+def test_asgi_requests_read_from_replica(user, replica):
+    replica.user.save(using="replica")
+    replica.save(using="replica")
+    authorization = f"Bearer {UserStateRefreshToken.for_user(user).access_token}"
+
+    # Under ASGI the middleware await the view, the REST framework view itself runs in a thread
+    response = async_to_sync(AsyncClient().get)(reverse('carbon-usage:usage-list'), authorization=authorization)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [row["amount"] for row in response.json()["results"]] == [42]
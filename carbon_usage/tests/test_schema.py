@@ -0,0 +1,117 @@
+import gzip
+import json
+import subprocess
+import sys
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from ..schema import clear_schema_documents, code_version
+
+pytestmark = pytest.mark.django_db
+
+JSON_URL = reverse('schema-json', kwargs={"format": ".json"})
+
+
+@pytest.fixture(autouse=True)
+def schema_root(settings, tmp_path):
+    settings.OPENAPI_SCHEMA_ROOT = tmp_path
+    settings.APP_VERSION = "1.0"
+    # Every test starts without the documents loaded by a previous one
+    clear_schema_documents()
+    yield tmp_path
+    clear_schema_documents()
+
+
+def test_schema_is_built_once_and_revalidated(client, schema_root):
+    response = client.get(JSON_URL)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "application/json"
+    assert response["Cache-Control"] == "public, no-cache"
+    assert response["Vary"] == "Accept-Encoding"
+    assert reverse('carbon-usage:usage-list') in json.loads(response.content)["paths"]
+    assert (schema_root / "1.0" / "swagger.json").read_bytes() == response.content
+
+    response = client.get(JSON_URL, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+
+def test_schema_is_gzipped_with_its_own_etag(client):
+    plain = client.get(JSON_URL)
+
+    response = client.get(JSON_URL, HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+
+    assert response["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.content) == plain.content
+    assert response["ETag"] == plain["ETag"][:-1] + '-gzip"'
+    # The ETag of the plain document does not validate the gzipped one
+    assert client.get(JSON_URL, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=plain["ETag"]).status_code == 200
+    assert client.get(JSON_URL, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"]).status_code == 304
+
+
+def test_schema_is_served_as_yaml(client):
+    response = client.get(reverse('schema-json', kwargs={"format": ".yaml"}))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "application/yaml"
+    assert response.content.startswith(b"swagger: '2.0'")
+
+
+def test_schema_is_read_from_the_documents_of_the_code_version(settings, client, schema_root):
+    for version in ("1.0", "2.0"):
+        (schema_root / version).mkdir()
+        for name in ("swagger.json", "swagger.yaml"):
+            content = f'{{"version": "{version}"}}'.encode()
+            (schema_root / version / name).write_bytes(content)
+            (schema_root / version / f"{name}.gz").write_bytes(gzip.compress(content))
+
+    assert json.loads(client.get(JSON_URL).content) == {"version": "1.0"}
+
+    settings.APP_VERSION = "2.0"
+    clear_schema_documents()
+    assert json.loads(client.get(JSON_URL).content) == {"version": "2.0"}
+
+
+@pytest.mark.parametrize("url_name", ["schema-swagger-ui", "schema-redoc"])
+def test_documentation_pages_load_the_prebuilt_schema(client, schema_root, url_name):
+    response = client.get(reverse(url_name))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert JSON_URL in response.content.decode()
+    # Rendering the page does not generate the schema
+    assert not any(schema_root.iterdir())
+
+
+def test_build_openapi_schema_command_replaces_other_versions(schema_root):
+    (schema_root / "0.9").mkdir()
+    out = StringIO()
+
+    call_command("build_openapi_schema", stdout=out)
+
+    assert out.getvalue() == f"Built the OpenAPI schema of version 1.0 in {schema_root / '1.0'}.\n"
+    assert sorted(path.name for path in schema_root.iterdir()) == ["1.0"]
+    assert sorted(path.name for path in (schema_root / "1.0").iterdir()) == [
+        "swagger.json", "swagger.json.gz", "swagger.yaml", "swagger.yaml.gz",
+    ]
+
+
+def test_code_version_defaults_to_a_digest_of_the_sources(settings):
+    settings.APP_VERSION = None
+
+    assert len(code_version()) == 16
+    assert code_version() == code_version()
+
+
+def test_urls_do_not_import_the_schema_generator():
+    code = (
+        "import sys, django; django.setup(); import PlanetlyProject.urls; "
+        "print(sorted(module for module in ('drf_yasg.views', 'drf_yasg.generators') if module in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert result.stdout == "[]\n"
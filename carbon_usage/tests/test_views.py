@@ -32,7 +32,7 @@ def test_usage_is_valid(api_client):
 def test_usage_lists_objects(api_client, django_assert_num_queries):
     usages = carbon_usage_recipes.base_usage.make(_quantity=5)
     url = reverse('carbon-usage:usage-list')
-    with django_assert_num_queries(3):
+    with django_assert_num_queries(2):
         response = api_client.get(url)
 
     assert response.status_code == status.HTTP_200_OK
@@ -1,10 +1,15 @@
+from django.urls import path
 from rest_framework import routers
 
-from carbon_usage.views import UsageViewSet, UsageTypesViewSet
+from carbon_usage.views import ReportViewSet, UsageViewSet, UsageTypesViewSet, metrics
 
 app_name = "carbon-usage"
 
 router = routers.SimpleRouter()
 router.register(r'usage', UsageViewSet, basename="usage")
 router.register(r'usage_types', UsageTypesViewSet, basename="usage_types")
-urlpatterns = router.urls
+router.register(r'reports', ReportViewSet, basename="reports")
+urlpatterns = router.urls + [
+    path('metrics/', metrics, name='metrics'),
+]
+
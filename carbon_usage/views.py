@@ -1,22 +1,251 @@
-from rest_framework import viewsets
+import re
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+from django_filters.utils import translate_validation
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
+from carbon_usage.aggregations import aggregate_filtered_emissions
+from carbon_usage.bulk_edits import bulk_delete_usages, bulk_update_usages
+from carbon_usage.archive import archived_usage
+from carbon_usage.calculator import calculate_emissions
+from carbon_usage.cache import usage_types_cache
+from carbon_usage.conditional import ConditionalGetMixin, mark_deleted
+from carbon_usage.emissions import add_factor_period, schedule_emissions_recompute, set_current_factor
+from carbon_usage.exports import CONTENT_TYPES, EXPORT_FORMATS
 from carbon_usage.filters import UsageFilter, UsageTypesFilter
-from carbon_usage.models import Usage, UsageTypes
-from carbon_usage.serializers import UsageSerializer, UsageTypesSerializer
+from carbon_usage.histograms import usage_histogram
+from carbon_usage.ingestion import UsageConflict, bulk_create_usages
+from carbon_usage.jobs import results_root
+from carbon_usage.listing import ValuesListMixin
+from carbon_usage.metrics import REGISTRY
+from carbon_usage.models import Job, Usage, UsageTypes
+from carbon_usage.reports import REPORT_KINDS, RESULT_CONTENT_TYPES, usage_export_rows
+from carbon_usage.rollups import refresh_rollups, rollup_key
+from carbon_usage.schema import FORMATS, INFO, schema_documents
+from carbon_usage.serializers import (
+    BulkDeleteSerializer, BulkUpdateSerializer, EmissionsQuerySerializer, ExportQuerySerializer,
+    HistogramQuerySerializer, ReportSerializer, UsageSerializer, UsageTypeFactorSerializer, UsageTypesSerializer,
+    WhatIfSerializer
+)
 
 
-class UsageViewSet(viewsets.ModelViewSet):
+class UsageViewSet(ValuesListMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing Usage instances.
     """
     serializer_class = UsageSerializer
-    queryset = Usage.objects.select_related("usage_type", "user").all()
+    queryset = Usage.objects.all()
     permission_classes = (IsAuthenticated,)
     filterset_class = UsageFilter
+    ordering_fields = ('id', 'user', 'usage_type', 'usage_at', 'amount', 'emissions')
+    ordering = ('id',)
+    keyset_ordering = 'usage_at'
+
+    def get_filterset(self):
+        """
+        Returns the validated UsageFilter of the request, for actions that need its cleaned data.
+        """
+        filterset = self.filterset_class(self.request.query_params, queryset=self.get_queryset(), request=self.request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        return filterset
+
+    def create(self, request, *args, **kwargs):
+        """
+        Creates a Usage, or returns the stored one of the same user, usage type and usage_at when a
+        client retries with the same amount.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            self.perform_create(serializer)
+        except UsageConflict as conflict:
+            if conflict.existing.amount != serializer.validated_data['amount']:
+                raise
+            return Response(self.get_serializer(conflict.existing).data, status=status.HTTP_200_OK)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+    def save_unique(self, serializer, save):
+        """
+        Saves through ``save`` and the rollups of the changed keys, turning a violation of the
+        natural key into a UsageConflict with the stored usage, or with the archived one.
+        """
+        instance, data = serializer.instance, serializer.validated_data
+        stored = (instance.user_id, instance.usage_type_id, instance.usage_at) if instance is not None else None
+        usage_key = (
+            data['user'].pk if 'user' in data else stored[0],
+            data['usage_type'].pk if 'usage_type' in data else stored[1],
+            data.get('usage_at', stored and stored[2]),
+        )
+        if usage_key != stored:
+            # The unique constraint only covers the usage table, not the usages of archived months
+            archived = archived_usage(*usage_key)
+            if archived is not None:
+                raise UsageConflict(archived)
+
+        previous_key = rollup_key(instance) if instance is not None else None
+        try:
+            with transaction.atomic():
+                save(serializer)
+                refresh_rollups(key for key in (previous_key, rollup_key(serializer.instance)) if key is not None)
+        except IntegrityError:
+            # A failed create leaves no instance on the serializer
+            instance = serializer.instance or Usage(**serializer.validated_data)
+            existing = Usage.objects.filter(
+                user=instance.user_id, usage_type=instance.usage_type_id, usage_at=instance.usage_at
+            ).exclude(pk=instance.pk).first()
+            if existing is None:
+                raise
+            raise UsageConflict(existing)
+
+    def perform_create(self, serializer):
+        self.save_unique(serializer, super().perform_create)
+
+    def perform_update(self, serializer):
+        self.save_unique(serializer, super().perform_update)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        key = rollup_key(instance)
+        super().perform_destroy(instance)
+        refresh_rollups([key])
+        mark_deleted(Usage)
+
+    @action(detail=False, methods=['get'])
+    def emissions(self, request):
+        """
+        Aggregates the emissions of the filtered Usage instances inside the database.
+        """
+        query_serializer = EmissionsQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        group_by = query_serializer.validated_data.get('group_by')
+
+        filterset = self.get_filterset()
+        return Response({
+            'group_by': group_by,
+            'results': aggregate_filtered_emissions(filterset.qs, filterset.form.cleaned_data, group_by=group_by),
+        })
+
+    @action(detail=False, methods=['get'])
+    def histogram(self, request):
+        """
+        Buckets the counts, amounts and emissions of the filtered Usage instances of every usage type
+        by the wall clock time of a timezone, filling the buckets without usages.
+        """
+        query_serializer = HistogramQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        tz = query_serializer.validated_data['timezone']
+
+        filterset = self.get_filterset()
+        return Response({
+            'requested_interval': query_serializer.validated_data['interval'],
+            'timezone': tz.key,
+            **usage_histogram(
+                filterset.qs, filterset.form.cleaned_data, query_serializer.validated_data['interval'], tz,
+                query_serializer.validated_data.get('max_buckets', settings.USAGE_HISTOGRAM_MAX_BUCKETS),
+            ),
+        })
+
+    @action(detail=False, methods=['post'], url_path='what-if')
+    def what_if(self, request):
+        """
+        Computes the emissions of the filtered Usage instances as if some usage types had other factors.
+        """
+        what_if_serializer = WhatIfSerializer(data=request.data)
+        what_if_serializer.is_valid(raise_exception=True)
+        group_by = what_if_serializer.validated_data.get('group_by')
 
+        filterset = self.get_filterset()
+        return Response({
+            'group_by': group_by,
+            'factors': what_if_serializer.validated_data['factors'],
+            'results': calculate_emissions(
+                filterset.qs, group_by=group_by, factors=what_if_serializer.validated_data['factors']
+            ),
+        })
 
-class UsageTypesViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Streams every filtered Usage instance with its emissions as CSV or newline delimited JSON,
+        archived ones included.
+        """
+        query_serializer = ExportQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        export_format = query_serializer.validated_data['export_format']
+
+        rows = usage_export_rows(self.filter_queryset(self.get_queryset()), self.get_filterset().form.cleaned_data)
+        response = StreamingHttpResponse(EXPORT_FORMATS[export_format](rows), content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = f'attachment; filename="usage.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates many Usage instances in one request, reporting the rows that could not be created and
+        the number of rows that were already stored.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response(
+                {'detail': 'Expected a list of usages.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(rows) > settings.USAGE_BULK_MAX_ROWS:
+            return Response(
+                {'detail': f'A bulk request accepts at most {settings.USAGE_BULK_MAX_ROWS} usages.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        created, duplicates, errors = bulk_create_usages(rows)
+        return Response(
+            {'created': len(created), 'duplicates': duplicates, 'errors': errors},
+            status=status.HTTP_400_BAD_REQUEST if errors and not created else status.HTTP_201_CREATED
+        )
+
+    def get_bulk_edit_queryset(self):
+        """
+        Returns the usages matched by the filters of a bulk update or delete, which require one.
+        """
+        filterset = self.get_filterset()
+        if all(value in (None, '') for value in filterset.form.cleaned_data.values()):
+            raise ValidationError({'detail': 'Bulk updates and deletes expect at least one filter.'})
+        return filterset.qs
+
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        """
+        Scales the amount and/or changes the usage type of every filtered Usage instance, along with
+        their emissions, or reports what would change with ``dry_run``.
+        """
+        serializer = BulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(bulk_update_usages(self.get_bulk_edit_queryset(), **serializer.validated_data))
+
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """
+        Deletes every filtered Usage instance, or reports what would be deleted with ``dry_run``.
+        """
+        serializer = BulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(bulk_delete_usages(self.get_bulk_edit_queryset(), **serializer.validated_data))
+
+
+class UsageTypesViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing UsageTypes instances.
     """
@@ -24,3 +253,142 @@ class UsageTypesViewSet(viewsets.ModelViewSet):
     queryset = UsageTypes.objects.all()
     permission_classes = (IsAuthenticated,)
     filterset_class = UsageTypesFilter
+
+    def invalidate_cache(self):
+        # Other processes may reload the table before the transaction commits, so bump it again afterwards
+        usage_types_cache.invalidate()
+        transaction.on_commit(usage_types_cache.invalidate)
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        set_current_factor(serializer.instance)
+        self.invalidate_cache()
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        previous_factor = serializer.instance.factor
+        super().perform_update(serializer)
+        self.invalidate_cache()
+        if serializer.instance.factor != previous_factor:
+            # A new factor corrects the period effective now, the other periods keep theirs
+            period = set_current_factor(serializer.instance)
+            schedule_emissions_recompute(serializer.instance.pk, period.valid_from, period.valid_to)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self.invalidate_cache()
+
+    @action(detail=True, methods=['get', 'post'], serializer_class=UsageTypeFactorSerializer, pagination_class=None)
+    def factors(self, request, pk=None):
+        """
+        Lists the factor periods of a usage type, or makes a factor effective from a given usage_at on.
+        """
+        usage_type = self.get_object()
+        if request.method == 'GET':
+            periods = usage_type.factors.order_by(F('valid_from').asc(nulls_first=True))
+            return Response(self.get_serializer(periods, many=True).data)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            period = add_factor_period(usage_type, **serializer.validated_data)
+            self.invalidate_cache()
+            schedule_emissions_recompute(usage_type.pk, period.valid_from, period.valid_to)
+        return Response(self.get_serializer(period).data, status=status.HTTP_201_CREATED)
+
+
+class ReportViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
+                    viewsets.GenericViewSet):
+    """
+    A viewset for submitting the reports computed by the job workers, polling their status and
+    downloading their results. Users only see their own reports.
+    """
+    serializer_class = ReportSerializer
+    permission_classes = (IsAuthenticated,)
+    ordering_fields = ('id', 'created_at', 'finished_at')
+    ordering = ('-id',)
+
+    def get_queryset(self):
+        # The schema is generated without a request, see carbon_usage.schema
+        if getattr(self, 'swagger_fake_view', False):
+            return Job.objects.none()
+        # The authenticated user is a TokenUser built from the access token, only its id is known
+        return Job.objects.filter(user_id=self.request.user.pk, kind__in=REPORT_KINDS)
+
+    def create(self, request, *args, **kwargs):
+        """
+        Queues a report and returns its job, to be polled at the ``Location`` of the response.
+        """
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+    def perform_create(self, serializer):
+        serializer.save(user_id=self.request.user.pk)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Returns the result file of a finished report.
+        """
+        job = self.get_object()
+        if job.status != Job.SUCCEEDED:
+            return Response({'detail': f'The report is {job.status}.'}, status=status.HTTP_409_CONFLICT)
+        path = results_root() / job.result_path
+        if not path.is_file():
+            raise Http404
+        extension = path.suffix.lstrip('.')
+        return FileResponse(
+            path.open('rb'), as_attachment=True, filename=f'usage-{job.kind}.{extension}',
+            content_type=RESULT_CONTENT_TYPES[extension],
+        )
+
+
+def metrics(request):
+    """
+    Exposes the metrics of this process in the Prometheus text format to scrapers sending the
+    ``METRICS_TOKEN`` as a bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    if not token or not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        raise Http404
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_safe
+def schema_document(request, format):
+    """
+    Serves the prebuilt OpenAPI schema, gzipped to clients accepting it, with a strong ETag per
+    encoding so that clients revalidate it for free until the code version changes.
+    """
+    document = schema_documents()[format]
+    gzipped = re.search(r'\bgzip\b', request.headers.get('Accept-Encoding', '')) is not None
+    etag = document.gzip_etag if gzipped else document.etag
+
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(document.gzipped if gzipped else document.content, content_type=FORMATS[format])
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@require_safe
+def schema_ui(request, ui):
+    """
+    Renders the Swagger UI or ReDoc page, which loads the prebuilt schema from its SPEC_URL.
+    """
+    from drf_yasg.renderers import ReDocRenderer, SwaggerUIRenderer
+
+    renderer = SwaggerUIRenderer() if ui == 'swagger' else ReDocRenderer()
+    context = {'request': request}
+    renderer.set_context(context)
+    context.update(title=INFO['title'], version=INFO['default_version'])
+    return HttpResponse(render_to_string(renderer.template, context, request), content_type='text/html; charset=utf-8')